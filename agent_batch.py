@@ -0,0 +1,142 @@
+import argparse
+import math
+import time
+
+import numpy as np
+
+from headless import HeadlessGame, ACTIONS, WIN_DISTANCE
+
+# Action index -> (dx, dy), indices follow the order of headless.ACTIONS
+ACTION_NAMES = list(ACTIONS)
+ACTION_VECTORS = np.array([ACTIONS[name] for name in ACTION_NAMES], dtype=np.float64)
+
+
+class AgentBatch:
+    """Many characters in one maze, stepped together with array operations.
+
+    Positions, velocities and bounding boxes are (N, 2) arrays. Collision uses the same test
+    as CollisionGrid.check_collision, with each axis moved and checked on its own like Game.tick.
+    """
+    def __init__(self, collision_grid, character_box, start_pos, objective_pos, count):
+        """
+        :param collision_grid: CollisionGrid of the map
+        :param character_box: local SimpleBoundingBox of the character
+        """
+        self.occupancy = collision_grid.occupancy
+        self.rows, self.cols = self.occupancy.shape
+        self.boxes = collision_grid.boxes
+        self.count = count
+        self.start_pos = np.array(start_pos[:2], dtype=np.float64)
+        self.objective_pos = np.array(objective_pos[:2], dtype=np.float64)
+
+        # Box center relative to the position, and box size
+        self.box_offset = np.array([character_box.x, character_box.y], dtype=np.float64)
+        self.box_size = np.array([character_box.width, character_box.height], dtype=np.float64)
+        # Fixed candidate window around every agent, large enough for any window CollisionGrid looks at
+        reach = collision_grid.reach
+        window_cols = math.ceil(self.box_size[0] + 2 * reach) + 2
+        window_rows = math.ceil(self.box_size[1] + 2 * reach) + 2
+        rows, cols = np.mgrid[0:window_rows, 0:window_cols]
+        self.window_rows = rows.ravel()
+        self.window_cols = cols.ravel()
+        self.reach = reach
+        # Occupancy with an empty border as wide as the window, so windows at the edges need no bounds checks
+        self.border = max(window_rows, window_cols)
+        self.padded_occupancy = np.pad(self.occupancy, self.border)
+
+        self.positions = np.empty((count, 2), dtype=np.float64)
+        self.velocities = np.zeros((count, 2), dtype=np.float64)
+        self.won = np.zeros(count, dtype=bool)
+        self.steps = np.zeros(count, dtype=np.int64)
+        self.reset()
+
+    @classmethod
+    def from_game(cls, game, count):
+        """Agents starting where the character of a HeadlessGame starts"""
+        return cls(game.collision_grid, game.character_box, game.start_pos, game.objective_pos, count)
+
+    @classmethod
+    def from_file(cls, file, count):
+        return cls.from_game(HeadlessGame(file), count)
+
+    def reset(self, mask=None):
+        """Move agents (all, or where mask is True) back to the start"""
+        mask = slice(None) if mask is None else mask
+        self.positions[mask] = self.start_pos
+        self.velocities[mask] = 0.0
+        self.won[mask] = False
+        self.steps[mask] = 0
+
+    @property
+    def box_centers(self):
+        return self.positions + self.box_offset
+
+    def check_collision(self, dx, dy, agents=None):
+        """Collision flags for moving agents by (dx, dy)
+
+        :param agents: indices of the agents to test, all by default. dx, dy are per tested agent
+        """
+        centers = self.box_centers if agents is None else self.positions[agents] + self.box_offset
+        x = centers[:, 0] + dx
+        y = centers[:, 1] + dy
+        width, height = self.box_size
+        # Agents far outside the map are clamped into the empty border
+        first_col = np.clip(np.floor(x - self.reach), -self.border, self.cols).astype(np.int64)
+        first_row = np.clip(np.floor(y - self.reach), -self.border, self.rows).astype(np.int64)
+        rows = first_row[:, np.newaxis] + self.window_rows
+        cols = first_col[:, np.newaxis] + self.window_cols
+        codes = self.padded_occupancy[rows + self.border, cols + self.border]
+        # Only solid candidate cells are tested
+        agent, cell = np.nonzero(codes)
+        rows, cols = rows[agent, cell], cols[agent, cell]
+        boxes = self.boxes[codes[agent, cell]]
+        x2 = cols + boxes[:, 0]
+        y2 = rows + boxes[:, 1]
+        x, y = x[agent], y[agent]
+        hits = (x < x2 + boxes[:, 2]) & (x + width > x2) & (y < y2 + boxes[:, 3]) & (y + height > y2)
+        blocked = np.zeros(len(first_col), dtype=bool)
+        blocked[agent[hits]] = True
+        return blocked
+
+    def step(self, velocities=None):
+        """Move every agent by its velocity, x axis first, then y.
+
+        :param velocities: (N, 2) moves for this step, defaults to self.velocities
+        :return: (N,) flags of agents within reach of the objective, like Game.check_win
+        """
+        velocities = self.velocities if velocities is None else np.asarray(velocities, dtype=np.float64)
+        for axis in (0, 1):
+            delta = velocities[:, axis]
+            moving = np.flatnonzero(delta)
+            if not len(moving):
+                continue
+            offset = np.zeros((len(moving), 2))
+            offset[:, axis] = delta[moving]
+            free = moving[~self.check_collision(offset[:, 0], offset[:, 1], moving)]
+            self.positions[free, axis] += delta[free]
+        self.steps[~self.won] += 1
+        reached = np.hypot(*(self.positions - self.objective_pos).T) < WIN_DISTANCE
+        self.won |= reached
+        return reached
+
+    def step_actions(self, actions):
+        """Step with one action index (see ACTION_NAMES) per agent"""
+        return self.step(ACTION_VECTORS[np.asarray(actions)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Random walks of many agents in one maze")
+    parser.add_argument("map", nargs="?", default="./stages/stage1/mapp.txt", help="text map or compiled level")
+    parser.add_argument("--agents", type=int, default=4096)
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    batch = AgentBatch.from_file(args.map, args.agents)
+    rng = np.random.default_rng(args.seed)
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        batch.step_actions(rng.integers(1, len(ACTION_NAMES), args.agents))
+    elapsed = time.perf_counter() - start
+    print(f"{args.agents} agents x {args.steps} steps in {elapsed:.2f}s, "
+          f"{args.agents * args.steps / elapsed:.0f} agent steps/s, {np.count_nonzero(batch.won)} reached the objective")
@@ -0,0 +1,184 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from headless import HeadlessGame, random_actions, ACTION_UP, ACTION_DOWN, ACTION_LEFT, ACTION_RIGHT, STEP
+
+RESULT_FIELDS = ["level", "agent", "seed", "solved", "steps", "seconds", "steps_per_second", "error"]
+RESULTS_FOLDER = os.path.join(".", "results")
+
+# Games loaded by this worker process, a level is parsed once and reset for every run
+LOADED_GAMES = {}
+
+# Cell offset (row, col) -> action moving into that neighbour
+NEIGHBOURS = {
+    (1, 0): ACTION_UP,
+    (-1, 0): ACTION_DOWN,
+    (0, -1): ACTION_LEFT,
+    (0, 1): ACTION_RIGHT,
+}
+
+
+def shortest_path_actions(game, seed=None):
+    """Bot walking the shortest path of free cells from the start to the objective"""
+    occupancy = game.collision_grid.occupancy
+    start = (int(game.start_pos[1]), int(game.start_pos[0]))
+    goal = (int(game.objective_pos[1]), int(game.objective_pos[0]))
+    previous = {start: None}
+    queue = deque([start])
+    while queue and goal not in previous:
+        row, col = queue.popleft()
+        for dr, dc in NEIGHBOURS:
+            cell = (row + dr, col + dc)
+            if cell not in previous and 0 <= cell[0] < game.rows and 0 <= cell[1] < game.cols \
+                    and occupancy[cell] == 0:
+                previous[cell] = (row, col)
+                queue.append(cell)
+    if goal not in previous:
+        return
+    path = [goal]
+    while previous[path[-1]] is not None:
+        path.append(previous[path[-1]])
+    path.reverse()
+    for (r0, c0), (r1, c1) in zip(path, path[1:]):
+        action = NEIGHBOURS[(r1 - r0, c1 - c0)]
+        # One cell is several half-cell steps
+        for _ in range(int(round(1 / STEP))):
+            yield action
+
+
+def scripted_actions(path):
+    def agent(game, seed=None):
+        with open(path, 'r') as f:
+            yield from f.read().split()
+    return agent
+
+
+# Agent name -> function(game, seed) returning an iterable of actions
+AGENTS = {
+    "random": lambda game, seed=None: random_actions(seed),
+    "bot": shortest_path_actions,
+}
+
+
+def get_game(level):
+    if level not in LOADED_GAMES:
+        LOADED_GAMES[level] = HeadlessGame(level)
+    game = LOADED_GAMES[level]
+    game.reset()
+    return game
+
+
+def run_simulation(level, agent, seed, max_steps, script=None):
+    """Play one level with one agent in this process and return a result row"""
+    result = {"level": level, "agent": agent, "seed": seed, "solved": False, "steps": 0,
+              "seconds": 0.0, "steps_per_second": 0.0, "error": ""}
+    start = time.perf_counter()
+    try:
+        game = get_game(level)
+        actions = scripted_actions(script) if agent == "script" else AGENTS[agent]
+        game.run(actions(game, seed), max_steps)
+        result["solved"] = game.won
+        result["steps"] = game.steps
+    except (OSError, ValueError, KeyError) as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - start
+    result["seconds"] = round(seconds, 6)
+    result["steps_per_second"] = round(result["steps"] / seconds, 1) if seconds else 0.0
+    return result
+
+
+class ResultWriter:
+    """Writes result rows as they arrive, CSV or JSON lines depending on the file extension"""
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, 'w', newline='')
+        self.csv = None
+        if not path.endswith(".jsonl"):
+            self.csv = csv.DictWriter(self.file, fieldnames=RESULT_FIELDS)
+            self.csv.writeheader()
+
+    def write(self, result):
+        if self.csv:
+            self.csv.writerow(result)
+        else:
+            self.file.write(json.dumps(result) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def run_batch(levels, agents, seeds, max_steps, output, workers=None, script=None):
+    """Fan every level x agent x seed simulation out over a process pool
+
+    :return: summary dict with aggregate throughput
+    """
+    if "script" in agents and not script:
+        # Would fail in every worker, before any result is written
+        raise ValueError("the script agent needs a script file")
+    workers = workers or os.cpu_count()
+    tasks = [(level, agent, seed) for level in levels for agent in agents for seed in seeds]
+    writer = ResultWriter(output)
+    total_steps = solved = 0
+    simulation_seconds = 0.0
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_simulation, level, agent, seed, max_steps, script)
+                       for level, agent, seed in tasks]
+            for future in as_completed(futures):
+                result = future.result()
+                writer.write(result)
+                total_steps += result["steps"]
+                solved += result["solved"]
+                simulation_seconds += result["seconds"]
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - start
+    steps_per_second = total_steps / elapsed if elapsed else 0.0
+    return {
+        "simulations": len(tasks),
+        "solved": solved,
+        "workers": workers,
+        "steps": total_steps,
+        "seconds": elapsed,
+        "steps_per_second": steps_per_second,
+        "steps_per_second_per_core": steps_per_second / workers,
+        # Busy time of the workers, shows how much of the pool was spent simulating
+        "pool_utilization": simulation_seconds / (elapsed * workers) if elapsed else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate agents on many levels in parallel")
+    parser.add_argument("--levels", default=os.path.join(".", "stages", "*", "*.txt"), help="glob of levels")
+    parser.add_argument("--agents", nargs="+", default=["bot", "random"],
+                        help=f"agents to run: {', '.join(AGENTS)} or script")
+    parser.add_argument("--script", help="file with whitespace separated actions for the script agent")
+    parser.add_argument("--seeds", type=int, default=4, help="runs per level and agent")
+    parser.add_argument("--max-steps", type=int, default=100000)
+    parser.add_argument("--workers", type=int, default=None, help="processes, defaults to the CPU count")
+    parser.add_argument("--out", default=os.path.join(RESULTS_FOLDER, "results.csv"),
+                        help=".csv or .jsonl results file")
+    args = parser.parse_args()
+    unknown = [agent for agent in args.agents if agent not in AGENTS and agent != "script"]
+    if unknown:
+        parser.error(f"unknown agents: {', '.join(unknown)}")
+    if "script" in args.agents and not args.script:
+        parser.error("the script agent needs --script")
+    if args.script and not os.path.isfile(args.script):
+        parser.error(f"script {args.script} doesn't exist")
+
+    levels = sorted(glob.glob(args.levels))
+    summary = run_batch(levels, args.agents, range(args.seeds), args.max_steps, args.out, args.workers, args.script)
+    print(f"{summary['simulations']} simulations, {summary['solved']} solved, written to {args.out}")
+    print(f"{summary['steps']} steps in {summary['seconds']:.2f}s on {summary['workers']} workers: "
+          f"{summary['steps_per_second']:.0f} steps/s, {summary['steps_per_second_per_core']:.0f} steps/s per core, "
+          f"{summary['pool_utilization']:.0%} pool utilization")
@@ -0,0 +1,361 @@
+import argparse
+import json
+import math
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from maze_generator import generate_maze, write_maze
+
+DEFAULT_SIZES = [16, 64, 256, 1024]
+# Cells the character walks per rendered frame during the render benchmark
+FLYTHROUGH_SPEED = 0.1
+# Largest turn of the view away from the walking direction, radians
+FLYTHROUGH_YAW = math.pi / 4
+# Bytes a steady-state frame may allocate on top of what was live before it, measured at about 4.1 KB
+FRAME_ALLOCATION_BUDGET = 4608
+# Bytes a steady-state frame may leave behind for the garbage collector
+FRAME_GARBAGE_BUDGET = 64
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def make_maze_file(folder, size, seed=0):
+    """Write a generated maze of roughly size x size map characters"""
+    path = os.path.join(folder, f"maze_{size}.txt")
+    cells = max((size - 1) // 2, 1)
+    write_maze(path, generate_maze(cells, cells, seed=seed))
+    return path
+
+
+def bench_map_load(sizes):
+    """CPU side of Map loading: text parsing, tile records and collision grid.
+
+    GL uploads are not included; they need a live context.
+    """
+    from loading_data import load_obj_file, load_prototype, BASE_OBJECTS_FOLDER
+    from maps import load_map_array, build_tiles, build_collision_grid, TILE_PROTOTYPES
+
+    # Cost of parsing one tile mesh, which the old loader paid for every cell
+    _, parse_time = timed(load_obj_file, os.path.join(BASE_OBJECTS_FOLDER, "block.obj"))
+    for name in set(TILE_PROTOTYPES.values()):
+        load_prototype(name)
+
+    print(f"{'size':>8} {'cells':>10} {'read':>9} {'tiles':>9} {'collision':>9} {'total':>9} {'per-tile parse':>15}")
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            path = make_maze_file(folder, size)
+            map_array, read_time = timed(load_map_array, path)
+            _, tiles_time = timed(build_tiles, map_array)
+            _, grid_time = timed(build_collision_grid, map_array)
+            total = read_time + tiles_time + grid_time
+            print(f"{size:>8} {map_array.size:>10} {read_time:>8.3f}s {tiles_time:>8.3f}s {grid_time:>8.3f}s "
+                  f"{total:>8.3f}s {parse_time * map_array.size:>14.3f}s")
+
+
+def bench_weld():
+    """Vertex and byte savings of welding and vertex cache ordering per asset"""
+    import glob
+    from loading_data import build_mesh, BASE_OBJECTS_FOLDER
+    from mesh_optimizer import average_cache_miss_ratio
+
+    print(f"{'asset':>12} {'vertices':>15} {'vertex bytes':>17} {'index bytes':>15} {'ACMR':>11} {'saved':>6}")
+    for path in sorted(glob.glob(os.path.join(BASE_OBJECTS_FOLDER, "*.obj"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        before = build_mesh(path, optimize=False)
+        after = build_mesh(path)
+        bytes_before = before.vertex_data.nbytes + before.indices.astype('uint32').nbytes
+        bytes_after = after.vertex_data.nbytes + after.indices.nbytes
+        print(f"{name:>12} {len(before.vertex_data):>7}->{len(after.vertex_data):<7} "
+              f"{before.vertex_data.nbytes:>8}->{after.vertex_data.nbytes:<8} "
+              f"{before.indices.astype('uint32').nbytes:>7}->{after.indices.nbytes:<7} "
+              f"{average_cache_miss_ratio(before.indices):>4.2f}->{average_cache_miss_ratio(after.indices):<4.2f} "
+              f"{1 - bytes_after / bytes_before:>5.0%}")
+
+
+def bench_greedy(sizes):
+    """Triangle count of the static batch with one cube per wall tile versus greedy meshed walls"""
+    import glob
+    from loading_data import PROTOTYPES
+    from maps import load_map_array, build_tiles, build_static_geometry
+
+    def triangles(tiles, meshes=()):
+        count = sum(len(PROTOTYPES[p].geometry.indices) for p in tiles['prototype'])
+        return (count + sum(len(mesh.indices) for mesh, _ in meshes)) // 3
+
+    def report(name, path):
+        map_array = load_map_array(path)
+        tiles = build_tiles(map_array)
+        before = triangles(tiles)
+        (greedy_tiles, meshes), build_time = timed(build_static_geometry, map_array, tiles)
+        after = triangles(greedy_tiles, meshes)
+        print(f"{name:>24} {before:>11} {after:>11} {1 - after / before:>9.1%} {build_time:>8.3f}s")
+
+    print(f"{'map':>24} {'per-tile':>11} {'greedy':>11} {'reduction':>9} {'build':>9}")
+    for path in sorted(glob.glob(os.path.join(".", "stages", "*", "*.txt"))):
+        report(os.path.relpath(path, os.path.join(".", "stages")), path)
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            report(f"maze {size}x{size}", make_maze_file(folder, size))
+
+
+def flythrough(level, frames, speed=FLYTHROUGH_SPEED):
+    """Scripted character moves, one (dx, dy) per frame.
+
+    The character walks the bot's shortest path towards the objective and back again. It turns
+    around two cells early, reaching the objective would end the game.
+    """
+    from batch_runner import shortest_path_actions
+    from headless import HeadlessGame, ACTIONS, STEP
+
+    actions = list(shortest_path_actions(HeadlessGame(level)))
+    actions = actions[:max(len(actions) - 2 * int(round(1 / STEP)), 0)]
+    substeps = max(int(round(STEP / speed)), 1)
+    moves = [(dx / substeps, dy / substeps) for dx, dy in (ACTIONS[a] for a in actions) for _ in range(substeps)]
+    path = moves + [(-dx, -dy) for dx, dy in reversed(moves)]
+    for frame in range(frames):
+        yield path[frame % len(path)] if path else (0.0, 0.0)
+
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    return {
+        "mean": sum(values) / len(values),
+        "median": values[len(values) // 2],
+        "p95": values[min(int(len(values) * 0.95), len(values) - 1)],
+        "max": values[-1],
+    }
+
+
+def bench_render(paths, frames, width, height, output):
+    """Load maps into the offscreen renderer and play back the same flythrough on each.
+
+    Every frame advances the game by exactly one tick, so runs are repeatable.
+    """
+    # Picks the GL platform, has to come before anything importing OpenGL
+    from offscreen import OffscreenRenderer
+    from OpenGL.GL import glGetString, GL_RENDERER, GL_VERSION
+    from renderer import STATS
+    import settings
+
+    renderer = OffscreenRenderer(width, height)
+    game = renderer.controller.game
+    report = {
+        "renderer": glGetString(GL_RENDERER).decode(),
+        "gl_version": glGetString(GL_VERSION).decode(),
+        "width": width,
+        "height": height,
+        "frames": frames,
+        "settings": {name: getattr(settings, name) for name in
+                     ("STATIC_RENDER_MODE", "GREEDY_WALLS", "CHUNK_SIZE", "STREAMING_MAP_BYTES", "TICK_RATE")},
+        "maps": [],
+    }
+    print(f"{'map':>24} {'load':>9} {'cpu ms':>8} {'p95':>7} {'frame ms':>9} {'draws':>6} {'triangles':>10} "
+          f"{'uploads':>8} {'switches':>9}")
+    for name, path in paths:
+        STATS.reset()
+        load_time = renderer.load_map(path)
+        load_stats = STATS.as_dict()
+        yaw = game.camera.rotation.rot_z
+        columns = {"cpu_ms": [], "frame_ms": []}
+        for frame, (dx, dy) in enumerate(flythrough(path, frames)):
+            game.character_controller.move(x=dx, y=dy)
+            game.camera.move(x=-dx, y=-dy)
+            game.camera.rotation.rot_z = yaw + FLYTHROUGH_YAW * math.sin(2 * math.pi * frame / frames)
+            STATS.reset()
+            cpu_time, frame_time = renderer.draw(game.tick_time)
+            columns["cpu_ms"].append(cpu_time * 1000)
+            columns["frame_ms"].append(frame_time * 1000)
+            for key, value in STATS.as_dict().items():
+                columns.setdefault(key, []).append(value)
+        game.camera.rotation.rot_z = yaw
+        game.current_map.destroy()
+        game.reset_game_state()
+
+        summary = {key: summarize(values) for key, values in columns.items()}
+        report["maps"].append({"map": name, "path": path, "load_seconds": load_time, "load": load_stats,
+                               "summary": summary, "per_frame": columns})
+        uploads = sum(columns["buffer_uploads"]) + sum(columns["texture_uploads"])
+        # Program, texture and vertex array binds per frame
+        switches = sum(summary[key]['mean'] for key in ("program_switches", "texture_switches",
+                                                         "vertex_array_switches"))
+        print(f"{name:>24} {load_time:>8.3f}s {summary['cpu_ms']['mean']:>8.2f} {summary['cpu_ms']['p95']:>7.2f} "
+              f"{summary['frame_ms']['mean']:>9.2f} {summary['draw_calls']['mean']:>6.1f} "
+              f"{summary['triangles']['mean']:>10.0f} {uploads:>8} {switches:>9.1f}")
+    renderer.destroy()
+
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f"Report written to {output}")
+
+
+def bench_allocations(path, frames, warmup, width, height, top=10):
+    """Memory allocated by steady-state frames of a map, traced with tracemalloc.
+
+    Nothing moves, so a frame only redraws and shouldn't need fresh buffers. Per frame the peak
+    allocated on top of what was live before it is reported, and the garbage it left. The cyclic
+    garbage collector is paused meanwhile, so the garbage doesn't depend on when it runs.
+    :return True when the mean peak and garbage are within FRAME_ALLOCATION_BUDGET and FRAME_GARBAGE_BUDGET
+    """
+    import gc
+    import tracemalloc
+    from offscreen import OffscreenRenderer
+
+    renderer = OffscreenRenderer(width, height)
+    renderer.load_map(path)
+    game = renderer.controller.game
+    # Fills caches and pools that are kept for later frames
+    for _ in range(warmup):
+        renderer.draw(game.tick_time)
+
+    # Storing Python ints would show up as allocations of their own
+    peaks = np.zeros(frames, dtype=np.int64)
+    garbage = np.zeros(frames, dtype=np.int64)
+    gc.collect()
+    gc.disable()
+    tracemalloc.start(25)
+    baseline = tracemalloc.get_traced_memory()[0]
+    before = tracemalloc.take_snapshot()
+    for frame in range(frames):
+        start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        renderer.draw(game.tick_time)
+        current, peak = tracemalloc.get_traced_memory()
+        peaks[frame] = peak - start
+        garbage[frame] = current - start
+    after = tracemalloc.take_snapshot()
+
+    # Charge the garbage to the innermost line of the game that caused it
+    root = os.path.dirname(os.path.abspath(__file__))
+    sites = {}
+    for stat in after.compare_to(before, 'traceback'):
+        game_frames = [f for f in stat.traceback if f.filename.startswith(root)
+                       and not f.filename.endswith("benchmark.py")]
+        if stat.size_diff > 0 and game_frames:
+            site = f"{os.path.relpath(game_frames[-1].filename, root)}:{game_frames[-1].lineno}"
+            sites[site] = sites.get(site, 0) + stat.size_diff
+    del before, after
+    gc.enable()
+    gc.collect()
+    leaked = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    renderer.destroy()
+
+    peak_summary = summarize(peaks.tolist())
+    print(f"{frames} frames of {os.path.basename(path)}: peak allocated per frame mean {peak_summary['mean']:.0f} B, "
+          f"max {peak_summary['max']} B, garbage per frame {garbage.mean():.0f} B, "
+          f"still allocated after collecting {leaked} B")
+    for site, size in sorted(sites.items(), key=lambda item: -item[1])[:top]:
+        if size >= frames:
+            print(f"  {site:>24} {size / frames:>8.0f} B per frame")
+    within_budget = peak_summary['mean'] <= FRAME_ALLOCATION_BUDGET and garbage.mean() <= FRAME_GARBAGE_BUDGET
+    print(f"{'Within' if within_budget else 'Over'} the budget of {FRAME_ALLOCATION_BUDGET} B allocated, "
+          f"{FRAME_GARBAGE_BUDGET} B garbage")
+    return within_budget
+
+
+def bench_shaders(repeat):
+    """Startup cost of every shader program: compiling and linking the source against linking the
+    binary from the shader cache, in an offscreen context"""
+    from offscreen import CONTEXTS, OFFSCREEN_BACKEND
+    import settings
+    import shaders
+
+    context = CONTEXTS[OFFSCREEN_BACKEND](16, 16)
+    names = sorted(name for name in os.listdir(shaders.BASE_SHADERS_FOLDER)
+                   if os.path.isdir(os.path.join(shaders.BASE_SHADERS_FOLDER, name)))
+    cache_setting = settings.SHADER_BINARY_CACHE
+
+    def load_times(name, use_cache):
+        settings.SHADER_BINARY_CACHE = use_cache
+        times = []
+        for _ in range(repeat):
+            shader = shaders.Shader(name)
+            if use_cache and shader.loaded_from != "binary cache":
+                return None
+            times.append(shader.load_time)
+            del shader
+        return sum(times) / len(times)
+
+    print(f"{'shader':>16} {'source':>10} {'cache':>10} {'speedup':>8}")
+    total_source = total_cache = 0.0
+    for name in names:
+        source_time = load_times(name, False)
+        # Writes the cache entry
+        settings.SHADER_BINARY_CACHE = True
+        shaders.Shader(name)
+        cache_time = load_times(name, True)
+        if cache_time is None:
+            print(f"{name:>16} {source_time * 1000:>8.2f}ms   driver gives no program binaries")
+            continue
+        total_source += source_time
+        total_cache += cache_time
+        print(f"{name:>16} {source_time * 1000:>8.2f}ms {cache_time * 1000:>8.2f}ms {source_time / cache_time:>7.1f}x")
+    if total_cache:
+        print(f"{'total':>16} {total_source * 1000:>8.2f}ms {total_cache * 1000:>8.2f}ms "
+              f"{total_source / total_cache:>7.1f}x")
+    settings.SHADER_BINARY_CACHE = cache_setting
+    context.destroy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maze game benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    map_load = subparsers.add_parser("map-load", help="map load time versus map size")
+    map_load.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+
+    subparsers.add_parser("weld", help="vertex/byte savings of mesh welding per asset")
+
+    greedy = subparsers.add_parser("greedy", help="triangle reduction of greedy meshed walls")
+    greedy.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+
+    render = subparsers.add_parser("render", help="frame time, draw calls and uploads of a scripted flythrough, "
+                                                  "rendered offscreen")
+    render.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="generated maze sizes")
+    render.add_argument("--maps", nargs="+", default=[], help="map files to run as well")
+    render.add_argument("--frames", type=int, default=300)
+    render.add_argument("--size", default="1280x720", help="WIDTHxHEIGHT of the framebuffer")
+    render.add_argument("--out", default="render_benchmark.json", help="JSON report")
+
+    alloc = subparsers.add_parser("alloc", help="memory allocated per steady-state frame, fails over "
+                                                "FRAME_ALLOCATION_BUDGET or FRAME_GARBAGE_BUDGET")
+    alloc.add_argument("--map", default="./stages/stage1/mapp.txt")
+    alloc.add_argument("--frames", type=int, default=200)
+    alloc.add_argument("--warmup", type=int, default=20)
+    alloc.add_argument("--size", default="640x360", help="WIDTHxHEIGHT of the framebuffer")
+
+    shader_load = subparsers.add_parser("shaders", help="shader program startup time, source against binary cache")
+    shader_load.add_argument("--repeat", type=int, default=5)
+
+    args = parser.parse_args()
+    if args.command == "map-load":
+        bench_map_load(args.sizes)
+    elif args.command == "weld":
+        bench_weld()
+    elif args.command == "greedy":
+        bench_greedy(args.sizes)
+    elif args.command == "render":
+        width, height = (int(v) for v in args.size.split("x"))
+        with tempfile.TemporaryDirectory() as folder:
+            paths = [(f"maze {size}x{size}", make_maze_file(folder, size)) for size in args.sizes]
+            paths += [(os.path.basename(path), path) for path in args.maps]
+            bench_render(paths, args.frames, width, height, args.out)
+    elif args.command == "shaders":
+        bench_shaders(args.repeat)
+    elif args.command == "alloc":
+        width, height = (int(v) for v in args.size.split("x"))
+        if not bench_allocations(args.map, args.frames, args.warmup, width, height):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
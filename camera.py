@@ -1,14 +1,36 @@
-from models import Transform, Rotation
-from shaders import Shader
+import math
+
+from models import Transform, ModelRotation, UniformBuffer
 import numpy as np
-from pyrr import matrix44, Vector3, Vector4
+from pyrr import matrix44
+
+# Binding point of the Camera uniform block, layout(binding) of the block in the shaders
+CAMERA_UNIFORM_BINDING = 0
+# std140 Camera block: mat4 ModelViewProjectionMatrix, mat4 ModelMatrix, vec4 EyePosW, vec4 LightPosW,
+# vec4 LightColor, vec4 Ambient. Every member is 16 byte aligned, so the floats are packed without padding
+CAMERA_BLOCK_FLOATS = 48
 
 
 class Camera:
+    """View and lighting of the map, published to the shaders through the Camera uniform block.
+
+    Rotation, render position and screen size changes mark what has to be recomputed, update()
+    redoes only that and uploads the block when something changed.
+    """
     def __init__(self, shader):
+        """:param shader: program the map is drawn with"""
+        # What changed since the last update
+        self.projection_dirty = True
+        self.rotation_dirty = True
+        self.view_dirty = True
+        self.block_dirty = True
+
         self.transform = Transform(0.0, 0.0, -7.0)
+        # Transform at the start of the current simulation tick, the view is interpolated from it
+        self.previous_transform = Transform(self.transform.x, self.transform.y, self.transform.z)
+        self.render_transform = Transform(self.transform.x, self.transform.y, self.transform.z)
         self.target_transform = Transform()
-        self.rotation = Rotation(90 / 180 * np.pi, 0.0, 90 / 180 * np.pi)  # 70 / 360 * np.pi, 0.0, -40 / 360 * np.pi)
+        self.rotation = ModelRotation(self, 90 / 180 * np.pi, 0.0, 90 / 180 * np.pi)  # 70 / 360 * np.pi, 0.0, -40 / 360 * np.pi)
         self.shader = shader
         self.screen_width = 0.0
         self.screen_height = 0.0
@@ -17,12 +39,29 @@ class Camera:
 
         self.clip_range_min = 0.1
         self.clip_range_max = 100.0
-
-        if not self.shader:
-            self.setup_shader()
-
-        self.light_position_w = Vector4([2.0, 2.0, 0.5, 0.0])
-        self.ambient = [1.0, 0.1, 0.1, 1.0]
+        self.mvp = None
+        # Bumped whenever mvp changes, lets culling results be reused while the view stands still
+        self.mvp_version = 0
+        # Matrices are updated in place instead of being allocated
+        self.projection = None
+        self.view = np.identity(4)
+        self.rotation_x = np.identity(4)
+        self.rotation_z = np.identity(4)
+        self.model_matrix = np.identity(4)
+        self.rotation_projection = np.empty((4, 4))
+
+        # Uniform block contents, the views below write straight into it
+        self.block = np.zeros(CAMERA_BLOCK_FLOATS, dtype=np.float32)
+        self.block_mvp = self.block[0:16].reshape(4, 4)
+        self.block_model_matrix = self.block[16:32].reshape(4, 4)
+        self.eye_position = self.block[32:36]
+        self.light_position_w = self.block[36:40]
+        self.light_color = self.block[40:44]
+        self.ambient = self.block[44:48]
+        self.light_position_w[:] = 2.0, 2.0, 0.5, 0.0
+        self.light_color[:] = 1.0, 1.0, 1.0, 1.0
+        self.ambient[:] = 0.6, 0.6, 0.6, 1.0
+        self.uniform_buffer = UniformBuffer(self.block.nbytes, CAMERA_UNIFORM_BINDING)
 
     @property
     def aspect_ratio(self):
@@ -31,60 +70,88 @@ class Camera:
         else:
             return 4/3
 
-    def setup_shader(self):
-        self.shader = Shader("advanced_shader")
-        samplers = np.array([x for x in range(8)], dtype=np.uint32)
-        self.shader.bind()
-        self.shader.set_uniform_1iv('u_Textures', len(samplers), samplers)
+    def destroy(self):
+        self.uniform_buffer.destroy()
+
+    def rotation_changed(self):
+        self.rotation_dirty = True
 
     def set_ambient(self, ambient=(0.1, 0.1, 0.1, 1.0)):
-        self.shader.bind()
-        self.ambient = ambient
-        ambient = np.array(ambient, dtype=np.float32)
-        self.shader.set_uniform_4fv("Ambient", ambient)
+        self.ambient[:] = ambient
+        self.block_dirty = True
+
+    def set_light(self, position=None, color=None):
+        if position is not None:
+            self.light_position_w[:] = position
+        if color is not None:
+            self.light_color[:] = color
+        self.block_dirty = True
+
+    def update_projection(self):
+        self.projection = matrix44.create_perspective_projection_matrix(self.view_angle, self.aspect_ratio,
+                                                                        self.clip_range_min, self.clip_range_max)
+
+    def update_rotation(self):
+        """Model matrix rot_z . rot_x"""
+        cos_x, sin_x = math.cos(self.rotation.rot_x), math.sin(self.rotation.rot_x)
+        cos_z, sin_z = math.cos(self.rotation.rot_z), math.sin(self.rotation.rot_z)
+        self.rotation_x[1, 1:3] = cos_x, -sin_x
+        self.rotation_x[2, 1:3] = sin_x, cos_x
+        self.rotation_z[0, 0:2] = cos_z, -sin_z
+        self.rotation_z[1, 0:2] = sin_z, cos_z
+        np.dot(self.rotation_z, self.rotation_x, out=self.model_matrix)
+        self.block_model_matrix[:] = self.model_matrix
 
     def update_mvp(self):
-        self.shader.bind()
-        proj = matrix44.create_perspective_projection_matrix(self.view_angle, self.aspect_ratio,
-                                                             self.clip_range_min, self.clip_range_max)
-        view = matrix44.create_from_translation(Vector3([self.transform.x, self.transform.y, self.transform.z]))
-        model = matrix44.create_from_translation(Vector3([0.0, 0.0, 0.0]))
-        rotation = matrix44.create_from_x_rotation(self.rotation.rot_x)  # 70 / 360 * np.pi
-        rot_z_mat = matrix44.create_from_z_rotation(self.rotation.rot_z)  # -40 / 360 * np.pi
-        rotation = matrix44.multiply(rot_z_mat, rotation)
-        rp = matrix44.multiply(rotation, proj)
-        vrp = matrix44.multiply(view, rp)
-        mvp = matrix44.multiply(model, vrp)
-
-        self.shader.set_uniform_matrix_4fv("ModelViewProjectionMatrix", mvp)
+        self.view[3, 0] = self.render_transform.x
+        self.view[3, 1] = self.render_transform.y
+        self.view[3, 2] = self.render_transform.z
+        if self.mvp is None:
+            self.mvp = np.empty((4, 4))
+        np.dot(self.view, self.rotation_projection, out=self.mvp)
+        self.mvp_version += 1
+        self.block_mvp[:] = self.mvp
 
     def update_camera_pos(self):
-        self.shader.bind()
-        self.shader.set_uniform_4fv("EyePosW", Vector4([self.transform.x, self.transform.y, self.transform.z, 0.0]))
-
-    def set_model_matrix(self):
-        self.shader.bind()
-        rotation = matrix44.create_from_x_rotation(self.rotation.rot_x)
-        rot_z_mat = matrix44.create_from_z_rotation(self.rotation.rot_z)
-        rotation = matrix44.multiply(rot_z_mat, rotation)
-
-        self.shader.set_uniform_matrix_4fv("ModelMatrix", rotation)
-
-    def update(self):
-        self.shader.bind()
-        model_matrix = matrix44.create_from_translation(Vector3([3.0, 3.0, 2.0]))
-        self.shader.set_uniform_4fv("LightPosW", self.light_position_w)  # Light
-        white = np.array([1.0, 1.0, 1.0, 1.0], dtype=np.float32)  # Light
-        self.shader.set_uniform_4fv("LightColor", white)  # Light
-        self.set_ambient([0.6, 0.6, 0.6, 1.0])
-
-        self.update_mvp()
-        self.set_model_matrix()
-        self.update_camera_pos()
+        self.eye_position[0] = self.render_transform.x
+        self.eye_position[1] = self.render_transform.y
+        self.eye_position[2] = self.render_transform.z
+
+    def store_previous_transform(self):
+        self.previous_transform.x = self.transform.x
+        self.previous_transform.y = self.transform.y
+        self.previous_transform.z = self.transform.z
+
+    def interpolate(self, alpha=1.0):
+        """Place the rendered view between the previous and current tick, alpha = 1 is the current one"""
+        for axis in ('x', 'y', 'z'):
+            previous = getattr(self.previous_transform, axis)
+            position = previous + (getattr(self.transform, axis) - previous) * alpha
+            if position != getattr(self.render_transform, axis):
+                setattr(self.render_transform, axis, position)
+                self.view_dirty = True
+
+    def update(self, alpha=1.0):
+        self.interpolate(alpha)
+        if self.projection_dirty:
+            self.update_projection()
+        if self.rotation_dirty:
+            self.update_rotation()
+        if self.projection_dirty or self.rotation_dirty:
+            np.dot(self.model_matrix, self.projection, out=self.rotation_projection)
+        if self.projection_dirty or self.rotation_dirty or self.view_dirty:
+            self.update_mvp()
+            self.block_dirty = True
+        if self.view_dirty:
+            self.update_camera_pos()
+        if self.block_dirty:
+            self.uniform_buffer.change_data(self.block)
+        self.projection_dirty = self.rotation_dirty = self.view_dirty = self.block_dirty = False
 
     def resize(self, w, h):
         self.screen_width = w
         self.screen_height = h
+        self.projection_dirty = True
 
     def move(self, x=0.0, y=0.0, z=0.0):
         if x:
@@ -0,0 +1,144 @@
+import math
+
+import numpy as np
+import settings
+
+TILE_EMPTY = 0
+
+# Map characters which block movement and their occupancy codes
+SOLID_TILES = {
+    "#": 1,
+    "/": 2,
+}
+
+# Map character -> static mesh drawn in its cell, the mesh bounds of solid tiles are their collision boxes
+TILE_PROTOTYPES = {
+    "#": "block",
+    " ": "ground",
+    "/": "wall_clock",
+    "A": "ground",
+    "S": "ground",
+}
+
+# Map characters whose mesh fills its whole unit cell, only these hide the faces of neighbouring walls.
+# The wall_clock mesh of '/' sits off centre and leaves part of its cell open
+FULL_CELL_TILES = "#"
+
+
+class SimpleBoundingBox:
+    def __init__(self, min_x, min_y, min_z, max_x, max_y, max_z):
+        self.min_x = min_x
+        self.min_y = min_y
+        self.min_z = min_z
+        self.max_x = max_x
+        self.max_y = max_y
+        self.max_z = max_z
+
+    @property
+    def width(self):
+        return self.max_x - self.min_x
+
+    @property
+    def height(self):
+        return self.max_y - self.min_y
+
+    @property
+    def depth(self):
+        return self.max_z - self.min_z
+
+    @property
+    def x(self):
+        return self.min_x + self.width / 2
+
+    @property
+    def y(self):
+        return self.min_y + self.height / 2
+
+    @property
+    def z(self):
+        return self.min_z + self.depth / 2
+
+    def update_box(self, min_x=None, min_y=None, min_z=None, max_x=None, max_y=None, max_z=None):
+        self.min_x = self.min_x if min_x is None else min_x
+        self.min_y = self.min_y if min_y is None else min_y
+        self.min_z = self.min_z if min_z is None else min_z
+        self.max_x = self.max_x if max_x is None else max_x
+        self.max_y = self.max_y if max_y is None else max_y
+        self.max_z = self.max_z if max_z is None else max_z
+
+
+def tile_mask(map_array, char):
+    """Cells holding char, for arrays of map characters and byte grids (uint8) alike"""
+    if map_array.dtype == np.uint8:
+        return map_array == ord(char)
+    return map_array == char
+
+
+def full_cell_mask(map_array):
+    mask = np.zeros(map_array.shape, dtype=bool)
+    for char in FULL_CELL_TILES:
+        mask |= tile_mask(map_array, char)
+    return mask
+
+
+def occupancy_codes(map_array):
+    occupancy = np.zeros(map_array.shape, dtype=np.uint8)
+    for char, code in SOLID_TILES.items():
+        occupancy[tile_mask(map_array, char)] = code
+    return occupancy
+
+
+class CollisionGrid:
+    """Uniform tile grid used to answer collision queries against static map tiles.
+
+    Every map cell is one grid cell, so a query only has to look at the few cells
+    overlapped by the moving bounding box instead of every object on the map.
+    """
+    def __init__(self, map_array, boxes):
+        """
+        :param map_array: 2D array of map characters or bytes (row 0 is y = 0)
+        :param boxes: occupancy code -> bounding box of the tile geometry in local space
+        """
+        self.occupancy = occupancy_codes(np.asarray(map_array))
+        self.rows, self.cols = self.occupancy.shape
+        self.set_boxes(boxes)
+
+    def set_boxes(self, boxes):
+        # Local boxes stored as (center_x, center_y, width, height) per occupancy code
+        self.boxes = np.zeros((max(SOLID_TILES.values()) + 1, 4), dtype=np.float64)
+        for code, bb in boxes.items():
+            self.boxes[code] = (bb.x, bb.y, bb.width, bb.height)
+        # Largest box extent around a cell, used to pick candidate cells conservatively
+        self.reach = float(np.max(np.abs(self.boxes[:, :2]) + self.boxes[:, 2:])) if boxes else 0.0
+
+    def window(self, first_row, end_row, first_col, end_col):
+        return self.occupancy[first_row:end_row, first_col:end_col]
+
+    def check_collision(self, bb, dx=0.0, dy=0.0):
+        """Same test as a linear scan over all colliding tiles, limited to nearby cells"""
+        x = bb.x + dx
+        y = bb.y + dy
+        width, height = bb.width, bb.height
+        first_col = max(math.floor(x - self.reach), 0)
+        last_col = min(math.ceil(x + width + self.reach), self.cols - 1)
+        first_row = max(math.floor(y - self.reach), 0)
+        last_row = min(math.ceil(y + height + self.reach), self.rows - 1)
+        if first_col > last_col or first_row > last_row:
+            return False
+
+        window = self.window(first_row, last_row + 1, first_col, last_col + 1)
+        rows, cols = np.nonzero(window)
+        if not len(rows):
+            return False
+        # All candidate tiles tested at once, per query overhead matters more than their count
+        boxes = self.boxes[window[rows, cols]]
+        x2 = cols + first_col + boxes[:, 0]
+        y2 = rows + first_row + boxes[:, 1]
+        hits = (x < x2 + boxes[:, 2]) & (x + width > x2) & (y < y2 + boxes[:, 3]) & (y + height > y2)
+        if not hits.any():
+            return False
+        if settings.DEBUG:
+            i = np.argmax(hits)
+            print(f"Collision: tile ({cols[i] + first_col}, {rows[i] + first_row})")
+            print(f"X:{x, x2[i]}, Y:{y, y2[i]}")
+        return True
@@ -0,0 +1,27 @@
+import numpy as np
+
+
+def frustum_planes(mvp):
+    """Extract the six clip planes from a model-view-projection matrix.
+
+    Matrices follow the pyrr convention used by Camera (clip = [x, y, z, 1] @ mvp).
+    :return: (6, 4) array of planes (a, b, c, d), inside when a*x + b*y + c*z + d >= 0
+    """
+    m = np.asarray(mvp, dtype=np.float64)
+    x, y, z, w = m[:, 0], m[:, 1], m[:, 2], m[:, 3]
+    planes = np.array([w + x, w - x, w + y, w - y, w + z, w - z])
+    return planes / np.linalg.norm(planes[:, :3], axis=1)[:, np.newaxis]
+
+
+def boxes_in_frustum(planes, bounds_min, bounds_max):
+    """Conservative visibility of axis aligned boxes.
+
+    :param bounds_min: (N, 3) box minimum corners
+    :param bounds_max: (N, 3) box maximum corners
+    :return: (N,) bool, False only for boxes completely outside one of the planes
+    """
+    normals = planes[:, np.newaxis, :3]
+    # Corner of each box furthest along each plane normal
+    corners = np.where(normals >= 0, bounds_max[np.newaxis], bounds_min[np.newaxis])
+    distance = np.sum(corners * normals, axis=2) + planes[:, 3:4]
+    return np.all(distance >= 0, axis=0)
@@ -1,12 +1,14 @@
 import numpy as np
-from maps import Map
+from streaming import open_map
 from PySide2.QtCore import Qt
 import settings
 from camera import Camera
+from profiler import PROFILER
 
 
 class Game:
-    def __init__(self):
+    def __init__(self, shader):
+        """:param shader: program the map is drawn with"""
         self.client_pos_x, self.client_pos_y, self.client_pos_z = 0.0, 0.0, 0.0  # Camera
         self.camera_speed_forward, self.camera_speed_side, self.camera_speed_z = 0.0, 0.0, 0.0  # Camera
         self.pawn_speed_forward, self.pawn_speed_side, self.pawn_speed_z = 0.0, 0.0, 0.0  # Main Character
@@ -18,18 +20,31 @@ class Game:
         self.win_callback = None
         self.ended = False
         self.initialized = False
-        self.camera = Camera(None)
+        self.camera = Camera(shader)
+        # Fixed timestep: real frame time is collected and spent in TICK_RATE ticks
+        self.tick_time = 1.0 / settings.TICK_RATE
+        self.accumulator = 0.0
+        self.render_alpha = 1.0
 
     def set_map(self, m="./stages/stage1/mapp.txt"):
         if settings.DEBUG:
             print(self.current_map)
-        self.current_map = Map(m)
+        self.current_map = open_map(m)
         self.character_controller = self.current_map.main_controller
         self.camera.set_position(-self.current_map.start_pos[0], -self.current_map.start_pos[1])
         self.client_pos_x = -self.current_map.start_pos[0]
         self.client_pos_y = -self.current_map.start_pos[1]
         self.objective_pos = self.current_map.objective_pos
         self.initialized = True
+        self.accumulator = 0.0
+        self.store_previous_state()
+
+    def destroy(self):
+        """Free the GL objects of the map and camera, the game can't be used afterwards"""
+        if self.current_map:
+            self.current_map.destroy()
+            self.reset_game_state()
+        self.camera.destroy()
 
     def check_win(self):
         if self.initialized:
@@ -148,9 +163,29 @@ class Game:
             pos = self.character_controller.get_position()
             # print(f"Pos, X:{pos.x}, Y:{pos.y}")
 
+    def store_previous_state(self):
+        self.camera.store_previous_transform()
+        if self.character_controller:
+            self.character_controller.parent.store_previous_transform()
+
+    def update(self, frame_time):
+        """Run as many fixed ticks as frame_time seconds of real time allow
+
+        The rest carries over to the next frame, render_alpha is how far into the next tick it is.
+        """
+        self.accumulator += min(frame_time, settings.MAX_FRAME_TIME)
+        while self.accumulator >= self.tick_time:
+            self.store_previous_state()
+            with PROFILER.scope("Game.tick"):
+                self.tick()
+            self.accumulator -= self.tick_time
+        self.render_alpha = self.accumulator / self.tick_time
+        if self.initialized:
+            with PROFILER.scope("Camera.update"):
+                self.camera.update(self.render_alpha)
+
     def tick(self):
         if self.initialized:
-            self.camera.update()
             self.check_win()
             dx_cam = np.cos(-self.camera.rotation.rot_z) * self.camera_speed_side\
                      + np.sin(self.camera.rotation.rot_z) * self.camera_speed_forward
@@ -158,6 +193,7 @@ class Game:
                      + np.cos(self.camera.rotation.rot_z) * self.camera_speed_forward
 
             if self.current_map:
+                self.current_map.update(self.character_controller.get_position())
                 if not self.current_map.check_check_collision(dx=-dy_cam):
                     self.character_controller.move(x=-dy_cam)
                     if self.cam_with_ctrl:
@@ -0,0 +1,161 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from collision import CollisionGrid, SimpleBoundingBox, SOLID_TILES, TILE_PROTOTYPES
+from level_format import load_grid
+from obj_loader import load_mesh, mesh_bounding_box
+
+CHARACTER_MODEL = "character"
+# Arrow keys move the character by half a cell
+STEP = 0.5
+# Game.check_win distance
+WIN_DISTANCE = 1
+
+ACTION_NONE = "none"
+ACTION_UP = "up"
+ACTION_DOWN = "down"
+ACTION_LEFT = "left"
+ACTION_RIGHT = "right"
+
+# Action -> (dx, dy), same as the arrow keys in Game.move_character
+ACTIONS = {
+    ACTION_NONE: (0.0, 0.0),
+    ACTION_UP: (0.0, STEP),
+    ACTION_DOWN: (0.0, -STEP),
+    ACTION_LEFT: (-STEP, 0.0),
+    ACTION_RIGHT: (STEP, 0.0),
+}
+MOVE_ACTIONS = [ACTION_UP, ACTION_DOWN, ACTION_LEFT, ACTION_RIGHT]
+
+# Bounding boxes only depend on the meshes, so they are read once per process
+LOADED_BOXES = {}
+
+
+def model_box(name):
+    if name not in LOADED_BOXES:
+        LOADED_BOXES[name] = mesh_bounding_box(load_mesh(name))
+    return LOADED_BOXES[name]
+
+
+def collision_boxes():
+    return {code: model_box(TILE_PROTOTYPES[char]) for char, code in SOLID_TILES.items()}
+
+
+class HeadlessGame:
+    """Map grid, collision and win rules of Game without GL or Qt.
+
+    The character is moved by abstract actions instead of key events, geometry is only read
+    for the bounding boxes of the character and the solid tiles.
+    """
+    def __init__(self, file):
+        """:param file: text map or compiled level"""
+        self.file = file
+        grid, start, objective = load_grid(file)
+        if start[0] < 0:
+            raise ValueError(f"{file} has no start cell")
+        self.rows, self.cols = grid.shape
+        self.collision_grid = CollisionGrid(grid, collision_boxes())
+        self.start_pos = [start[1], start[0], 0]
+        self.objective_pos = np.array([objective[1], objective[0], 0.0], dtype=np.float32)
+        self.character_box = model_box(CHARACTER_MODEL)
+        self.reset()
+
+    def reset(self):
+        self.x = 0.0
+        self.y = 0.0
+        self.steps = 0
+        self.won = False
+        # Same sequence of box updates as loading the character model and moving it to the start
+        self.bounding_box = SimpleBoundingBox(0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        self.update_bounding_box()
+        self.move(self.start_pos[0], self.start_pos[1])
+
+    def update_bounding_box(self):
+        box = self.character_box
+        self.bounding_box.update_box(
+            min_x=box.min_x + self.x,
+            min_y=box.min_y + self.y,
+            min_z=box.min_z,
+            max_x=box.max_x + self.x,
+            max_y=box.max_y + self.y,
+            max_z=box.max_z,
+        )
+
+    def move(self, x=0.0, y=0.0):
+        """Controller.move, every changed axis updates the bounding box"""
+        if x:
+            self.x += x
+            self.update_bounding_box()
+        if y:
+            self.y += y
+            self.update_bounding_box()
+
+    def check_check_collision(self, dx=0.0, dy=0.0):
+        return self.collision_grid.check_collision(self.bounding_box, dx, dy)
+
+    def check_win(self):
+        r = np.sqrt((self.x - self.objective_pos[0]) ** 2 + (self.y - self.objective_pos[1]) ** 2)
+        if r < WIN_DISTANCE:
+            self.won = True
+        return self.won
+
+    def step(self, action):
+        """Apply one action like an arrow key press.
+
+        :return: True once the objective is reached
+        """
+        dx, dy = ACTIONS[action]
+        if dx and not self.check_check_collision(dx=dx):
+            self.move(x=dx)
+        if dy and not self.check_check_collision(dy=dy):
+            self.move(y=dy)
+        self.steps += 1
+        return self.check_win()
+
+    def tick(self, speed_x=0.0, speed_y=0.0):
+        """Continuous movement of one Game.tick, each axis checked on its own"""
+        won = self.check_win()
+        if speed_x and not self.check_check_collision(dx=speed_x):
+            self.move(x=speed_x)
+        if speed_y and not self.check_check_collision(dy=speed_y):
+            self.move(y=speed_y)
+        self.steps += 1
+        return won
+
+    def run(self, actions, max_steps=None):
+        """Step through actions until the objective is reached or they run out
+
+        :return: number of steps taken
+        """
+        for action in actions:
+            if self.won or (max_steps is not None and self.steps >= max_steps):
+                break
+            self.step(action)
+        return self.steps
+
+
+def random_actions(seed=None):
+    rng = random.Random(seed)
+    while True:
+        yield rng.choice(MOVE_ACTIONS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Random walks through a map without a display")
+    parser.add_argument("map", nargs="?", default="./stages/stage1/mapp.txt", help="text map or compiled level")
+    parser.add_argument("--steps", type=int, default=100000, help="step limit per walk")
+    parser.add_argument("--walks", type=int, default=10)
+    args = parser.parse_args()
+
+    game = HeadlessGame(args.map)
+    total_steps = 0
+    start = time.perf_counter()
+    for seed in range(args.walks):
+        game.reset()
+        total_steps += game.run(random_actions(seed), args.steps)
+        print(f"walk {seed}: {'won' if game.won else 'lost'} after {game.steps} steps")
+    elapsed = time.perf_counter() - start
+    print(f"{total_steps} steps in {elapsed:.2f}s, {total_steps / elapsed:.0f} steps/s")
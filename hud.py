@@ -5,6 +5,7 @@ from OpenGL.GL import *
 from pyrr import matrix44
 from models import VertexArray, VertexBuffer, VertexBufferLayout, IndexBuffer
 from texturemanager import TEXTURES, load_image_rgba
+from renderer import STATE, RENDER_QUEUE, LAYER_HUD, count_texture_upload
 
 SNAP_CENTER = 0
 SNAP_LEFT_DOWN = 1
@@ -15,6 +16,9 @@ SNAP_LEFT_TOP = 4
 TEXT_TEXTURE_SLOT = 3
 MENU_TEXTURE_SLOT = 4
 
+# Characters TextLayer can draw, CHARACTERS follows this order
+CHARSET = string.ascii_letters + string.digits + string.punctuation + " "
+
 
 class Character:
     def __init__(self, char, texture_id, size, bearing, advance):
@@ -29,7 +33,7 @@ CHARACTERS = []
 
 
 def init_character(scale=2):
-    for l in string.ascii_letters:
+    for l in CHARSET:
         size = cv.getTextSize(l, cv.FONT_HERSHEY_SIMPLEX, scale, 3)
         s = {'width': size[0][0], 'height': size[0][1]}
         empty = np.ones((s['height'] + scale, s['width'], 4), dtype=np.uint8)
@@ -38,9 +42,10 @@ def init_character(scale=2):
         img = cv.resize(empty, (64, 64))
         img = cv.flip(img, 0)
         texture = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, texture)
+        STATE.bind_texture(GL_TEXTURE_2D, texture)
         glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, 64, 64,
                      0, GL_RGBA, GL_UNSIGNED_BYTE, img.tostring())
+        count_texture_upload(img.nbytes)
 
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
@@ -48,7 +53,7 @@ def init_character(scale=2):
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
         c = Character(l, texture, (s['width'], s['height']), (0, 0), empty.shape[0])
         CHARACTERS.append(c)
-        # print(f"Character: {l}, {string.ascii_letters.index(l)}")
+        # print(f"Character: {l}, {CHARSET.index(l)}")
 
 
 class VLayout:
@@ -112,32 +117,26 @@ class TextLayer:
         self.color = color
         self.visible = True
         self.resizable = resizable
+        # Changed since the scene was last drawn
+        self.dirty = True
         if not CHARACTERS:
             init_character()
 
-        vertices = np.array([
-            10.0, 10.0, 0.0, 0.0,
-            200, 10, 1.0, 0.0,
-            200, 200, 1.0, 1.0,
-            10, 200, 0.0, 1.0,
-        ], dtype=np.float32)
-        indices = np.array([
-            0, 1, 2, 2, 3, 0
-        ], dtype=np.uint32)
         self.va = VertexArray()
-        self.vb = VertexBuffer(vertices, vertices.nbytes)
-        layout = VertexBufferLayout()
-        layout.push_float(2)  # Vertex Position
-        layout.push_float(2)  # Texture Coordinate
-        self.va.add_buffer(self.vb, layout)
-
-        self.ib = IndexBuffer(indices, len(indices))
-
-    def render_text(self, shader):
-        glActiveTexture(GL_TEXTURE0 + TEXT_TEXTURE_SLOT)
+        self.vb = None
+        self.ib = None
+        # Buffers don't match the text or position any more
+        self.geometry_stale = True
+        # (texture bindings, index offset) of each character, reused until the text changes
+        self.character_draws = []
+
+    def build_geometry(self):
+        """One quad per character in a shared buffer, each drawn with its own index range"""
+        vertices = np.zeros((max(len(self.text), 1), 4, 4), dtype=np.float32)
         m = 0
-        for l in self.text:
-            character = CHARACTERS[string.ascii_letters.index(l)]
+        textures = []
+        for i, l in enumerate(self.text):
+            character = CHARACTERS[CHARSET.index(l)]
             x_pos = self.x + m + character.bearing[0] * self.scale
             y_pos = self.y + character.bearing[1] * self.scale
             w = character.size[0] * self.scale
@@ -145,48 +144,62 @@ class TextLayer:
 
             m += character.size[0] * self.scale  # character advance
 
-            vertices = np.array([
-                x_pos, y_pos, 0.0, 0.0,
-                x_pos + w, y_pos, 1.0, 0.0,
-                x_pos + w, y_pos + h, 1.0, 1.0,
-                x_pos, y_pos + h, 0.0, 1.0,
-            ], dtype=np.float32)
-            indices = np.array([
-                0, 1, 2, 2, 3, 0
-            ], dtype=np.uint32)
-
-            glBindTexture(GL_TEXTURE_2D, character.texture_id)
-            # glBindVertexArray(self.vao)
-            # glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-            # glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
-            # glBindBuffer(GL_ARRAY_BUFFER, 0)
-            # glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
-            # glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
-            # glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+            vertices[i] = [
+                [x_pos, y_pos, 0.0, 0.0],
+                [x_pos + w, y_pos, 1.0, 0.0],
+                [x_pos + w, y_pos + h, 1.0, 1.0],
+                [x_pos, y_pos + h, 0.0, 1.0],
+            ]
+            textures.append(character.texture_id)
+
+        if self.vb is None or self.ib.get_count() < len(vertices) * 6:
+            if self.vb is not None:
+                self.ib.destroy()
+                self.vb.destroy()
+            quad = np.array([0, 1, 2, 2, 3, 0], dtype=np.uint32)
+            indices = (quad[np.newaxis, :] + 4 * np.arange(len(vertices), dtype=np.uint32)[:, np.newaxis]).ravel()
+            self.va.bind()
+            self.vb = VertexBuffer(vertices, vertices.nbytes)
+            layout = VertexBufferLayout()
+            layout.push_float(2)  # Vertex Position
+            layout.push_float(2)  # Texture Coordinate
+            self.va.add_buffer(self.vb, layout)
+            self.ib = IndexBuffer(indices, len(indices))
+        else:
             self.vb.change_data(vertices, vertices.nbytes)
+        self.character_draws = [(((TEXT_TEXTURE_SLOT, GL_TEXTURE_2D, texture),),
+                                  ctypes.c_void_p(i * 6 * self.ib.index_size))
+                                 for i, texture in enumerate(textures)]
+        self.geometry_stale = False
 
-            glDisable(GL_DEPTH_TEST)
-            shader.bind()
-            self.va.bind()
-            self.ib.bind()
-            glDrawElements(GL_TRIANGLES, self.ib.get_count(), GL_UNSIGNED_INT, None)
-            glEnable(GL_DEPTH_TEST)
+    def render_text(self, shader):
+        if self.geometry_stale:
+            self.build_geometry()
+        for textures, offset in self.character_draws:
+            RENDER_QUEUE.submit(shader, self.va, self.ib, textures, depth_test=False, layer=LAYER_HUD, count=6,
+                                offset=offset)
 
     def render(self, shader):
         self.render_text(shader)
 
     def set_text(self, new_text):
+        self.dirty = self.dirty or new_text != self.text
+        self.geometry_stale = self.geometry_stale or new_text != self.text
         self.text = new_text
 
     def hide(self):
         self.visible = False
+        self.dirty = True
 
     def show(self):
         self.visible = True
+        self.dirty = True
 
     def move(self, new_x, new_y):
         self.x = new_x
         self.y = new_y
+        self.dirty = True
+        self.geometry_stale = True
 
     def resize(self, w, h):
         pass
@@ -201,13 +214,16 @@ class ImageLayer:
         self.visible = True
         self.resizable = resizable
         self.full_screen = full_screen
+        self.dirty = True
         self.img = img
         self.img = cv.resize(self.img, (self.width, self.height))
 
         self.texture = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, self.texture)
+        self.textures = ((MENU_TEXTURE_SLOT, GL_TEXTURE_2D, self.texture),)
+        STATE.bind_texture(GL_TEXTURE_2D, self.texture)
         glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, self.width, self.height,
                      0, GL_RGBA, GL_UNSIGNED_BYTE, self.img.tostring())
+        count_texture_upload(self.img.nbytes)
 
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
@@ -242,22 +258,18 @@ class ImageLayer:
         self.vb.change_data(vertices, vertices.nbytes)
 
     def render(self, shader):
-        glActiveTexture(GL_TEXTURE0 + MENU_TEXTURE_SLOT)
-        glBindTexture(GL_TEXTURE_2D, self.texture)
-        glDisable(GL_DEPTH_TEST)
-        shader.bind()
-        self.va.bind()
-        self.ib.bind()
-        glDrawElements(GL_TRIANGLES, self.ib.get_count(), GL_UNSIGNED_INT, None)
-        glEnable(GL_DEPTH_TEST)
+        RENDER_QUEUE.submit(shader, self.va, self.ib, self.textures, depth_test=False, layer=LAYER_HUD)
 
     def set_img(self, img):
         # compare img size with layer size
+        self.dirty = True
         self.img = img
         self.texture = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, self.texture)
+        self.textures = ((MENU_TEXTURE_SLOT, GL_TEXTURE_2D, self.texture),)
+        STATE.bind_texture(GL_TEXTURE_2D, self.texture)
         glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, self.width, self.height,
                      0, GL_RGBA, GL_UNSIGNED_BYTE, img.tostring())
+        count_texture_upload(img.nbytes)
 
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
@@ -274,11 +286,13 @@ class ImageLayer:
         self.x = new_x or self.x
         self.y = new_y or self.y
         self.calculate_vertices()
+        self.dirty = True
 
     def resize(self, new_width=None, new_height=None):
         self.width = new_width or self.width
         self.height = new_height or self.height
         self.calculate_vertices()
+        self.dirty = True
 
 
 class Button:
@@ -297,6 +311,7 @@ class Button:
         hov_img = cv.subtract(img, 50)
         self._hover_image_item = ImageLayer(w, h, x, y, hov_img)
         self.hover = True
+        self.dirty = True
 
         text_x, text_y = self._text_pos()
         self._text_item = TextLayer(text_x, text_y, 1, text, text_color)
@@ -307,7 +322,7 @@ class Button:
         for l in self.text:
             if not CHARACTERS:
                 init_character()
-            x, y = CHARACTERS[string.ascii_letters.index(l)].size
+            x, y = CHARACTERS[CHARSET.index(l)].size
             delta_x += x
             if y > delta_y:
                 delta_y = y
@@ -316,6 +331,7 @@ class Button:
         return text_pos_x, text_pos_y
 
     def set_hover(self, state):
+        self.dirty = self.dirty or state != self.hover
         self.hover = state
 
     def render(self, main_shader, text_shader):
@@ -332,10 +348,12 @@ class Button:
         self._hover_image_item.move(new_x, new_y)
         text_x, text_y = self._text_pos()
         self._text_item.move(text_x, text_y)
+        self.dirty = True
 
     def resize(self, new_width=None, new_height=None):
         self.width = new_width or self.width
         self.height = new_height or self.height
+        self.dirty = True
 
     def clicked(self):
         if self.callback:
@@ -353,6 +371,8 @@ class Scene:
         self.layers = {}
         self.ortho_matrix = None
         self.calculate_matrix()
+        # Whole scene needs drawing, e.g. after a resize or being activated
+        self.dirty = True
 
     def get_orthogonal_matrix(self):
         return self.ortho_matrix
@@ -364,6 +384,7 @@ class Scene:
         self.width = width
         self.height = height
         self.calculate_matrix()
+        self.dirty = True
         for l, desc in self.layers.items():
             new_x = self.width * self.layers[l]['x'] - self.layers[l]['delta_x']
             new_y = self.height * self.layers[l]['y'] - self.layers[l]['delta_y']
@@ -380,6 +401,12 @@ class Scene:
                     l.render(main_shader)
                 elif isinstance(l, Button):
                     l.render(main_shader, text_shader)
+        self.dirty = False
+        for l in self.layers:
+            l.dirty = False
+
+    def needs_redraw(self):
+        return self.dirty or any(l.dirty for l in self.layers)
 
     def add_layer(self, layer, snap_point=SNAP_CENTER):
         if isinstance(layer, ImageLayer):
@@ -405,6 +432,7 @@ class Scene:
             delta_x = layer.width / 2
             delta_y = layer.height / 2
 
+        self.dirty = True
         self.layers[layer] = {
             'width': layer.width / self.width,
             'height': layer.height / self.height,
@@ -451,6 +479,10 @@ class GUI:
     def activate_scene(self, name):
         if name in self.scenes:
             self.active_scene = self.scenes[name]
+            self.active_scene.dirty = True
+
+    def needs_redraw(self):
+        return self.active_scene is None or self.active_scene.needs_redraw()
 
     def render(self, main_shader, text_shader):
         self.active_scene.render(main_shader, text_shader)
@@ -0,0 +1,212 @@
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import settings
+
+from collision import tile_mask, full_cell_mask
+from mesh_builder import build_chunked_wall_meshes
+from mesh_cache import MeshData
+from mesh_optimizer import index_dtype
+
+LEVEL_EXTENSION = ".lvl"
+LEVEL_MAGIC = b"MAZELVL\0"
+LEVEL_VERSION = 2
+# Sections start on this boundary so they can be viewed as float32 / uint32 arrays in place
+LEVEL_ALIGNMENT = 16
+
+# Fixed size header at the start of a compiled level, offsets are in bytes from the file start.
+# The grid holds the map characters as bytes with row 0 at y = 0, cells past a short line are 0.
+# Start and objective are (row, col), -1 when the level has none. Wall buffers are optional
+# (count 0) and only valid for the chunk size they were built with, their bounds are stored so
+# loading never has to read the vertices.
+LEVEL_HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('rows', '<u4'),
+    ('cols', '<u4'),
+    ('chunk_size', '<u4'),
+    ('start', '<i4', 2),
+    ('objective', '<i4', 2),
+    ('grid_offset', '<u8'),
+    ('vertex_offset', '<u8'),
+    ('vertex_count', '<u8'),
+    ('index_offset', '<u8'),
+    ('index_count', '<u8'),
+    ('index_itemsize', '<u4'),
+    ('reserved', '<u4'),
+    ('bounds_min', '<f4', 3),
+    ('bounds_max', '<f4', 3),
+])
+
+
+class CompiledLevel:
+    """Memory mapped compiled level, arrays are views into the mapping"""
+    def __init__(self, file):
+        self.file = file
+        self.data = np.memmap(file, dtype=np.uint8, mode='r')
+        if len(self.data) < LEVEL_HEADER_DTYPE.itemsize:
+            raise ValueError(f"{file} is not a compiled level")
+        header = self.data[:LEVEL_HEADER_DTYPE.itemsize].view(LEVEL_HEADER_DTYPE)[0]
+        if header['magic'] != LEVEL_MAGIC.rstrip(b"\0") or header['version'] != LEVEL_VERSION:
+            raise ValueError(f"{file} is not a compiled level of version {LEVEL_VERSION}")
+        self.rows = int(header['rows'])
+        self.cols = int(header['cols'])
+        self.chunk_size = int(header['chunk_size'])
+        self.start = tuple(int(v) for v in header['start'])
+        self.objective = tuple(int(v) for v in header['objective'])
+
+        offset = int(header['grid_offset'])
+        self.grid = self.data[offset:offset + self.rows * self.cols].reshape(self.rows, self.cols)
+
+        self.wall_mesh = None
+        vertex_count = int(header['vertex_count'])
+        if vertex_count:
+            offset = int(header['vertex_offset'])
+            vertex_data = self.data[offset:offset + vertex_count * 32].view(np.float32).reshape(-1, 8)
+            offset = int(header['index_offset'])
+            itemsize = int(header['index_itemsize'])
+            index_type = np.uint16 if itemsize == 2 else np.uint32
+            indices = self.data[offset:offset + int(header['index_count']) * itemsize].view(index_type)
+            self.wall_mesh = MeshData("walls", vertex_data, indices, header['bounds_min'], header['bounds_max'])
+
+    def start_cells(self):
+        return [self.start] if self.start[0] >= 0 else []
+
+    def objective_cells(self):
+        return [self.objective] if self.objective[0] >= 0 else []
+
+    def wall_mesh_for(self, chunk_size):
+        """Prebuilt wall mesh if it was built for chunk_size"""
+        return self.wall_mesh if self.chunk_size == chunk_size else None
+
+
+def compiled_path(file):
+    return os.path.splitext(file)[0] + LEVEL_EXTENSION
+
+
+def is_compiled_level(file):
+    return file.endswith(LEVEL_EXTENSION)
+
+
+def level_version(file):
+    """Format version of a compiled level, None if it isn't one"""
+    with open(file, 'rb') as f:
+        data = f.read(LEVEL_HEADER_DTYPE.itemsize)
+    if len(data) < LEVEL_HEADER_DTYPE.itemsize:
+        return None
+    header = np.frombuffer(data, dtype=LEVEL_HEADER_DTYPE)[0]
+    return int(header['version']) if header['magic'] == LEVEL_MAGIC.rstrip(b"\0") else None
+
+
+def fresh_compiled_level(file):
+    """Path of the compiled level built from text map file, None if missing, older than the text or
+    compiled with another LEVEL_VERSION"""
+    path = compiled_path(file)
+    if path != file and os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(file) \
+            and level_version(path) == LEVEL_VERSION:
+        return path
+    return None
+
+
+def read_text_grid(file):
+    """Map bytes of a text map file, rows flipped like load_map_array and short lines padded with 0"""
+    with open(file, 'rb') as f:
+        lines = f.read().splitlines()
+    grid = np.zeros((len(lines), max((len(line) for line in lines), default=0)), dtype=np.uint8)
+    for i, line in enumerate(lines):
+        grid[i, :len(line)] = np.frombuffer(line, dtype=np.uint8)
+    return grid[::-1]
+
+
+def last_cell(grid, char):
+    """(row, col) of the last cell holding char, like the last one found wins in Map"""
+    rows, cols = np.nonzero(tile_mask(grid, char))
+    return (int(rows[-1]), int(cols[-1])) if len(rows) else (-1, -1)
+
+
+def load_grid(file):
+    """Map bytes, start and objective cell of a text map or compiled level, no GL needed"""
+    if is_compiled_level(file):
+        level = CompiledLevel(file)
+        return level.grid, level.start, level.objective
+    grid = read_text_grid(file)
+    return grid, last_cell(grid, "A"), last_cell(grid, "S")
+
+
+def _aligned(offset):
+    return -(-offset // LEVEL_ALIGNMENT) * LEVEL_ALIGNMENT
+
+
+def compile_level(source, destination=None, geometry=True, chunk_size=None):
+    """Compile a text map into a level file.
+
+    :param geometry: also store the chunked wall mesh used when GREEDY_WALLS is on. Skipped for
+        levels from STREAMING_MAP_BYTES up, streamed maps build their chunks on the fly
+    :return: destination path
+    """
+    destination = destination or compiled_path(source)
+    chunk_size = chunk_size or settings.CHUNK_SIZE
+    grid = np.ascontiguousarray(read_text_grid(source))
+    geometry = geometry and grid.nbytes < settings.STREAMING_MAP_BYTES
+
+    vertex_data = np.empty((0, 8), dtype=np.float32)
+    indices = np.empty(0, dtype=np.uint16)
+    bounds_min = bounds_max = np.zeros(3, dtype=np.float32)
+    if geometry:
+        walls = tile_mask(grid, "#")
+        meshes = [mesh for _, mesh in build_chunked_wall_meshes(walls, full_cell_mask(grid), chunk_size)]
+        if meshes:
+            firsts = np.cumsum([0] + [len(mesh.vertex_data) for mesh in meshes[:-1]])
+            vertex_data = np.concatenate([mesh.vertex_data for mesh in meshes]).astype(np.float32)
+            indices = np.concatenate([np.asarray(mesh.indices, dtype=np.int64) + first
+                                      for mesh, first in zip(meshes, firsts)])
+            indices = indices.astype(index_dtype(len(vertex_data)))
+            bounds_min = vertex_data[:, :3].min(axis=0)
+            bounds_max = vertex_data[:, :3].max(axis=0)
+
+    header = np.zeros(1, dtype=LEVEL_HEADER_DTYPE)
+    header['magic'] = LEVEL_MAGIC
+    header['version'] = LEVEL_VERSION
+    header['rows'], header['cols'] = grid.shape
+    header['chunk_size'] = chunk_size
+    header['start'] = last_cell(grid, "A")
+    header['objective'] = last_cell(grid, "S")
+    header['grid_offset'] = _aligned(LEVEL_HEADER_DTYPE.itemsize)
+    header['vertex_offset'] = _aligned(int(header['grid_offset'][0]) + grid.nbytes)
+    header['vertex_count'] = len(vertex_data)
+    header['index_offset'] = _aligned(int(header['vertex_offset'][0]) + vertex_data.nbytes)
+    header['index_count'] = len(indices)
+    header['index_itemsize'] = indices.itemsize
+    header['bounds_min'] = bounds_min
+    header['bounds_max'] = bounds_max
+
+    with open(destination, 'wb') as f:
+        for offset, block in ((0, header), (header['grid_offset'][0], grid),
+                              (header['vertex_offset'][0], vertex_data), (header['index_offset'][0], indices)):
+            f.write(b"\0" * (int(offset) - f.tell()))
+            f.write(block.tobytes())
+    return destination
+
+
+def compile_stages(pattern, geometry=True):
+    for source in sorted(glob.glob(pattern)):
+        start = time.perf_counter()
+        destination = compile_level(source, geometry=geometry)
+        compile_time = time.perf_counter() - start
+        start = time.perf_counter()
+        CompiledLevel(destination)
+        load_time = time.perf_counter() - start
+        print(f"{source} -> {destination}: {os.path.getsize(destination)} bytes, "
+              f"compiled in {compile_time * 1000:.1f}ms, mapped in {load_time * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile text maps into memory mappable level files")
+    parser.add_argument("pattern", nargs="?", default=os.path.join(".", "stages", "*", "*.txt"),
+                        help="glob of text maps to compile")
+    parser.add_argument("--no-geometry", action="store_true", help="do not store prebuilt wall buffers")
+    args = parser.parse_args()
+    compile_stages(args.pattern, geometry=not args.no_geometry)
@@ -3,100 +3,55 @@ import xml.etree.ElementTree as ET
 
 import numpy as np
 
-from models import ModelData3D, Model3D, MODEL_STATIC, MODEL_DYNAMIC
+from models import ModelData3D, Model3D, MeshPrototype, MODEL_STATIC, MODEL_DYNAMIC
+# Geometry loading needs no GL context and lives in obj_loader, re-exported for existing callers
+from obj_loader import BASE_OBJECTS_FOLDER, load_obj_file, build_mesh, load_mesh
 from texturemanager import load_texture
 
-BASE_OBJECTS_FOLDER = ".\\graphics\\3d_objects"
-BASE_TEXTURES_FOLDER = ".\\graphics\\textures"
+BASE_TEXTURES_FOLDER = os.path.join(".", "graphics", "textures")
 
+PROTOTYPES = []  # prototype id -> MeshPrototype
+PROTOTYPE_IDS = {}  # asset name -> prototype id
 
-def load_obj_file(filename):
-    if os.path.exists(filename):  # if file exists
-        objects = {}
-        current_obj = ''
-        with open(filename, 'r') as f:
-            for line in f:  # search for objects/vertices/faces
-                if line.startswith('o '):
-                    # New Object
-                    current_obj = line[2:].strip()
-                    objects[current_obj] = {'vertices': [], 'tex_coords': [], 'normals': [], 'faces': []}
 
-                elif line.startswith('v '):
-                    # New Vertex
-                    x, y, z, *w = line[2:].split()
-                    coords = np.array([float(x), float(y), float(z)], dtype=np.float32)
-                    objects[current_obj]['vertices'].append(coords)
+def get_texture_path(name):
+    tex_path = os.path.join(BASE_TEXTURES_FOLDER, name) + ".jpg"
+    if not os.path.exists(tex_path):
+        tex_path = tex_path[:-4] + ".png"
+    return tex_path
 
-                elif line.startswith('vt '):
-                    # Texture coord
-                    u, v = line[3:].split()
-                    uv = np.array([float(u), float(v)], dtype=np.float32)
-                    objects[current_obj]['tex_coords'].append(uv)
 
-                elif line.startswith('vn '):
-                    # Normal
-                    x, y, z = line[3:].split()
-                    normal = np.array([float(x), float(y), float(z)], dtype=np.float32)
-                    objects[current_obj]['normals'].append(normal)
-
-                elif line.startswith('f '):
-                    # New Face
-                    vertices = line[2:].split()
-                    face = []
-                    for v in vertices:
-                        vi, vt, vn = v.split('/')  # Vertex Index/Texture/Normal
-                        face.append([int(vi) - 1, int(vt) - 1, int(vn) - 1])
-                    face = np.array(face, dtype=np.uint32)
-                    objects[current_obj]['faces'].append(face)
-
-        return len(objects.items()), objects
+def load_prototype(name):
+    """Load an asset once and return its shared MeshPrototype"""
+    if name in PROTOTYPE_IDS:
+        return PROTOTYPES[PROTOTYPE_IDS[name]]
+    mesh = load_mesh(name)
+    if mesh:
+        prototype = MeshPrototype(len(PROTOTYPES), name, mesh, get_texture_path(name))
+        PROTOTYPE_IDS[name] = prototype.id
+        PROTOTYPES.append(prototype)
+        return prototype
     else:
-        print(filename)
-        print("File doesn't exists")
-        return None, None
+        print("Cannot load File")
 
 
 def load_object(name, model_type=MODEL_STATIC):
-    obj_ext = ".obj"
-    obj_path = os.path.join(BASE_OBJECTS_FOLDER, name)
-    obj_path += obj_ext
-    _, objects = load_obj_file(obj_path)
-    if objects:
-        k = list(objects.keys())[0]
-        obj = objects[k]  # Take first object
-        vertices = obj['vertices']
-        texture_coordinates = obj['tex_coords']
-        normals = obj['normals']
-        faces = obj['faces']
-        # Load Texture
-        tex_ext = ".jpg"
-        tex_path = os.path.join(BASE_TEXTURES_FOLDER, name)
-        tex_path += tex_ext
-        if os.path.exists(tex_path):
-            texture_id = load_texture(tex_path)  # TEXTURES.load_texture(tex_path)
+    prototype = load_prototype(name)
+    if prototype:
+        model = Model3D(prototype.object_name, True, None, model_type)
+        if model_type == MODEL_DYNAMIC:
+            # Dynamic models own their GL buffers, so they get their own geometry
+            model_geometry = ModelData3D(
+                    parent=model,
+                    vertex_data=prototype.mesh.vertex_data,
+                    indices=prototype.mesh.indices,
+                    texture=prototype.texture,
+                    initialize_gl=True,
+            )
         else:
-            tex_path = tex_path[:-4] + ".png"
-            texture_id = load_texture(tex_path)  # TEXTURES.load_texture(tex_path)
-        model = Model3D(k, True, None, model_type)
-        if model_type == MODEL_STATIC:
-            init = False
-        elif model_type == MODEL_DYNAMIC:
-            init = True
-        else:
-            init = False
-        model_geometry = ModelData3D(
-                parent=model,
-                vertices=vertices,
-                texture_coordinates=texture_coordinates,
-                normals=normals,
-                faces=faces,
-                texture=texture_id,
-                initialize_gl=init,
-        )
+            model_geometry = prototype.geometry
         model.set_geometry(model_geometry)
         return model
-    else:
-        print("Cannot load File")
 
 
 def load_dae_file(filename):
@@ -3,6 +3,7 @@ from PySide2.QtWidgets import QApplication, QMainWindow
 from PySide2.QtCore import QTimer, Qt
 from PySide2.QtOpenGL import QGLWidget
 from opengl import OpenGLController
+import settings
 
 
 class OpenGLWidget(QGLWidget):
@@ -28,6 +29,11 @@ class OpenGLWidget(QGLWidget):
         """Called every frame"""
         self.controller.draw()
 
+    def request_frame(self):
+        """Called by the frame timer, repaints only when something changed"""
+        if self.controller.needs_redraw():
+            self.update()
+
     def resizeGL(self, w: int, h: int):
         """Called when widget is resized"""
         self.controller.widget_resized(w, h)
@@ -38,6 +44,10 @@ class OpenGLWidget(QGLWidget):
         self.game.lock_camera(event)
         if event.key() == Qt.Key_Escape:
             self.controller.show_esc_menu()
+        elif event.key() == Qt.Key_F3:
+            self.controller.toggle_profiler()
+        elif event.key() == Qt.Key_F4:
+            self.controller.export_profile()
 
     def keyReleaseEvent(self, event):
 
@@ -66,8 +76,8 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
-    fps = 140
+    fps = settings.RENDER_FPS
     opengl_widget_loop = QTimer()
-    opengl_widget_loop.timeout.connect(window.main_widget.update)
+    opengl_widget_loop.timeout.connect(window.main_widget.request_frame)
     opengl_widget_loop.start(int(1000 / fps))
     sys.exit(app.exec_())
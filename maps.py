@@ -1,13 +1,69 @@
-from loading_data import load_object
+from loading_data import load_object, load_prototype, PROTOTYPES
 import numpy as np
 import settings
 
-from models import BatchModels, MODEL_STATIC, MODEL_DYNAMIC
+from models import BatchModels, InstancedModels, TILE_DTYPE, MODEL_STATIC, MODEL_DYNAMIC
+from collision import CollisionGrid, SOLID_TILES, TILE_PROTOTYPES, tile_mask, full_cell_mask
+from mesh_builder import build_chunked_wall_meshes
+from level_format import CompiledLevel, is_compiled_level
+
+
+def load_map_array(file):
+    map_array = []
+    with open(file, 'r') as f:
+        for line in f:
+            line = line.strip('\n')
+            map_array.append([x for x in line])
+    map_array = np.array(map_array)
+    return map_array[::-1]
+
+
+def build_tiles(map_array, origin=(0, 0)):
+    """Make one TILE_DTYPE record per static map cell, in row-major order
+
+    :param origin: (row, col) of the first map_array cell
+    """
+    prototype_ids = np.full(map_array.shape, -1, dtype=np.int32)
+    for char, name in TILE_PROTOTYPES.items():
+        prototype_ids[tile_mask(map_array, char)] = load_prototype(name).id
+    rows, cols = np.nonzero(prototype_ids >= 0)
+    tiles = np.zeros(len(rows), dtype=TILE_DTYPE)
+    tiles['prototype'] = prototype_ids[rows, cols]
+    tiles['position'][:, 0] = cols + origin[1]
+    tiles['position'][:, 1] = rows + origin[0]
+    return tiles
+
+
+def build_static_geometry(map_array, tiles, wall_mesh=None):
+    """Tiles drawn from prototypes and extra meshes for the batched static geometry
+
+    :param wall_mesh: prebuilt chunked wall mesh, e.g. from a compiled level
+    """
+    if not settings.GREEDY_WALLS:
+        return tiles, []
+    wall_prototype = load_prototype(TILE_PROTOTYPES["#"])
+    if wall_mesh is not None:
+        meshes = [(wall_mesh, wall_prototype.texture_path)]
+    else:
+        walls = tile_mask(map_array, "#")
+        solid = full_cell_mask(map_array)
+        # Wall quads stay inside their chunk, so chunks can be culled on their own
+        wall_meshes = build_chunked_wall_meshes(walls, solid, settings.CHUNK_SIZE)
+        meshes = [(mesh, wall_prototype.texture_path) for _, mesh in wall_meshes]
+    return tiles[tiles['prototype'] != wall_prototype.id], meshes
+
+
+def collision_boxes():
+    return {code: load_prototype(TILE_PROTOTYPES[char]).bounding_box for char, code in SOLID_TILES.items()}
+
+
+def build_collision_grid(map_array):
+    return CollisionGrid(map_array, collision_boxes())
 
 
 class Map:
     def __init__(self, file):
-        self.map_array = []
+        """:param file: text map or compiled level (LEVEL_EXTENSION)"""
         self.objects = []
         self.start_pos = [0, 0, 0]
         self.objective_pos = [0, 0, 0]
@@ -15,90 +71,65 @@ class Map:
         self.main_character = None
         self.chest = None
 
-        with open(file, 'r') as f:
-            for line in f:
-                line = line.strip('\n')
-                self.map_array.append([x for x in line])
-        self.map_array = np.array(self.map_array)
-        self.map_array = self.map_array[::-1]
-        # print(self.map_array)
-        for i, row in enumerate(self.map_array):
-            for j, x in enumerate(row):
-                position = np.array([j, i, 0.0], dtype=np.float32)
-                if x == "#":
-                    model = load_object("block", MODEL_STATIC)
-                    model.transform.x = j
-                    model.transform.y = i
-                    self.objects.append(model)
-                elif x == " ":
-                    model = load_object("ground", MODEL_STATIC)
-                    model.collision = False
-                    model.transform.x = j
-                    model.transform.y = i
-                    self.objects.append(model)
-                elif x == "/":
-                    model = load_object("wall_clock")
-                    model.transform.x = j
-                    model.transform.y = i
-                    self.objects.append(model)
-                elif x == "A":
-                    self.start_pos = [position[0], position[1], 0]  # Camera Position len(self.map_array) - i - 1
-                    # -2, -5
-                    model = load_object('character', MODEL_DYNAMIC)
-
-                    c = model.get_controller()
-                    c.move(j, i)
-                    self.main_controller = c
-                    # self.objects.append(model)
-                    self.main_character = model
-
-                    model = load_object("ground", MODEL_STATIC)
-                    model.collision = False
-                    model.transform.x = j
-                    model.transform.y = i
-                    self.objects.append(model)
-                    if settings.DEBUG:
-                        print(self.start_pos)
-                elif x == "S":
-                    self.objective_pos = position
-
-                    model = load_object("ground", MODEL_STATIC)
-                    model.collision = False
-                    model.transform.x = j
-                    model.transform.y = i
-                    self.objects.append(model)
-
-                    model = load_object("chest", MODEL_DYNAMIC)
-                    model.collision = False
-                    model.transform.x = j
-                    model.transform.y = i
-                    self.objects.append(model)
-                    self.chest = model
-
-        self.batch_models = BatchModels(self.objects)
+        wall_mesh = None
+        if is_compiled_level(file):
+            level = CompiledLevel(file)
+            self.map_array = level.grid
+            start_cells, objective_cells = level.start_cells(), level.objective_cells()
+            wall_mesh = level.wall_mesh_for(settings.CHUNK_SIZE)
+        else:
+            self.map_array = load_map_array(file)
+            start_cells = zip(*np.nonzero(self.map_array == "A"))
+            objective_cells = zip(*np.nonzero(self.map_array == "S"))
+        self.tiles = build_tiles(self.map_array)
+        self.collision_grid = build_collision_grid(self.map_array)
+
+        for i, j in start_cells:
+            position = np.array([j, i, 0.0], dtype=np.float32)
+            self.start_pos = [position[0], position[1], 0]  # Camera Position len(self.map_array) - i - 1
+            # -2, -5
+            model = load_object('character', MODEL_DYNAMIC)
+
+            c = model.get_controller()
+            c.move(j, i)
+            self.main_controller = c
+            # self.objects.append(model)
+            self.main_character = model
+            if settings.DEBUG:
+                print(self.start_pos)
+
+        for i, j in objective_cells:
+            position = np.array([j, i, 0.0], dtype=np.float32)
+            self.objective_pos = position
+
+            model = load_object("chest", MODEL_DYNAMIC)
+            model.collision = False
+            model.transform.x = j
+            model.transform.y = i
+            self.objects.append(model)
+            self.chest = model
+
+        if settings.STATIC_RENDER_MODE == "instanced":
+            self.batch_models = InstancedModels(self.tiles, PROTOTYPES)
+        else:
+            tiles, meshes = build_static_geometry(self.map_array, self.tiles, wall_mesh)
+            self.batch_models = BatchModels(tiles, PROTOTYPES, meshes, settings.CHUNK_SIZE)
+
+    def update(self, position):
+        """Called every tick with the character position, the whole map is always loaded"""
+        pass
 
     def check_check_collision(self, dx=0.0, dy=0.0):  # , dz=0.0
         bb1 = self.main_controller.parent.bounding_box
-        for obj in self.objects:
-            if obj == self.main_controller.parent:
-                continue
-            if not obj.collision:
-                continue
-            bb2 = obj.bounding_box
-            if bb1.x + dx < bb2.x + bb2.width and bb1.x + dx + bb1.width > bb2.x and\
-                    bb1.y + dy < bb2.y + bb2.height and bb1.y + dy + bb1.height > bb2.y:
-                if settings.DEBUG:
-                    print(f"Collision: {obj} with {self.main_controller.parent}")
-                    print(f"{bb1}, {bb2}")
-                    print(f"X:{bb1.x, bb2.x}, Y:{bb1.y, bb2.y}")
-                return True
-        return False
+        return self.collision_grid.check_collision(bb1, dx, dy)
 
     def destroy(self):
         for i in range(len(self.objects)):
             self.objects[i].destroy()
+        self.batch_models.destroy()
 
-    def render(self, shader):
-        self.batch_models.render(shader)
-        # self.main_character.render(shader)
-        self.chest.render(shader)
+    def render(self, shader, camera=None, alpha=1.0):
+        """:param alpha: how far rendering is between the previous and current simulation tick"""
+        self.batch_models.render(shader, camera)
+        # self.main_character.render(shader, alpha)
+        self.chest.render(shader, alpha)
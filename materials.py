@@ -11,8 +11,15 @@ class Material:
         self.specular = white
         self.shininess = var
 
+    def uniforms(self):
+        """(shader setter name, uniform name, value) of the material, as render queue items take them"""
+        return (
+            ("set_uniform_4fv", "MaterialEmissive", self.emissive),
+            ("set_uniform_4fv", "MaterialDiffuse", self.diffuse),
+            ("set_uniform_4fv", "MaterialSpecular", self.specular),
+            ("set_uniform_1f", "MaterialShininess", self.shininess),
+        )
+
     def bind_material(self, shader):
-        shader.set_uniform_4fv("MaterialEmissive", self.emissive)
-        shader.set_uniform_4fv("MaterialDiffuse", self.diffuse)
-        shader.set_uniform_4fv("MaterialSpecular", self.specular)
-        shader.set_uniform_1f("MaterialShininess", self.shininess)
+        for setter, name, value in self.uniforms():
+            getattr(shader, setter)(name, value)
@@ -0,0 +1,43 @@
+import random
+
+
+def generate_maze(width, height, seed=None):
+    """Generate a perfect maze with the recursive backtracker algorithm.
+
+    :param width: number of maze cells horizontally (map is 2 * width + 1 characters wide)
+    :param height: number of maze cells vertically
+    :return: list of map rows in the stage text format
+    """
+    rng = random.Random(seed)
+    cols, rows = 2 * width + 1, 2 * height + 1
+    grid = [["#"] * cols for _ in range(rows)]
+
+    stack = [(0, 0)]
+    visited = {(0, 0)}
+    grid[1][1] = " "
+    while stack:
+        cx, cy = stack[-1]
+        neighbours = [(cx + dx, cy + dy) for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1))
+                      if 0 <= cx + dx < width and 0 <= cy + dy < height and (cx + dx, cy + dy) not in visited]
+        if not neighbours:
+            stack.pop()
+            continue
+        nx, ny = rng.choice(neighbours)
+        grid[cy + ny + 1][cx + nx + 1] = " "  # wall between the two cells
+        grid[2 * ny + 1][2 * nx + 1] = " "
+        visited.add((nx, ny))
+        stack.append((nx, ny))
+
+    grid[1][1] = "A"
+    grid[rows - 2][cols - 2] = "S"
+    return ["".join(row) for row in grid]
+
+
+def write_maze(path, rows):
+    with open(path, 'w') as f:
+        f.write("\n".join(rows))
+
+
+if __name__ == "__main__":
+    for row in generate_maze(8, 5, seed=1):
+        print(row)
@@ -0,0 +1,171 @@
+import numpy as np
+
+from mesh_cache import MeshData
+from mesh_optimizer import index_dtype
+
+QUAD_INDICES = np.array([0, 1, 2, 0, 2, 3], dtype=np.int64)
+
+
+def _runs(mask):
+    """Runs of True cells along axis 1 of a 2D mask.
+
+    :return: (row, first, last) arrays, one entry per run
+    """
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    diff = np.diff(padded, axis=1)
+    rows, first = np.nonzero(diff == 1)
+    _, last = np.nonzero(diff == -1)
+    return rows, first, last - 1
+
+
+def _merge_rectangles(mask):
+    """Cover a 2D mask with rectangles: runs along axis 1, merged with identical runs of the next rows.
+
+    :return: (row_first, row_last, col_first, col_last) arrays
+    """
+    rows, first, last = _runs(mask)
+    if not len(rows):
+        return rows, rows, first, last
+    order = np.lexsort((rows, last, first))
+    rows, first, last = rows[order], first[order], last[order]
+    new_rect = np.ones(len(rows), dtype=bool)
+    new_rect[1:] = (first[1:] != first[:-1]) | (last[1:] != last[:-1]) | (rows[1:] != rows[:-1] + 1)
+    starts = np.flatnonzero(new_rect)
+    ends = np.append(starts[1:], len(rows)) - 1
+    return rows[starts], rows[ends], first[starts], last[starts]
+
+
+def _quads(corners, uvs, normal):
+    """Vertex data for quads given as (Q, 4, 3) corners and (Q, 4, 2) texture coordinates"""
+    vertex_data = np.empty(corners.shape[:2] + (8,), dtype=np.float32)
+    vertex_data[:, :, :3] = corners
+    vertex_data[:, :, 3:5] = uvs
+    vertex_data[:, :, 5:] = normal
+    return vertex_data.reshape(-1, 8)
+
+
+def _top_faces(solid, z):
+    r0, r1, c0, c1 = _merge_rectangles(solid)
+    x0, x1, y0, y1 = c0 - 0.5, c1 + 0.5, r0 - 0.5, r1 + 0.5
+    w, h = c1 - c0 + 1, r1 - r0 + 1
+    zeros = np.zeros(len(r0))
+    corners = np.stack([
+        np.stack([x0, y0, zeros + z], axis=1),
+        np.stack([x1, y0, zeros + z], axis=1),
+        np.stack([x1, y1, zeros + z], axis=1),
+        np.stack([x0, y1, zeros + z], axis=1),
+    ], axis=1)
+    uvs = np.stack([
+        np.stack([zeros, zeros], axis=1),
+        np.stack([w, zeros], axis=1),
+        np.stack([w, h], axis=1),
+        np.stack([zeros, h], axis=1),
+    ], axis=1)
+    return _quads(corners, uvs, (0.0, 0.0, 1.0))
+
+
+def _side_faces(visible, axis, sign, z0, z1):
+    """Wall sides facing +/- x (axis 0) or +/- y (axis 1), merged along the wall.
+
+    :param visible: (rows, cols) mask of cells whose side in this direction is visible
+    """
+    if axis == 0:
+        # Faces perpendicular to x are merged along y, i.e. runs down each column
+        cols, first, last = _runs(visible.T)
+        plane = cols + 0.5 * sign
+        a0, a1 = first - 0.5, last + 0.5
+    else:
+        rows, first, last = _runs(visible)
+        plane = rows + 0.5 * sign
+        a0, a1 = first - 0.5, last + 0.5
+    length = last - first + 1
+    zeros = np.zeros(len(plane))
+    lo, hi = zeros + z0, zeros + z1
+    # Corner order keeps triangles counter-clockwise seen from outside
+    if axis == 0:
+        start, end = (a0, a1) if sign > 0 else (a1, a0)
+        corners = np.stack([
+            np.stack([plane, start, lo], axis=1),
+            np.stack([plane, end, lo], axis=1),
+            np.stack([plane, end, hi], axis=1),
+            np.stack([plane, start, hi], axis=1),
+        ], axis=1)
+        normal = (float(sign), 0.0, 0.0)
+    else:
+        start, end = (a1, a0) if sign > 0 else (a0, a1)
+        corners = np.stack([
+            np.stack([start, plane, lo], axis=1),
+            np.stack([end, plane, lo], axis=1),
+            np.stack([end, plane, hi], axis=1),
+            np.stack([start, plane, hi], axis=1),
+        ], axis=1)
+        normal = (0.0, float(sign), 0.0)
+    uvs = np.stack([
+        np.stack([zeros, zeros], axis=1),
+        np.stack([length, zeros], axis=1),
+        np.stack([length, zeros + 1.0], axis=1),
+        np.stack([zeros, zeros + 1.0], axis=1),
+    ], axis=1)
+    return _quads(corners, uvs, normal)
+
+
+def _wall_mesh(walls, padded_solid, z0, z1, origin=(0, 0)):
+    """:param padded_solid: solid mask with a one cell border around the walls window"""
+    parts = [
+        _top_faces(walls, z1),
+        _side_faces(walls & ~padded_solid[1:-1, 2:], 0, 1, z0, z1),
+        _side_faces(walls & ~padded_solid[1:-1, :-2], 0, -1, z0, z1),
+        _side_faces(walls & ~padded_solid[2:, 1:-1], 1, 1, z0, z1),
+        _side_faces(walls & ~padded_solid[:-2, 1:-1], 1, -1, z0, z1),
+    ]
+    vertex_data = np.concatenate(parts)
+    vertex_data[:, 0] += origin[1]
+    vertex_data[:, 1] += origin[0]
+    quad_count = len(vertex_data) // 4
+    indices = (QUAD_INDICES[np.newaxis, :] + 4 * np.arange(quad_count)[:, np.newaxis]).ravel()
+    return MeshData("walls", vertex_data, indices.astype(index_dtype(len(vertex_data))))
+
+
+def _pad(solid):
+    padded = np.zeros((solid.shape[0] + 2, solid.shape[1] + 2), dtype=bool)
+    padded[1:-1, 1:-1] = solid
+    return padded
+
+
+def build_wall_mesh(walls, solid=None, z0=-0.5, z1=0.5, origin=(0, 0)):
+    """Mesh for unit wall blocks placed on a grid, without hidden faces.
+
+    Faces between two solid cells and block bottoms are dropped, the remaining coplanar
+    faces are merged into larger quads.
+
+    :param walls: (rows, cols) bool mask of cells to build blocks for (row = y, col = x)
+    :param solid: mask of cells hiding a neighbour's face, defaults to walls. It may also have a
+        one cell border around walls (shape + 2) so faces against cells outside the window are hidden too
+    :param origin: (row, col) of the first walls cell
+    :return: MeshData with texture coordinates repeating once per cell
+    """
+    walls = np.asarray(walls, dtype=bool)
+    solid = walls if solid is None else np.asarray(solid, dtype=bool)
+    if solid.shape != (walls.shape[0] + 2, walls.shape[1] + 2):
+        solid = _pad(solid)
+    return _wall_mesh(walls, solid, z0, z1, origin)
+
+
+def build_chunked_wall_meshes(walls, solid=None, chunk_size=32, z0=-0.5, z1=0.5):
+    """Same as build_wall_mesh, but quads never cross the borders of chunk_size x chunk_size cell chunks.
+
+    :return: list of ((chunk row, chunk col), MeshData), empty chunks are skipped
+    """
+    walls = np.asarray(walls, dtype=bool)
+    padded = _pad(walls if solid is None else np.asarray(solid, dtype=bool))
+    meshes = []
+    for row in range(0, walls.shape[0], chunk_size):
+        for col in range(0, walls.shape[1], chunk_size):
+            window = walls[row:row + chunk_size, col:col + chunk_size]
+            if not window.any():
+                continue
+            rows, cols = window.shape
+            solid_window = padded[row:row + rows + 2, col:col + cols + 2]
+            meshes.append(((row // chunk_size, col // chunk_size), _wall_mesh(window, solid_window, z0, z1, (row, col))))
+    return meshes
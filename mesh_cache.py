@@ -0,0 +1,151 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import settings
+
+MESH_CACHE_FOLDER = os.path.join(".", "cache", "meshes")
+MESH_CACHE_VERSION = 2
+
+
+class MeshData:
+    """Preprocessed mesh ready to be uploaded: interleaved vertices, indices and bounds"""
+    def __init__(self, object_name, vertex_data, indices, bounds_min=None, bounds_max=None):
+        self.object_name = object_name
+        self.vertex_data = vertex_data
+        self.indices = indices
+        if bounds_min is None or bounds_max is None:
+            bounds_min = vertex_data[:, :3].min(axis=0) if len(vertex_data) else np.zeros(3)
+            bounds_max = vertex_data[:, :3].max(axis=0) if len(vertex_data) else np.zeros(3)
+        self.bounds_min = np.asarray(bounds_min, dtype=np.float32)
+        self.bounds_max = np.asarray(bounds_max, dtype=np.float32)
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def cache_paths(name, folder=MESH_CACHE_FOLDER):
+    base = os.path.join(folder, name)
+    return base + ".json", base + ".vertices.npy", base + ".indices.npy"
+
+
+def write_cache_entry(meta_path, meta, write_data):
+    """Replace a cache entry whose metadata is at meta_path.
+
+    Readers only trust an entry with metadata, so the old metadata goes first and the new one is
+    written after the data. An interrupted write leaves no entry instead of a torn one.
+    :param write_data: writes the data files of the entry
+    """
+    os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    write_data()
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+
+
+def read_cache(name, source_path, folder=MESH_CACHE_FOLDER):
+    """Memory map a cached mesh, or return None if it is missing or stale"""
+    meta_path, vertices_path, indices_path = cache_paths(name, folder)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if meta['version'] != MESH_CACHE_VERSION:
+            return None
+        stat = os.stat(source_path)
+        if meta['source_mtime'] != stat.st_mtime or meta['source_size'] != stat.st_size:
+            # Touched file, only rebuild if the content changed too
+            if meta['source_hash'] != file_hash(source_path):
+                return None
+            meta['source_mtime'] = stat.st_mtime
+            meta['source_size'] = stat.st_size
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+        vertex_data = np.load(vertices_path, mmap_mode='r')
+        indices = np.load(indices_path, mmap_mode='r')
+        return MeshData(meta['object_name'], vertex_data, indices, meta['bounds_min'], meta['bounds_max'])
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        if settings.DEBUG:
+            print(f"Mesh cache for {name} unreadable: {e}")
+        return None
+
+
+def write_cache(name, source_path, mesh, folder=MESH_CACHE_FOLDER):
+    meta_path, vertices_path, indices_path = cache_paths(name, folder)
+    stat = os.stat(source_path)
+    meta = {
+        'version': MESH_CACHE_VERSION,
+        'object_name': mesh.object_name,
+        'source_hash': file_hash(source_path),
+        'source_mtime': stat.st_mtime,
+        'source_size': stat.st_size,
+        'bounds_min': mesh.bounds_min.tolist(),
+        'bounds_max': mesh.bounds_max.tolist(),
+    }
+
+    def write_data():
+        np.save(vertices_path, np.ascontiguousarray(mesh.vertex_data))
+        np.save(indices_path, np.ascontiguousarray(mesh.indices))
+    write_cache_entry(meta_path, meta, write_data)
+
+
+def prebuild(objects_folder, folder=MESH_CACHE_FOLDER):
+    from obj_loader import build_mesh
+
+    for source_path in sorted(glob.glob(os.path.join(objects_folder, "*.obj"))):
+        name = os.path.splitext(os.path.basename(source_path))[0]
+        mesh = build_mesh(source_path)
+        if mesh:
+            write_cache(name, source_path, mesh, folder)
+            print(f"{name}: {len(mesh.vertex_data)} vertices, {len(mesh.indices)} indices")
+
+
+def compare(objects_folder, folder=MESH_CACHE_FOLDER, repeat=5):
+    """Time building every mesh from .obj text against loading it from the cache"""
+    from obj_loader import build_mesh
+
+    print(f"{'asset':>12} {'parse':>10} {'cache':>10} {'speedup':>8}")
+    total_parse = total_cache = 0.0
+    for source_path in sorted(glob.glob(os.path.join(objects_folder, "*.obj"))):
+        name = os.path.splitext(os.path.basename(source_path))[0]
+        start = time.perf_counter()
+        for _ in range(repeat):
+            build_mesh(source_path)
+        parse_time = (time.perf_counter() - start) / repeat
+        start = time.perf_counter()
+        for _ in range(repeat):
+            mesh = read_cache(name, source_path, folder)
+        cache_time = (time.perf_counter() - start) / repeat
+        if mesh is None:
+            print(f"{name:>12} not cached, run with --prebuild first")
+            continue
+        total_parse += parse_time
+        total_cache += cache_time
+        print(f"{name:>12} {parse_time * 1000:>8.2f}ms {cache_time * 1000:>8.2f}ms {parse_time / cache_time:>7.1f}x")
+    if total_cache:
+        print(f"{'total':>12} {total_parse * 1000:>8.2f}ms {total_cache * 1000:>8.2f}ms {total_parse / total_cache:>7.1f}x")
+
+
+if __name__ == "__main__":
+    from obj_loader import BASE_OBJECTS_FOLDER
+
+    parser = argparse.ArgumentParser(description="Prebuild the binary mesh cache")
+    parser.add_argument("--objects", default=BASE_OBJECTS_FOLDER, help="folder with .obj files")
+    parser.add_argument("--cache", default=MESH_CACHE_FOLDER, help="cache folder")
+    parser.add_argument("--prebuild", action="store_true", help="(re)build cache entries for every .obj file")
+    parser.add_argument("--compare", action="store_true", help="compare parse and cache load times")
+    args = parser.parse_args()
+    if not args.prebuild and not args.compare:
+        args.prebuild = True
+    if args.prebuild:
+        prebuild(args.objects, args.cache)
+    if args.compare:
+        compare(args.objects, args.cache)
@@ -0,0 +1,127 @@
+import numpy as np
+
+VERTEX_CACHE_SIZE = 32
+
+
+def index_dtype(vertex_count):
+    """Smallest index type able to address vertex_count vertices"""
+    return np.uint16 if vertex_count <= np.iinfo(np.uint16).max + 1 else np.uint32
+
+
+def weld_vertices(vertex_data, indices):
+    """Merge identical vertices (same position, texture coordinate and normal).
+
+    :return: unique vertices in first-use order and indices pointing into them
+    """
+    vertex_data = np.asarray(vertex_data)
+    if not len(vertex_data):
+        return vertex_data.copy(), np.asarray(indices).copy()
+    _, first, inverse = np.unique(vertex_data, axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    welded = vertex_data[first[order]]
+    new_indices = rank[inverse.reshape(-1)][np.asarray(indices)]
+    return welded, new_indices.astype(index_dtype(len(welded)))
+
+
+def reorder_vertices(vertex_data, indices):
+    """Renumber vertices in the order the index buffer first uses them"""
+    indices = np.asarray(indices)
+    _, first = np.unique(indices, return_index=True)
+    used = indices[np.sort(first)]
+    remap = np.zeros(len(vertex_data), dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    return vertex_data[used], remap[indices].astype(indices.dtype)
+
+
+def _vertex_score(cache_position, remaining, cache_size):
+    if remaining == 0:
+        return -1.0
+    score = 0.0
+    if cache_position >= 0:
+        if cache_position < 3:
+            # The last triangle's vertices are penalised so strips don't get stuck
+            score = 0.75
+        else:
+            score = (1.0 - (cache_position - 3) / (cache_size - 3)) ** 1.5
+    return score + 2.0 * remaining ** -0.5
+
+
+def optimize_vertex_cache(indices, vertex_count, cache_size=VERTEX_CACHE_SIZE):
+    """Reorder triangles for post-transform vertex cache hits (Forsyth's linear-speed algorithm)"""
+    triangles = np.asarray(indices).reshape(-1, 3)
+    triangle_count = len(triangles)
+    if not triangle_count:
+        return np.asarray(indices).copy()
+    tris = triangles.tolist()
+    vertex_triangles = [[] for _ in range(vertex_count)]
+    for t, tri in enumerate(tris):
+        for v in tri:
+            vertex_triangles[v].append(t)
+    cache_position = [-1] * vertex_count
+    vertex_scores = [_vertex_score(-1, len(vertex_triangles[v]), cache_size) for v in range(vertex_count)]
+    triangle_scores = [sum(vertex_scores[v] for v in tri) for tri in tris]
+    emitted = [False] * triangle_count
+    cache = []
+    order = []
+
+    best = max(range(triangle_count), key=triangle_scores.__getitem__)
+    for _ in range(triangle_count):
+        if best < 0:
+            # Nothing adjacent left in the cache, take the best remaining triangle
+            best = max((t for t in range(triangle_count) if not emitted[t]), key=triangle_scores.__getitem__)
+        tri = tris[best]
+        emitted[best] = True
+        order.append(best)
+        for v in tri:
+            vertex_triangles[v].remove(best)
+
+        cache = tri + [v for v in cache if v not in tri]
+        evicted = cache[cache_size:]
+        cache = cache[:cache_size]
+        for v in evicted:
+            cache_position[v] = -1
+        for i, v in enumerate(cache):
+            cache_position[v] = i
+        for v in cache + evicted:
+            vertex_scores[v] = _vertex_score(cache_position[v], len(vertex_triangles[v]), cache_size)
+
+        best = -1
+        best_score = -1.0
+        for v in cache:
+            for t in vertex_triangles[v]:
+                score = sum(vertex_scores[u] for u in tris[t])
+                triangle_scores[t] = score
+                if score > best_score:
+                    best, best_score = t, score
+        for v in evicted:
+            for t in vertex_triangles[v]:
+                triangle_scores[t] = sum(vertex_scores[u] for u in tris[t])
+
+    return triangles[order].reshape(-1)
+
+
+def average_cache_miss_ratio(indices, cache_size=VERTEX_CACHE_SIZE):
+    """Vertex shader invocations per triangle for a FIFO cache of cache_size entries"""
+    indices = np.asarray(indices).tolist()
+    if not indices:
+        return 0.0
+    cache = []
+    misses = 0
+    for v in indices:
+        if v not in cache:
+            misses += 1
+            cache.append(v)
+            if len(cache) > cache_size:
+                cache.pop(0)
+    return misses / (len(indices) / 3)
+
+
+def optimize_mesh(vertex_data, indices, reorder=True):
+    """Weld duplicated vertices and, optionally, reorder for vertex cache locality"""
+    vertex_data, indices = weld_vertices(vertex_data, indices)
+    if reorder:
+        indices = optimize_vertex_cache(indices, len(vertex_data)).astype(indices.dtype)
+        vertex_data, indices = reorder_vertices(vertex_data, indices)
+    return vertex_data, indices
@@ -2,60 +2,93 @@ from OpenGL.GL import *
 import numpy as np
 import settings
 from materials import Material
+from texturemanager import load_texture, load_texture_array
+from mesh_optimizer import index_dtype
+from frustum import frustum_planes, boxes_in_frustum
+from collision import SimpleBoundingBox
+from renderer import STATE, RENDER_QUEUE, buffer_data, buffer_sub_data
 
 MODEL_TEXTURE_SLOT = 2
+# Outside of the u_Textures[8] units, samplers of different types can't share a unit
+TEXTURE_ARRAY_SLOT = 8
 
 MODEL_STATIC = 0
 MODEL_DYNAMIC = 1
 
+# Static map tile: prototype id + world position
+TILE_DTYPE = np.dtype([('prototype', np.uint16), ('position', np.float32, 3)])
+
 
 class VertexBuffer:
     def __init__(self, data, size):
         self.m_renderer_id = glGenBuffers(1)  # VBO
-        glBindBuffer(GL_ARRAY_BUFFER, self.m_renderer_id)
-        glBufferData(GL_ARRAY_BUFFER, size, data, GL_STATIC_DRAW)
+        STATE.bind_buffer(GL_ARRAY_BUFFER, self.m_renderer_id)
+        buffer_data(GL_ARRAY_BUFFER, size, data)
 
     def destroy(self):
         if settings.DEBUG:
             print(f"Delete vb: {self.m_renderer_id}")
-        glDeleteBuffers(1, [self.m_renderer_id])
+        STATE.delete_buffer(self.m_renderer_id)
 
     def bind(self):
-        glBindBuffer(GL_ARRAY_BUFFER, self.m_renderer_id)
+        STATE.bind_buffer(GL_ARRAY_BUFFER, self.m_renderer_id)
 
     @staticmethod
     def unbind():
-        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        STATE.bind_buffer(GL_ARRAY_BUFFER, 0)
 
     def change_data(self, data, size):
-        glBindBuffer(GL_ARRAY_BUFFER, self.m_renderer_id)
-        glBufferData(GL_ARRAY_BUFFER, size, data, GL_STATIC_DRAW)
+        STATE.bind_buffer(GL_ARRAY_BUFFER, self.m_renderer_id)
+        buffer_data(GL_ARRAY_BUFFER, size, data)
 
 
 class IndexBuffer:
     def __init__(self, data, count):
         self.m_renderer_id = glGenBuffers(1)  # IBO
         self.m_count = count
-        data = np.array(data, dtype=np.int32)
-        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.m_renderer_id)
-        glBufferData(GL_ELEMENT_ARRAY_BUFFER, data.nbytes, data, GL_STATIC_DRAW)
+        data = np.asarray(data)
+        if data.dtype != np.uint16:
+            data = data.astype(np.uint32)
+        self.index_type = GL_UNSIGNED_SHORT if data.dtype == np.uint16 else GL_UNSIGNED_INT
+        self.index_size = data.dtype.itemsize
+        STATE.bind_buffer(GL_ELEMENT_ARRAY_BUFFER, self.m_renderer_id)
+        buffer_data(GL_ELEMENT_ARRAY_BUFFER, data.nbytes, data)
 
     def destroy(self):
         if settings.DEBUG:
             print(f"Delete ib: {self.m_renderer_id}")
-        glDeleteBuffers(1, [self.m_renderer_id])
+        STATE.delete_buffer(self.m_renderer_id)
 
     def bind(self):
-        glBindBuffer(GL_ARRAY_BUFFER, self.m_renderer_id)
+        STATE.bind_buffer(GL_ELEMENT_ARRAY_BUFFER, self.m_renderer_id)
 
     @staticmethod
     def unbind():
-        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        STATE.bind_buffer(GL_ELEMENT_ARRAY_BUFFER, 0)
 
     def get_count(self):
         return self.m_count
 
 
+class UniformBuffer:
+    """Uniform block storage shared by every program declaring the block at the same binding point"""
+    def __init__(self, size, binding):
+        self.m_renderer_id = glGenBuffers(1)  # UBO
+        self.binding = binding
+        STATE.bind_buffer(GL_UNIFORM_BUFFER, self.m_renderer_id)
+        buffer_data(GL_UNIFORM_BUFFER, size, None, GL_DYNAMIC_DRAW)
+        glBindBufferBase(GL_UNIFORM_BUFFER, binding, self.m_renderer_id)
+
+    def destroy(self):
+        if settings.DEBUG:
+            print(f"Delete ub: {self.m_renderer_id}")
+        STATE.delete_buffer(self.m_renderer_id)
+
+    def change_data(self, data, offset=0):
+        STATE.bind_buffer(GL_UNIFORM_BUFFER, self.m_renderer_id)
+        buffer_sub_data(GL_UNIFORM_BUFFER, offset, data.nbytes, data)
+
+
 class VertexBufferElement:
     def __init__(self, var_type, count, normalized):
         self.var_type = var_type
@@ -99,111 +132,97 @@ class VertexBufferLayout:
 class VertexArray:
     def __init__(self):
         self.m_renderer_id = glGenVertexArrays(1)  # VAO
-        glBindVertexArray(self.m_renderer_id)
+        STATE.bind_vertex_array(self.m_renderer_id)
 
     def destroy(self):
         if settings.DEBUG:
             print(f"Delete va: {self.m_renderer_id}")
-        glDeleteVertexArrays(1, [self.m_renderer_id])
+        STATE.delete_vertex_array(self.m_renderer_id)
 
     def bind(self):
-        glBindVertexArray(self.m_renderer_id)
+        STATE.bind_vertex_array(self.m_renderer_id)
 
     @staticmethod
     def unbind():
-        glBindVertexArray(0)
+        STATE.bind_vertex_array(0)
 
-    def add_buffer(self, vb: VertexBuffer, layout: VertexBufferLayout):
+    def add_buffer(self, vb: VertexBuffer, layout: VertexBufferLayout, first_index=0, divisor=0):
+        """
+        :param first_index: attribute location of the first layout element
+        :param divisor: 0 for per-vertex data, 1 for per-instance data
+        """
         self.bind()
         vb.bind()
         elements = layout.get_elements()
         offset = 0
-        for i, element in enumerate(elements):
+        for i, element in enumerate(elements, first_index):
             glEnableVertexAttribArray(i)
             glVertexAttribPointer(i, element.count, element.var_type, element.normalized,
                                   layout.get_stride(), ctypes.c_void_p(offset))
+            if divisor:
+                glVertexAttribDivisor(i, divisor)
             offset += element.count * element.get_size_of_type()
 
 
-class Vertex:
-    def __init__(self, x, y, z, u, v, nx, ny, nz):
-        self._vars = np.array([x, y, z, u, v, nx, ny, nz], dtype=np.float32)
-        self.x = x
-        self.y = y
-        self.z = z
-        self.u = u
-        self.v = v
-        self.nx = nx
-        self.ny = ny
-        self.nz = nz
-
-    def __getitem__(self, item):
-        return self._vars[item]
-
-    def __add__(self, other):
-        return self._vars + other
+class VertexStore:
+    """Contiguous (N, 8) float32 vertex storage: position 3, texture coordinate 2, normal 3"""
+    STRIDE = 8
 
+    def __init__(self, data=None, capacity=0):
+        self._data = np.empty((capacity, self.STRIDE), dtype=np.float32)
+        self._count = 0
+        if data is not None:
+            self.append(data)
 
-class VertexList:
-    def __init__(self):
-        self._list = []
-        self.min_x = 0.0
-        self.min_y = 0.0
-        self.min_z = 0.0
-        self.max_x = 0.0
-        self.max_y = 0.0
-        self.max_z = 0.0
-
-    def add_vertex(self, vertex):
-        if vertex.x < self.min_x:
-            self.min_x = vertex.x
-        elif vertex.x > self.max_x:
-            self.max_x = vertex.x
-        elif vertex.y < self.min_y:
-            self.min_y = vertex.y
-        elif vertex.y > self.max_y:
-            self.max_y = vertex.y
-        elif vertex.z < self.min_z:
-            self.min_z = vertex.z
-        elif vertex.z > self.max_z:
-            self.max_z = vertex.z
-        self._list.append(vertex)
-
-    def get_delta(self, x=0.0, y=0.0, z=0.0):
-        delta = np.array([x, y, z, 0.0, 0.0, 0.0, 0.0, 0.0])
-        flat_list = []
-        for v in self._list:
-            flat_list += list((v + delta))
-        return np.array(flat_list, dtype=np.float32)
+    @property
+    def data(self):
+        return self._data[:self._count]
+
+    def append(self, vertices):
+        vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, self.STRIDE)
+        new_count = self._count + len(vertices)
+        if new_count > len(self._data):
+            grown = np.empty((max(new_count, 2 * len(self._data)), self.STRIDE), dtype=np.float32)
+            grown[:self._count] = self.data
+            self._data = grown
+        self._data[self._count:new_count] = vertices
+        self._count = new_count
+
+    def translated(self, x=0.0, y=0.0, z=0.0):
+        """:return copy of the vertices with positions moved by (x, y, z)"""
+        data = self.data.copy()
+        data[:, :3] += np.array([x, y, z], dtype=np.float32)
+        return data
+
+    def bounding_box(self):
+        """Box around the vertices and the local origin, models always collided from their origin on"""
+        if not self._count:
+            return SimpleBoundingBox(0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        min_x, min_y, min_z = (min(float(v), 0.0) for v in self.data[:, :3].min(axis=0))
+        max_x, max_y, max_z = (max(float(v), 0.0) for v in self.data[:, :3].max(axis=0))
+        return SimpleBoundingBox(min_x, min_y, min_z, max_x, max_y, max_z)
 
     def count(self):
-        return len(self._list)
+        return self._count
 
-    def __iter__(self):
-        return self._list.__iter__()
+    def __len__(self):
+        return self._count
 
 
 class ModelData3D:
-    def __init__(self, parent, vertices, texture_coordinates, normals, faces, texture, initialize_gl=False):
+    def __init__(self, parent, vertex_data, indices, texture, initialize_gl=False):
         self.parent = parent
         self.texture = texture
-        self.vertex_list = VertexList()
-        indices = []
-        for face in faces:
-            for vi, vt, vn in face:
-                # Vertex Index/Texture/Normal
-                v = Vertex(*vertices[vi], *texture_coordinates[vt], *normals[vn])  # 3 2 3
-                self.vertex_list.add_vertex(v)
-                indices.append(self.vertex_list.count() - 1)
-
-        indices = np.array(indices, dtype=np.int32)
+        self.vertex_store = VertexStore(vertex_data)  # 3 2 3
+
+        self.indices = np.asarray(indices)
         self.initialize_gl = initialize_gl
         if self.initialize_gl:
             # Generate Vertex Array Object
             self.va = VertexArray()
 
             # Generate Vertex Buffer Object
-            vertex_lis_flat = self.vertex_list.get_delta(self.position.x, self.position.y, self.position.z)
+            vertex_lis_flat = self.vertex_store.translated(self.position.x, self.position.y, self.position.z)
             self.vb = VertexBuffer(vertex_lis_flat, vertex_lis_flat.nbytes)
             self.layout = VertexBufferLayout()
             self.layout.push_float(3)  # Vertex Position
@@ -213,18 +232,16 @@ class ModelData3D:
             self.va.add_buffer(self.vb, self.layout)
 
             # Generate Indices Buffer Object
-            self.ib = IndexBuffer(indices, len(indices))
+            self.ib = IndexBuffer(self.indices, len(self.indices))
 
         # update bounding box
-        self.bounding_box = SimpleBoundingBox(
-            min_x=self.vertex_list.min_x,
-            min_y=self.vertex_list.min_y,
-            min_z=self.vertex_list.min_z,
-            max_x=self.vertex_list.max_x,
-            max_y=self.vertex_list.max_y,
-            max_z=self.vertex_list.max_z,
-        )
+        self.bounding_box = self.vertex_store.bounding_box()
         self.position_changed = False
+        # Reused every frame, the queued uniforms refer to delta_position and see it change
+        self.delta_position = np.zeros(4, dtype=np.float32)
+        self.textures = ((MODEL_TEXTURE_SLOT, GL_TEXTURE_2D, self.texture),)
+        self.uniforms = None
+        self.uniforms_material = None
 
     @property
     def position(self):
@@ -250,73 +267,62 @@ class ModelData3D:
 
     def calculate_vertices_pos(self):
         pass
-        # new_pos = self.vertex_list.get_delta(self.position.x, self.position.y, self.position.z)
+        # new_pos = self.vertex_store.translated(self.position.x, self.position.y, self.position.z)
         # if self.initialize_gl:
         #     self.vb.change_data(new_pos, new_pos.nbytes)
 
     def rotate(self):
         pass
 
-    def render(self, shader):
+    def render(self, shader, alpha=1.0, material=None):
+        """Queue the model on RENDER_QUEUE at its interpolated position"""
         if self.initialize_gl:
 
             if self.position_changed:
                 self.calculate_vertices_pos()
                 self.position_changed = False
-            pos = np.array([self.position.x, self.position.y, self.position.z, 0.0], dtype=np.float32)
-            shader.set_uniform_4fv("DeltaPosition", pos)
-            glActiveTexture(GL_TEXTURE0 + MODEL_TEXTURE_SLOT)
-            glBindTexture(GL_TEXTURE_2D, self.texture)
-            shader.bind()
-            shader.set_uniform_1f('TextureIndex', MODEL_TEXTURE_SLOT)
-            self.va.bind()
-            self.ib.bind()
-            glDrawElements(GL_TRIANGLES, self.ib.get_count(), GL_UNSIGNED_INT, None)
+            self.parent.render_position(alpha, self.delta_position)
+            if self.uniforms is None or material is not self.uniforms_material:
+                self.uniforms = (
+                    ("set_uniform_4fv", "DeltaPosition", self.delta_position),
+                    ("set_uniform_1f", "TextureIndex", MODEL_TEXTURE_SLOT),
+                    ("set_uniform_1i", "u_TextureArray", TEXTURE_ARRAY_SLOT),
+                    ("set_uniform_1i", "UseTextureArray", 0),
+                ) + (material.uniforms() if material is not None else ())
+                self.uniforms_material = material
+            RENDER_QUEUE.submit(shader, self.va, self.ib, self.textures, self.uniforms)
 
         else:
             print("Element is static")
 
 
-class SimpleBoundingBox:
-    def __init__(self, min_x, min_y, min_z, max_x, max_y, max_z):
-        self.min_x = min_x
-        self.min_y = min_y
-        self.min_z = min_z
-        self.max_x = max_x
-        self.max_y = max_y
-        self.max_z = max_z
-
-    @property
-    def width(self):
-        return self.max_x - self.min_x
-
-    @property
-    def height(self):
-        return self.max_y - self.min_y
-
-    @property
-    def depth(self):
-        return self.max_z - self.min_z
-
-    @property
-    def x(self):
-        return self.min_x + self.width / 2
+class MeshPrototype:
+    """Geometry parsed once per asset and shared by every tile using it"""
+    def __init__(self, prototype_id, name, mesh, texture_path):
+        self.id = prototype_id
+        self.name = name
+        self.object_name = mesh.object_name
+        self.mesh = mesh
+        self.texture_path = texture_path
+        self._texture = None
+        self.geometry = ModelData3D(
+            parent=None,
+            vertex_data=mesh.vertex_data,
+            indices=mesh.indices,
+            texture=None,
+            initialize_gl=False,
+        )
 
     @property
-    def y(self):
-        return self.min_y + self.height / 2
+    def texture(self):
+        # Textures need a GL context, so they are only loaded once something renders
+        if self._texture is None:
+            self._texture = load_texture(self.texture_path)
+        return self._texture
 
     @property
-    def z(self):
-        return self.min_z + self.depth / 2
-
-    def update_box(self, min_x=None, min_y=None, min_z=None, max_x=None, max_y=None, max_z=None):
-        self.min_x = min_x or self.min_x
-        self.min_y = min_y or self.min_y
-        self.min_z = min_z or self.min_z
-        self.max_x = max_x or self.max_x
-        self.max_y = max_y or self.max_y
-        self.max_z = max_z or self.max_z
+    def bounding_box(self):
+        return self.geometry.bounding_box
 
 
 class Model3D:
@@ -336,6 +342,9 @@ class Model3D:
             self.controller = None
 
         self.transform = ModelTransform(self)
+        # Transform at the start of the current simulation tick, rendering interpolates from it.
+        # Models never stored (e.g. ones that don't move) are drawn at their transform
+        self.previous_transform = None
         self.rotation = ModelRotation(self)
         self.material = Material()
         # Physics
@@ -360,11 +369,27 @@ class Model3D:
     def get_controller(self):
         return self.controller
 
-    def render(self, shader):
+    def store_previous_transform(self):
+        self.previous_transform = Transform(self.transform.x, self.transform.y, self.transform.z)
+
+    def render_position(self, alpha=1.0, out=None):
+        """Position between the previous and current tick, alpha = 1 is the current one
+
+        :param out: float32 array of 4 to write the position to instead of a new one
+        """
+        current = self.transform
+        previous = self.previous_transform or current
+        if out is None:
+            out = np.zeros(4, dtype=np.float32)
+        out[0] = previous.x + (current.x - previous.x) * alpha
+        out[1] = previous.y + (current.y - previous.y) * alpha
+        out[2] = previous.z + (current.z - previous.z) * alpha
+        return out
+
+    def render(self, shader, alpha=1.0):
         if self.visible and self.geometry:
 
-            self.material.bind_material(shader)
-            self.geometry.render(shader)
+            self.geometry.render(shader, alpha, self.material)
 
     def set_geometry(self, geometry):
         self.geometry = geometry
@@ -515,59 +540,204 @@ class Controller:
 
 
 class BatchModels:
-    def __init__(self, objects: [Model3D]):
-        self.vertex_list = VertexList()
-        self.texture = None
+    """All static tiles baked into one vertex buffer and drawn with a single call.
+
+    Tile textures are layers of one texture array, every vertex carries its layer index.
+    """
+    LAYER_ATTRIBUTE = 4  # in_layer in the advanced shader
+
+    def __init__(self, tiles, prototypes, meshes=(), chunk_size=None, texture_paths=()):
+        """
+        :param tiles: array of TILE_DTYPE records
+        :param prototypes: prototype id -> MeshPrototype
+        :param meshes: extra (MeshData, texture path) pairs already in world space
+        :param chunk_size: split triangles into chunk_size x chunk_size cell chunks for frustum culling
+        :param texture_paths: first layers of the texture array, lets several batches share one array
+        """
         self.material = Material()
-        indices = []
-        for obj in objects:
-            if obj.model_type == MODEL_STATIC:
-                geometry = obj.geometry
-                if isinstance(geometry, ModelData3D):
-                    self.texture = geometry.texture
-                    vertex_list = geometry.vertex_list
-                    for vertex in vertex_list:
-                        delta = np.array([obj.transform.x, obj.transform.y, obj.transform.z, 0.0, 0.0, 0.0, 0.0, 0.0])
-                        vertex_vars = vertex + delta
-                        new_vertex = Vertex(*vertex_vars)
-                        self.vertex_list.add_vertex(new_vertex)
-                        indices.append(self.vertex_list.count() - 1)
-
-        indices = np.array(indices, dtype=np.int32)
+        prototype_ids = np.unique(tiles['prototype'])
+        sizes = [len(prototypes[p].geometry.vertex_store) * np.count_nonzero(tiles['prototype'] == p)
+                 for p in prototype_ids]
+        sizes += [len(mesh.vertex_data) for mesh, _ in meshes]
+        self.vertex_store = VertexStore(capacity=sum(sizes))
+        self.layers = np.empty(sum(sizes), dtype=np.float32)
+        texture_paths = list(texture_paths)
+        index_blocks = []
+
+        def add_vertices(vertices, mesh_indices, texture_path):
+            """Append (copies, vertices, 8) vertex blocks sharing one index pattern"""
+            if texture_path not in texture_paths:
+                texture_paths.append(texture_path)
+            first_vertex = self.vertex_store.count()
+            first = first_vertex + np.arange(vertices.shape[0], dtype=np.int64) * vertices.shape[1]
+            index_blocks.append((np.asarray(mesh_indices)[np.newaxis, :] + first[:, np.newaxis]).ravel())
+            self.vertex_store.append(vertices)
+            self.layers[first_vertex:self.vertex_store.count()] = texture_paths.index(texture_path)
+
+        for prototype_id in prototype_ids:
+            prototype = prototypes[prototype_id]
+            geometry = prototype.geometry
+            mesh = geometry.vertex_store.data
+            positions = tiles['position'][tiles['prototype'] == prototype_id]
+            # Every tile gets a copy of the prototype mesh moved to its position
+            vertices = np.broadcast_to(mesh, (len(positions),) + mesh.shape).copy()
+            vertices[:, :, :3] += positions[:, np.newaxis, :]
+            add_vertices(vertices, geometry.indices, prototype.texture_path)
+        for mesh, texture_path in meshes:
+            add_vertices(np.asarray(mesh.vertex_data)[np.newaxis], mesh.indices, texture_path)
+
+        indices = np.empty(0, dtype=index_dtype(sum(sizes)))
+        if index_blocks:
+            indices = np.concatenate(index_blocks).astype(indices.dtype)
+        self.chunk_first = self.chunk_count = None
+        self.chunks_drawn = 0
+        self.chunks_culled = 0
+        # (count, offset) index ranges visible with the camera's mvp_version ranges_version
+        self.ranges = []
+        self.ranges_version = None
+        if chunk_size and len(indices):
+            indices = self.split_chunks(indices, chunk_size)
+        self.texture = load_texture_array(texture_paths) if texture_paths else None
 
         # Generate Vertex Array Object
         self.va = VertexArray()
 
         # Generate Vertex Buffer Object
-        vertex_lis_flat = self.vertex_list.get_delta(0.0, 0.0, 0.0)
+        vertex_lis_flat = self.vertex_store.data
         self.vb = VertexBuffer(vertex_lis_flat, vertex_lis_flat.nbytes)
         self.layout = VertexBufferLayout()
         self.layout.push_float(3)  # Vertex Position
         self.layout.push_float(2)  # Texture Coordinate
         self.layout.push_float(3)  # Vertex Normal
-        # self.layout.push_float(1)  # Vertex Texture
         self.va.add_buffer(self.vb, self.layout)
 
+        self.layer_vb = VertexBuffer(self.layers, self.layers.nbytes)
+        layer_layout = VertexBufferLayout()
+        layer_layout.push_float(1)  # Vertex Texture
+        self.va.add_buffer(self.layer_vb, layer_layout, self.LAYER_ATTRIBUTE)
+
         # Generate Indices Buffer Object
         self.ib = IndexBuffer(indices, len(indices))
 
-    def render(self, shader):
-        glActiveTexture(GL_TEXTURE0 + MODEL_TEXTURE_SLOT)
-        glBindTexture(GL_TEXTURE_2D, self.texture)
-        shader.bind()
-        pos = np.array([0.0, 0.0, 0.0, 0.0], dtype=np.float32)
-        shader.set_uniform_4fv("DeltaPosition", pos)
-        self.material.bind_material(shader)
-        shader.set_uniform_1f('TextureIndex', MODEL_TEXTURE_SLOT)
-        self.va.bind()
-        self.ib.bind()
-        glDrawElements(GL_TRIANGLES, self.ib.get_count(), GL_UNSIGNED_INT, None)
+        self.textures = ((TEXTURE_ARRAY_SLOT, GL_TEXTURE_2D_ARRAY, self.texture),)
+        self.uniforms = (
+            ("set_uniform_4fv", "DeltaPosition", np.zeros(4, dtype=np.float32)),
+            ("set_uniform_1i", "u_TextureArray", TEXTURE_ARRAY_SLOT),
+            ("set_uniform_1i", "UseTextureArray", 1),
+        ) + self.material.uniforms()
+
+    def split_chunks(self, indices, chunk_size):
+        """Sort triangles by chunk so each chunk is one index range with its own bounding box"""
+        triangles = indices.reshape(-1, 3)
+        positions = self.vertex_store.data[:, :3]
+        centroids = positions[triangles, :2].mean(axis=1)
+        cells = np.floor(centroids + 0.5).astype(np.int64) // chunk_size
+        chunk_ids = cells[:, 1] * (cells[:, 0].max() + 1) + cells[:, 0]
+        order = np.argsort(chunk_ids, kind='stable')
+        triangles = triangles[order]
+        _, starts, counts = np.unique(chunk_ids[order], return_index=True, return_counts=True)
+        corners = positions[triangles]
+        self.chunk_min = np.minimum.reduceat(corners.min(axis=1), starts)
+        self.chunk_max = np.maximum.reduceat(corners.max(axis=1), starts)
+        self.chunk_first = starts * 3
+        self.chunk_count = counts * 3
+        return triangles.ravel()
+
+    def visible_ranges(self, mvp):
+        """Index ranges of the chunks inside the view frustum, neighbouring chunks merged"""
+        visible = boxes_in_frustum(frustum_planes(mvp), self.chunk_min, self.chunk_max)
+        self.chunks_drawn = int(np.count_nonzero(visible))
+        self.chunks_culled = len(visible) - self.chunks_drawn
+        edges = np.diff(np.concatenate(([0], visible.astype(np.int8), [0])))
+        first_chunks = np.flatnonzero(edges == 1)
+        last_chunks = np.flatnonzero(edges == -1) - 1
+        ends = self.chunk_first[last_chunks] + self.chunk_count[last_chunks]
+        return zip(self.chunk_first[first_chunks], ends - self.chunk_first[first_chunks])
+
+    def destroy(self):
+        self.ib.destroy()
+        self.layer_vb.destroy()
+        self.vb.destroy()
+        self.va.destroy()
+
+    def render(self, shader, camera=None):
+        """Queue the chunks inside the camera frustum on RENDER_QUEUE"""
+        if self.chunk_first is None or camera is None or camera.mvp is None:
+            RENDER_QUEUE.submit(shader, self.va, self.ib, self.textures, self.uniforms)
+            return
+        if camera.mvp_version != self.ranges_version:
+            self.ranges = [(int(count), ctypes.c_void_p(int(first) * self.ib.index_size))
+                           for first, count in self.visible_ranges(camera.mvp)]
+            self.ranges_version = camera.mvp_version
+        for count, offset in self.ranges:
+            RENDER_QUEUE.submit(shader, self.va, self.ib, self.textures, self.uniforms, count=count, offset=offset)
+
+
+class InstancedModels:
+    """Static tiles drawn with one instanced draw call per prototype.
+
+    Each prototype mesh is uploaded once, tiles only add a 12 byte position to the instance buffer.
+    """
+    INSTANCE_ATTRIBUTE = 3  # in_offset in the advanced shader
+
+    def __init__(self, tiles, prototypes):
+        self.material = Material()
+        self.groups = []
+        for prototype_id in np.unique(tiles['prototype']):
+            positions = np.ascontiguousarray(tiles['position'][tiles['prototype'] == prototype_id])
+            self.groups.append(InstanceGroup(prototypes[prototype_id], positions))
+        self.uniforms = (
+            ("set_uniform_4fv", "DeltaPosition", np.zeros(4, dtype=np.float32)),
+            ("set_uniform_1f", "TextureIndex", MODEL_TEXTURE_SLOT),
+            ("set_uniform_1i", "u_TextureArray", TEXTURE_ARRAY_SLOT),
+            ("set_uniform_1i", "UseTextureArray", 0),
+        ) + self.material.uniforms()
+
+    def destroy(self):
+        for group in self.groups:
+            group.destroy()
+
+    def render(self, shader, camera=None):
+        for group in self.groups:
+            group.render(shader, self.uniforms)
+
+
+class InstanceGroup:
+    def __init__(self, prototype, positions):
+        self.prototype = prototype
+        self.instance_count = len(positions)
+        geometry = prototype.geometry
+        vertex_data = geometry.vertex_store.data
+
+        self.va = VertexArray()
+        self.vb = VertexBuffer(vertex_data, vertex_data.nbytes)
+        layout = VertexBufferLayout()
+        layout.push_float(3)  # Vertex Position
+        layout.push_float(2)  # Texture Coordinate
+        layout.push_float(3)  # Vertex Normal
+        self.va.add_buffer(self.vb, layout)
+
+        self.instance_vb = VertexBuffer(positions, positions.nbytes)
+        instance_layout = VertexBufferLayout()
+        instance_layout.push_float(3)  # Instance Offset
+        self.va.add_buffer(self.instance_vb, instance_layout, InstancedModels.INSTANCE_ATTRIBUTE, divisor=1)
+
+        self.ib = IndexBuffer(geometry.indices, len(geometry.indices))
+        self.textures = ((MODEL_TEXTURE_SLOT, GL_TEXTURE_2D, prototype.texture),)
+
+    def destroy(self):
+        self.ib.destroy()
+        self.instance_vb.destroy()
+        self.vb.destroy()
+        self.va.destroy()
+
+    def render(self, shader, uniforms):
+        RENDER_QUEUE.submit(shader, self.va, self.ib, self.textures, uniforms, instance_count=self.instance_count)
 
 
 if __name__ == "__main__":
     # m = Model3D("elo", True, None, MODEL_STATIC)
     # c = m.get_controller()
     # c.move(y=5)
-    v = Vertex(1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0)
-    delta = np.array([1, 1, 1, 0.0, 0.0, 0.0, 0.0, 0.0])
-    print(v + delta)
+    v = VertexStore([1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0])
+    print(v.translated(1, 1, 1))
@@ -0,0 +1,113 @@
+import os
+
+import numpy as np
+import settings
+
+from collision import SimpleBoundingBox
+from mesh_cache import MeshData, read_cache, write_cache
+from mesh_optimizer import optimize_mesh
+
+BASE_OBJECTS_FOLDER = os.path.join(".", "graphics", "3d_objects")
+
+
+def parse_floats(lines, count):
+    """Convert attribute lines (without their prefix) into one (N, count) float32 array"""
+    data = np.fromstring(" ".join(lines), dtype=np.float32, sep=" ")
+    if data.size != len(lines) * count:
+        # Some lines carry optional components (e.g. "v x y z w"), keep the first ones
+        data = np.array([line.split()[:count] for line in lines], dtype=np.float32)
+    return data.reshape(-1, count)
+
+
+def parse_faces(lines):
+    """Convert "vi/vt/vn ..." face lines into zero based (F, corners, 3) uint32 index arrays"""
+    data = np.fromstring(" ".join(lines).replace("/", " "), dtype=np.int64, sep=" ") - 1
+    corners = np.array([line.count("/") // 2 for line in lines], dtype=np.int64)
+    if len(lines) and np.all(corners == corners[0]):
+        return data.astype(np.uint32).reshape(len(lines), corners[0], 3)
+    # Mixed polygon sizes, one array per face
+    return [face.reshape(-1, 3) for face in np.split(data.astype(np.uint32), np.cumsum(corners * 3)[:-1])]
+
+
+def parse_obj_lines(lines):
+    vertices = [line[2:] for line in lines if line.startswith('v ')]
+    tex_coords = [line[3:] for line in lines if line.startswith('vt ')]
+    normals = [line[3:] for line in lines if line.startswith('vn ')]
+    faces = [line[2:] for line in lines if line.startswith('f ')]
+    return {
+        'vertices': parse_floats(vertices, 3),
+        'tex_coords': parse_floats(tex_coords, 2),
+        'normals': parse_floats(normals, 3),
+        'faces': parse_faces(faces),
+    }
+
+
+def load_obj_file(filename):
+    if os.path.exists(filename):  # if file exists
+        objects = {}
+        with open(filename, 'r') as f:
+            lines = f.read().splitlines()
+        # Every "o" line starts a new object, attributes are parsed in bulk per object
+        starts = [i for i, line in enumerate(lines) if line.startswith('o ')]
+        for start, end in zip(starts, starts[1:] + [len(lines)]):
+            current_obj = lines[start][2:].strip()
+            objects[current_obj] = parse_obj_lines(lines[start + 1:end])
+
+        return len(objects.items()), objects
+    else:
+        print(filename)
+        print("File doesn't exists")
+        return None, None
+
+
+def interleave_faces(vertices, texture_coordinates, normals, faces):
+    """Build an interleaved (N, 8) float32 vertex buffer with one vertex per face corner.
+
+    :return: vertex data (position 3, texture coordinate 2, normal 3) and index array
+    """
+    if isinstance(faces, np.ndarray):
+        corners = faces.reshape(-1, 3)
+    else:
+        corners = np.concatenate(faces).reshape(-1, 3)
+    # Vertex Index/Texture/Normal
+    vertex_data = np.hstack([
+        vertices[corners[:, 0]],
+        texture_coordinates[corners[:, 1]],
+        normals[corners[:, 2]],
+    ]).astype(np.float32)
+    indices = np.arange(len(corners), dtype=np.int32)
+    return vertex_data, indices
+
+
+def build_mesh(obj_path, optimize=True):
+    _, objects = load_obj_file(obj_path)
+    if objects:
+        k = list(objects.keys())[0]
+        obj = objects[k]  # Take first object
+        vertex_data, indices = interleave_faces(obj['vertices'], obj['tex_coords'], obj['normals'], obj['faces'])
+        if optimize:
+            vertex_data, indices = optimize_mesh(vertex_data, indices)
+        return MeshData(k, vertex_data, indices)
+
+
+def load_mesh(name):
+    """Load a mesh from the binary cache, parsing and caching the .obj file if needed"""
+    obj_path = os.path.join(BASE_OBJECTS_FOLDER, name) + ".obj"
+    mesh = read_cache(name, obj_path) if os.path.exists(obj_path) else None
+    if mesh is None:
+        mesh = build_mesh(obj_path)
+        if mesh:
+            try:
+                write_cache(name, obj_path, mesh)
+            except OSError as e:
+                if settings.DEBUG:
+                    print(f"Mesh cache for {name} not written: {e}")
+    return mesh
+
+
+def mesh_bounding_box(mesh):
+    """Local bounding box of a mesh, same as the one of a model using it"""
+    if not len(mesh.vertex_data):
+        return SimpleBoundingBox(0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+    return SimpleBoundingBox(*(min(float(v), 0.0) for v in mesh.bounds_min),
+                             *(max(float(v), 0.0) for v in mesh.bounds_max))
@@ -0,0 +1,230 @@
+import argparse
+import ctypes
+import os
+import time
+
+# EGL has to be picked before OpenGL is imported by any other module, "qt" uses an offscreen Qt surface
+# and needs a Qt platform plugin with OpenGL support (e.g. xcb on Xvfb)
+OFFSCREEN_BACKEND = os.environ.get("OFFSCREEN_BACKEND", "egl")
+if OFFSCREEN_BACKEND == "egl":
+    os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+    # Mesa can create contexts without any display server or GPU (llvmpipe software rasterizer)
+    os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+import numpy as np
+from OpenGL.GL import *
+
+GL_VERSION_REQUIRED = (4, 5)
+
+
+class EGLContext:
+    """OpenGL context without a window, through EGL"""
+    def __init__(self, width, height):
+        from OpenGL import EGL
+
+        self.egl = EGL
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor))
+
+        config_attributes = self._attributes(
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+            EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8, EGL.EGL_ALPHA_SIZE, 8,
+            EGL.EGL_DEPTH_SIZE, 24,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+        )
+        config = EGL.EGLConfig()
+        count = EGL.EGLint()
+        EGL.eglChooseConfig(self.display, config_attributes, ctypes.pointer(config), 1, ctypes.pointer(count))
+        if not count.value:
+            raise RuntimeError("No EGL config for offscreen OpenGL rendering")
+
+        self.surface = EGL.eglCreatePbufferSurface(
+            self.display, config, self._attributes(EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height))
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        context_attributes = self._attributes(
+            EGL.EGL_CONTEXT_MAJOR_VERSION, GL_VERSION_REQUIRED[0],
+            EGL.EGL_CONTEXT_MINOR_VERSION, GL_VERSION_REQUIRED[1],
+            EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_COMPATIBILITY_PROFILE_BIT,
+        )
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, context_attributes)
+        if not self.context:
+            raise RuntimeError(f"Cannot create an OpenGL {GL_VERSION_REQUIRED} context through EGL")
+        EGL.eglMakeCurrent(self.display, self.surface, self.surface, self.context)
+
+    def _attributes(self, *values):
+        values = values + (self.egl.EGL_NONE,)
+        return (self.egl.EGLint * len(values))(*values)
+
+    def destroy(self):
+        EGL = self.egl
+        EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+        EGL.eglDestroyContext(self.display, self.context)
+        EGL.eglDestroySurface(self.display, self.surface)
+        EGL.eglTerminate(self.display)
+
+
+class QtContext:
+    """OpenGL context on an offscreen Qt surface"""
+    def __init__(self, width, height):
+        from PySide2.QtGui import QGuiApplication, QOffscreenSurface, QOpenGLContext, QSurfaceFormat
+
+        self.app = QGuiApplication.instance() or QGuiApplication([])
+        surface_format = QSurfaceFormat()
+        surface_format.setVersion(*GL_VERSION_REQUIRED)
+        surface_format.setProfile(QSurfaceFormat.CompatibilityProfile)
+        surface_format.setDepthBufferSize(24)
+        self.context = QOpenGLContext()
+        self.context.setFormat(surface_format)
+        if not self.context.create():
+            raise RuntimeError("Cannot create an OpenGL context with the current Qt platform plugin")
+        self.surface = QOffscreenSurface()
+        self.surface.setFormat(self.context.format())
+        self.surface.create()
+        self.context.makeCurrent(self.surface)
+
+    def destroy(self):
+        self.context.doneCurrent()
+        self.surface.destroy()
+
+
+CONTEXTS = {
+    "egl": EGLContext,
+    "qt": QtContext,
+}
+
+
+class Framebuffer:
+    """Color and depth render target replacing the window's framebuffer"""
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.fbo = glGenFramebuffers(1)
+        self.color, self.depth = glGenRenderbuffers(2)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.color)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.depth)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH24_STENCIL8, width, height)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.color)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_STENCIL_ATTACHMENT, GL_RENDERBUFFER, self.depth)
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError(f"Offscreen framebuffer incomplete: {status}")
+
+    def read_pixels(self):
+        """:return (height, width, 4) uint8 RGBA image, top row first"""
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.fbo)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        data = glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE)
+        return np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 4)[::-1]
+
+    def destroy(self):
+        glDeleteFramebuffers(1, [self.fbo])
+        glDeleteRenderbuffers(2, [self.color, self.depth])
+
+
+class OffscreenWidget:
+    """What OpenGLController needs from OpenGLWidget, without a window"""
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.parent = None
+        self.game = None
+
+    @property
+    def aspect_ratio(self):
+        return self.width / self.height
+
+
+class OffscreenRenderer:
+    """OpenGLController rendering into an offscreen framebuffer"""
+    def __init__(self, width=1280, height=720, backend=OFFSCREEN_BACKEND):
+        from opengl import OpenGLController
+
+        self.width = width
+        self.height = height
+        self.context = CONTEXTS[backend](width, height)
+        self.framebuffer = Framebuffer(width, height)
+        self.widget = OffscreenWidget(width, height)
+        self.controller = OpenGLController(self.widget)
+        start = time.perf_counter()
+        self.controller.init()
+        self.controller.widget_resized(width, height)
+        glFinish()
+        self.init_time = time.perf_counter() - start
+
+    def load_map(self, path):
+        """:return seconds spent loading the map"""
+        start = time.perf_counter()
+        self.controller.select_map(path)
+        glFinish()
+        return time.perf_counter() - start
+
+    def draw(self, frame_time=None):
+        """Draw one frame and wait for it to finish
+
+        :param frame_time: fixed game time step, see OpenGLController.draw
+        :return: seconds spent submitting the frame and seconds until it was finished
+        """
+        start = time.perf_counter()
+        self.controller.draw(frame_time)
+        submitted = time.perf_counter()
+        glFinish()
+        return submitted - start, time.perf_counter() - start
+
+    def render(self, frames, read_pixels=False):
+        """Draw frames, waiting for each one to finish
+
+        :return: list of frame times in seconds and the last frame's pixels (or None)
+        """
+        frame_times = [self.draw()[1] for _ in range(frames)]
+        return frame_times, self.framebuffer.read_pixels() if read_pixels else None
+
+    def destroy(self):
+        self.controller.game.destroy()
+        self.framebuffer.destroy()
+        self.context.destroy()
+
+
+def frame_statistics(frame_times):
+    frame_times = np.asarray(frame_times) * 1000
+    return {
+        "frames": len(frame_times),
+        "mean_ms": float(frame_times.mean()),
+        "median_ms": float(np.median(frame_times)),
+        "p95_ms": float(np.percentile(frame_times, 95)),
+        "max_ms": float(frame_times.max()),
+        "fps": float(1000 / frame_times.mean()),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a map without a display and time the frames")
+    parser.add_argument("map", nargs="?", default="./stages/stage1/mapp.txt")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--size", default="1280x720", help="WIDTHxHEIGHT")
+    parser.add_argument("--backend", choices=list(CONTEXTS), default=OFFSCREEN_BACKEND,
+                        help="egl needs OFFSCREEN_BACKEND=egl (the default) when started")
+    parser.add_argument("--png", help="save the last frame to this file")
+    parser.add_argument("--trace", help="profile the frames and write a Chrome trace to this file")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split("x"))
+    renderer = OffscreenRenderer(width, height, args.backend)
+    if args.trace:
+        from profiler import PROFILER
+        PROFILER.enabled = True
+    print(f"{glGetString(GL_RENDERER).decode()}, OpenGL {glGetString(GL_VERSION).decode()}")
+    print(f"init {renderer.init_time * 1000:.1f}ms, map load {renderer.load_map(args.map) * 1000:.1f}ms")
+    frame_times, pixels = renderer.render(args.frames, read_pixels=bool(args.png))
+    stats = frame_statistics(frame_times)
+    print(f"{stats['frames']} frames: mean {stats['mean_ms']:.2f}ms, median {stats['median_ms']:.2f}ms, "
+          f"p95 {stats['p95_ms']:.2f}ms, max {stats['max_ms']:.2f}ms, {stats['fps']:.1f} fps")
+    if args.trace:
+        PROFILER.collect_gpu_results()
+        PROFILER.export_chrome_trace(args.trace)
+    if args.png:
+        import cv2 as cv
+        cv.imwrite(args.png, cv.cvtColor(pixels, cv.COLOR_RGBA2BGRA))
+    renderer.destroy()
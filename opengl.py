@@ -1,17 +1,20 @@
+import time
+
 from OpenGL.GL import *
 from OpenGL.GL import shaders
 from shaders import *
-from pyrr import matrix44, Vector3, Matrix44, Vector4
+from pyrr import matrix44, Vector3, Matrix44
 import numpy as np
 from PySide2.QtCore import Qt
 from PySide2.QtGui import QCursor
 
 from texturemanager import load_image_rgba
-from shaders import Shader
-from renderer import Renderer
+from shaders import SHADERS, load_shader
+from renderer import Renderer, STATE, RENDER_QUEUE
 from game import Game
 from hud import Scene, ImageLayer, GUI, SNAP_LEFT_DOWN, Button
 from camera import Camera
+from profiler import PROFILER, ProfilerOverlay
 import settings
 
 
@@ -32,9 +35,11 @@ class OpenGLController:
         self.level_scene = None
         self.win_scene = None
         self.esc_scene = None
+        self.profiler_overlay = None
 
         self.mouse_pos_x = 0.0
         self.mouse_pos_y = 0.0
+        self.last_frame_time = None
 
     def make_main_menu(self):
         self.start_scene = Scene(1200, 600)
@@ -155,16 +160,21 @@ class OpenGLController:
 
     def init(self):
         """Initialize GL widget, set viewport, compile shader"""
-        self.basic_shader = Shader('basic_shader')
-        self.shader_hud = Shader("hud_shader")
-        self.shader_text = Shader("text_shader")
-        self.advanced_shader = Shader("advanced_shader")
+        # Nothing is known about a new context
+        STATE.invalidate()
+        SHADERS.clear()
+        self.basic_shader = load_shader('basic_shader')
+        self.shader_hud = load_shader("hud_shader")
+        self.shader_text = load_shader("text_shader")
+        self.advanced_shader = load_shader("advanced_shader")
+        if settings.DEBUG:
+            print(f"Shaders loaded in {sum(shader.load_time for shader in SHADERS.values()) * 1000:.1f}ms")
 
         self.basic_shader.bind()
         self.renderer = Renderer()
         # self.camera = Camera(self.advanced_shader)
 
-        self.game = Game()
+        self.game = Game(self.advanced_shader)
         self.game.win_callback = self.show_win_scene
         self.opengl_widget.game = self.game
 
@@ -175,14 +185,15 @@ class OpenGLController:
         self.make_level_menu()
         self.make_win_scene()
         self.make_esc_menu()
+        self.profiler_overlay = ProfilerOverlay(PROFILER)
 
-        glEnable(GL_DEPTH_TEST)
+        STATE.enable(GL_DEPTH_TEST)
         # self.set_viewpoint()
 
         glClearColor(0.2, 0.2, 0.5, 1)
 
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-        glEnable(GL_BLEND)
+        STATE.enable(GL_BLEND)
 
         # block_text = load_texture("./graphics/textures/wall_block.png")
         # hud_text = load_texture("./graphics/hud/hud.png")
@@ -207,19 +218,46 @@ class OpenGLController:
         self.advanced_shader.bind()
         self.advanced_shader.set_uniform_1iv('u_Textures', len(samplers), samplers)
 
-    def draw(self):
-        """Called every frame"""
+    def needs_redraw(self):
+        """Whether the next frame can differ from the last one: a running game or a changed scene"""
+        if not settings.RENDER_ON_DEMAND or self.game is None or self.gui is None or PROFILER.enabled:
+            return True
+        if self.game.initialized or self.gui.needs_redraw():
+            return True
+        # Idle time must not be fed into the simulation once frames resume
+        self.last_frame_time = None
+        return False
+
+    def draw(self, frame_time=None):
+        """Called every frame
+
+        :param frame_time: seconds to advance the game by, measured from the last frame when None
+        """
+        PROFILER.begin_frame()
         self.renderer.clear()
-        self.game.tick()
+        now = time.perf_counter()
+        if frame_time is None:
+            frame_time = now - self.last_frame_time if self.last_frame_time is not None else 0.0
+        self.last_frame_time = now
+        with PROFILER.scope("Game.update"):
+            self.game.update(frame_time)
         # self.set_viewpoint()
 
         # self.camera.update()
         try:
             if self.game.initialized:
-                self.game.current_map.render(self.game.camera.shader)
-            self.gui.render(self.shader_hud, self.shader_text)
+                with PROFILER.scope("Map.render"), PROFILER.gpu_scope("Map.render"):
+                    self.game.current_map.render(self.game.camera.shader, self.game.camera, self.game.render_alpha)
+                    RENDER_QUEUE.flush()
+            with PROFILER.scope("GUI.render"), PROFILER.gpu_scope("GUI.render"):
+                self.gui.render(self.shader_hud, self.shader_text)
+                if PROFILER.enabled:
+                    self.profiler_overlay.render(self.shader_text)
+                RENDER_QUEUE.flush()
         except AttributeError as e:
+            RENDER_QUEUE.clear()
             print("Shader not initialized: ", e)
+        PROFILER.end_frame()
 
     def widget_resized(self, w, h):
         glViewport(0, 0, w, h)
@@ -229,36 +267,7 @@ class OpenGLController:
         self.shader_text.bind()
         self.shader_text.set_uniform_matrix_4fv('projection', self.start_scene.ortho_matrix)
         self.game.camera.resize(w, h)
-
-    def set_advanced_variables(self):
-        self.advanced_shader.bind()
-        model_matrix = matrix44.create_from_translation(Vector3([3.0, 3.0, 2.0]))
-        self.advanced_shader.set_uniform_4fv("LightPosW", Vector4([2.0, 2.0, 0.5, 0.0]))
-        white = np.array([1.0, 1.0, 1.0, 1.0], dtype=np.float32)
-        self.advanced_shader.set_uniform_4fv("LightColor", white)
-        ambient = np.array([0.1, 0.1, 0.1, 1.0], dtype=np.float32)
-        self.advanced_shader.set_uniform_4fv("Ambient", ambient)
-
-        proj = matrix44.create_perspective_projection_matrix(45.0, self.opengl_widget.aspect_ratio, 0.1, 100.0)
-        view = matrix44.create_from_translation(Vector3([self.game.client_pos_x, self.game.client_pos_y, -7.0]))
-        model = matrix44.create_from_translation(Vector3([0.0, 0.0, 0.0]))
-        rotation = matrix44.create_from_x_rotation(70 / 360 * np.pi)
-        rot_z_mat = matrix44.create_from_z_rotation(-40 / 360 * np.pi)
-        rotation = matrix44.multiply(rot_z_mat, rotation)
-        rp = matrix44.multiply(rotation, proj)
-        vrp = matrix44.multiply(view, rp)
-        mvp = matrix44.multiply(model, vrp)
-
-        self.advanced_shader.set_uniform_matrix_4fv("ModelViewProjectionMatrix", mvp)
-        self.advanced_shader.set_uniform_matrix_4fv("ModelMatrix", rotation)
-        self.advanced_shader.set_uniform_4fv("EyePosW", Vector4([self.game.client_pos_x, self.game.client_pos_y, -7.0, 0.0]))
-
-        black = np.array([0.0, 0.0, 0.0, 1.0], dtype=np.float32)
-        self.advanced_shader.set_uniform_4fv("MaterialEmissive", black)
-        self.advanced_shader.set_uniform_4fv("MaterialDiffuse", white)
-        self.advanced_shader.set_uniform_4fv("MaterialSpecular", white)
-        var = np.array([50], dtype=np.float32)
-        self.advanced_shader.set_uniform_1f("MaterialShininess", var)
+        self.profiler_overlay.resize(w, h)
 
     def set_viewpoint(self):
         """Calculate viewpoint based on zoom, aspect ratio, view angle, clipping"""
@@ -315,6 +324,12 @@ class OpenGLController:
     def show_esc_menu(self):
         self.gui.activate_scene('esc')
 
+    def toggle_profiler(self):
+        PROFILER.enabled = not PROFILER.enabled
+
+    def export_profile(self):
+        PROFILER.export_chrome_trace(settings.PROFILER_TRACE_FILE)
+
     def rotate_camera(self, event):
         pos_x, pos_y = event.localPos().x(), event.localPos().y()
         dx = pos_x - self.mouse_pos_x
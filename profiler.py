@@ -0,0 +1,191 @@
+import json
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+from OpenGL.GL import *
+
+import settings
+from hud import TextLayer, CHARACTERS, CHARSET, init_character
+
+CPU_TRACK = "CPU"
+GPU_TRACK = "GPU"
+# Chrome trace thread id of every track
+TRACK_IDS = {CPU_TRACK: 0, GPU_TRACK: 1}
+
+# Scope used while the profiler is off
+NULL_SCOPE = nullcontext()
+
+
+class FrameRecord:
+    """Timed events of one frame: (track, name, start, duration, depth), times in seconds"""
+    def __init__(self, index, start):
+        self.index = index
+        self.start = start
+        self.duration = 0.0
+        self.events = []
+
+
+class Profiler:
+    """Named CPU scopes and GL_TIME_ELAPSED timers around render passes.
+
+    The last PROFILER_HISTORY frames are kept in a ring buffer. GPU results arrive a few frames late,
+    they are read back without stalling at the start of later frames and added to the frame they
+    were recorded in.
+    """
+    def __init__(self, history=settings.PROFILER_HISTORY):
+        self.enabled = settings.PROFILER
+        self.frames = deque(maxlen=history)
+        self.frame = None
+        self.frame_count = 0
+        self.depth = 0
+        # (query, frame, name, cpu start) of GPU timers still in flight, oldest first
+        self.pending_queries = []
+        self.free_queries = []
+        self.gpu_scope_active = False
+        # End of the last GPU event, the GPU runs passes one after another
+        self.gpu_clock = 0.0
+
+    def begin_frame(self):
+        self.collect_gpu_results()
+        if not self.enabled:
+            self.frame = None
+            return
+        self.frame = FrameRecord(self.frame_count, time.perf_counter())
+        self.frame_count += 1
+        self.depth = 0
+
+    def end_frame(self):
+        if self.frame is None:
+            return
+        self.frame.duration = time.perf_counter() - self.frame.start
+        self.frames.append(self.frame)
+        self.frame = None
+
+    def scope(self, name):
+        """CPU time of a with block"""
+        if self.frame is None:
+            return NULL_SCOPE
+        return self._cpu_scope(name)
+
+    @contextmanager
+    def _cpu_scope(self, name):
+        frame = self.frame
+        depth = self.depth
+        self.depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            frame.events.append((CPU_TRACK, name, start, time.perf_counter() - start, depth))
+            self.depth = depth
+
+    def gpu_scope(self, name):
+        """GPU time of the GL commands issued in a with block, GPU scopes can't be nested"""
+        if self.frame is None or self.gpu_scope_active:
+            return NULL_SCOPE
+        return self._gpu_scope(name)
+
+    @contextmanager
+    def _gpu_scope(self, name):
+        query = self.free_queries.pop() if self.free_queries else int(glGenQueries(1)[0])
+        self.gpu_scope_active = True
+        start = time.perf_counter()
+        glBeginQuery(GL_TIME_ELAPSED, query)
+        try:
+            yield
+        finally:
+            glEndQuery(GL_TIME_ELAPSED)
+            self.gpu_scope_active = False
+            self.pending_queries.append((query, self.frame, name, start))
+
+    def collect_gpu_results(self):
+        """Read back finished GPU timers, queries finish in the order they were issued"""
+        while self.pending_queries:
+            query, frame, name, start = self.pending_queries[0]
+            if not glGetQueryObjectiv(query, GL_QUERY_RESULT_AVAILABLE):
+                break
+            # PyOpenGL can't allocate 64 bit results itself
+            nanoseconds = GLuint64(0)
+            glGetQueryObjectui64v(query, GL_QUERY_RESULT, nanoseconds)
+            # Only the duration is measured, the pass is placed once it was issued and the GPU was free
+            start = max(start, self.gpu_clock)
+            duration = nanoseconds.value / 1e9
+            self.gpu_clock = start + duration
+            frame.events.append((GPU_TRACK, name, start, duration, 0))
+            self.pending_queries.pop(0)
+            self.free_queries.append(query)
+
+    def averages(self):
+        """:return mean frame time and {(track, name): mean time per frame} in seconds over the ring buffer"""
+        if not self.frames:
+            return 0.0, {}
+        totals = {}
+        for frame in self.frames:
+            for track, name, _, duration, _ in frame.events:
+                totals[(track, name)] = totals.get((track, name), 0.0) + duration
+        count = len(self.frames)
+        frame_time = sum(frame.duration for frame in self.frames) / count
+        return frame_time, {key: total / count for key, total in totals.items()}
+
+    def chrome_trace(self):
+        """Frames of the ring buffer as Chrome trace events (chrome://tracing, Perfetto)"""
+        if not self.frames:
+            return {"traceEvents": []}
+        origin = self.frames[0].start
+        events = [{"name": "thread_name", "ph": "M", "pid": 0, "tid": tid, "args": {"name": track}}
+                  for track, tid in TRACK_IDS.items()]
+        for frame in self.frames:
+            events.append({"name": f"Frame {frame.index}", "cat": "frame", "ph": "X", "pid": 0,
+                           "tid": TRACK_IDS[CPU_TRACK], "ts": (frame.start - origin) * 1e6,
+                           "dur": frame.duration * 1e6})
+            for track, name, start, duration, depth in frame.events:
+                events.append({"name": name, "cat": track.lower(), "ph": "X", "pid": 0, "tid": TRACK_IDS[track],
+                               "ts": (start - origin) * 1e6, "dur": duration * 1e6, "args": {"frame": frame.index}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+        if settings.DEBUG:
+            print(f"Trace of {len(self.frames)} frames written to {path}")
+
+
+# Profiler of the game window
+PROFILER = Profiler()
+
+
+class ProfilerOverlay:
+    """Profiler averages drawn over the game, one TextLayer per line from the top left corner"""
+    LINES = 12
+    SCALE = 0.35
+    MARGIN = 10
+
+    def __init__(self, profiler):
+        if not CHARACTERS:
+            init_character()
+        self.profiler = profiler
+        self.line_height = max(c.size[1] for c in CHARACTERS) * self.SCALE * 1.5
+        self.layers = [TextLayer(self.MARGIN, 0, self.SCALE, "", (255, 255, 255, 255)) for _ in range(self.LINES)]
+        self.frames_shown = 0
+
+    def resize(self, w, h):
+        for i, layer in enumerate(self.layers):
+            layer.move(self.MARGIN, h - self.MARGIN - (i + 1) * self.line_height)
+
+    def update(self):
+        """Refresh the text once per PROFILER_HUD_REFRESH frames, so the numbers stay readable"""
+        if self.profiler.frame_count - self.frames_shown < settings.PROFILER_HUD_REFRESH:
+            return
+        self.frames_shown = self.profiler.frame_count
+        frame_time, scopes = self.profiler.averages()
+        lines = [f"CPU frame {frame_time * 1000:.2f} ms {1 / frame_time if frame_time else 0:.0f} fps"]
+        lines += [f"{track} {name} {seconds * 1000:.2f} ms" for (track, name), seconds in scopes.items()]
+        for layer, line in zip(self.layers, lines + [""] * len(self.layers)):
+            layer.set_text("".join(c for c in line if c in CHARSET))
+
+    def render(self, text_shader):
+        self.update()
+        for layer in self.layers:
+            if layer.text:
+                layer.render(text_shader)
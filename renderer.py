@@ -1,4 +1,286 @@
 from OpenGL.GL import *
+# PyOpenGL's wrappers leave a reference cycle of converted arguments behind on every call,
+# the per-frame draws go straight to the entry points, offsets are passed as pointers anyway
+from OpenGL.raw.GL.VERSION import GL_1_1, GL_3_1
+
+
+class RenderStats:
+    """Counts of the GL work submitted, the render benchmark resets them every frame"""
+    def __init__(self):
+        self.draw_calls = 0
+        self.triangles = 0
+        self.buffer_uploads = 0
+        self.buffer_bytes = 0
+        self.texture_uploads = 0
+        self.texture_bytes = 0
+        # Binding and capability calls made and skipped by the GL state cache
+        self.state_calls = 0
+        self.state_calls_skipped = 0
+        # Program, texture and vertex array binds that reached GL
+        self.program_switches = 0
+        self.texture_switches = 0
+        self.vertex_array_switches = 0
+
+    def reset(self):
+        self.__init__()
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+# Counters of the current GL context
+STATS = RenderStats()
+
+
+class GLState:
+    """Bindings and capabilities as last set through this cache, calls that wouldn't change them are skipped.
+
+    Binds made around the cache leave it out of date, so all of them go through STATE. None means
+    unknown, invalidate() forgets everything e.g. for a new context.
+    """
+    def __init__(self):
+        self.invalidate()
+
+    def invalidate(self):
+        self.program = None
+        self.vertex_array = None
+        self.buffers = {}
+        # The element array binding belongs to the bound vertex array
+        self.element_buffers = {}
+        self.active_unit = None
+        self.textures = {}
+        self.capabilities = {}
+
+    def use_program(self, program):
+        if program == self.program:
+            STATS.state_calls_skipped += 1
+            return
+        glUseProgram(program)
+        self.program = program
+        STATS.state_calls += 1
+        STATS.program_switches += 1
+
+    def bind_vertex_array(self, vertex_array):
+        if vertex_array == self.vertex_array:
+            STATS.state_calls_skipped += 1
+            return
+        glBindVertexArray(vertex_array)
+        self.vertex_array = vertex_array
+        STATS.state_calls += 1
+        STATS.vertex_array_switches += 1
+
+    def bind_buffer(self, target, buffer):
+        if target == GL_ELEMENT_ARRAY_BUFFER:
+            bindings, key = self.element_buffers, self.vertex_array
+        else:
+            bindings, key = self.buffers, target
+        if key is not None and bindings.get(key) == buffer:
+            STATS.state_calls_skipped += 1
+            return
+        glBindBuffer(target, buffer)
+        if key is not None:
+            bindings[key] = buffer
+        STATS.state_calls += 1
+
+    def active_texture(self, unit):
+        if unit == self.active_unit:
+            STATS.state_calls_skipped += 1
+            return
+        glActiveTexture(GL_TEXTURE0 + unit)
+        self.active_unit = unit
+        STATS.state_calls += 1
+
+    def bind_texture(self, target, texture, unit=None):
+        """:param unit: texture unit to bind to, the active one when None"""
+        if unit is None:
+            unit = self.active_unit
+        if unit is not None and self.textures.get((unit, target)) == texture:
+            STATS.state_calls_skipped += 1
+            return
+        if unit is not None:
+            self.active_texture(unit)
+            self.textures[(unit, target)] = texture
+        glBindTexture(target, texture)
+        STATS.state_calls += 1
+        STATS.texture_switches += 1
+
+    def set_capability(self, capability, enabled):
+        if self.capabilities.get(capability) == enabled:
+            STATS.state_calls_skipped += 1
+            return
+        if enabled:
+            glEnable(capability)
+        else:
+            glDisable(capability)
+        self.capabilities[capability] = enabled
+        STATS.state_calls += 1
+
+    def enable(self, capability):
+        self.set_capability(capability, True)
+
+    def disable(self, capability):
+        self.set_capability(capability, False)
+
+    def delete_program(self, program):
+        glDeleteProgram(program)
+        if self.program == program:
+            self.program = None
+
+    def delete_vertex_array(self, vertex_array):
+        glDeleteVertexArrays(1, [vertex_array])
+        self.element_buffers.pop(vertex_array, None)
+        if self.vertex_array == vertex_array:
+            self.vertex_array = None
+
+    def delete_buffer(self, buffer):
+        """Deleted names are reused by GL, so they must not stay cached as bound"""
+        glDeleteBuffers(1, [buffer])
+        self.buffers = {target: b for target, b in self.buffers.items() if b != buffer}
+        self.element_buffers = {va: b for va, b in self.element_buffers.items() if b != buffer}
+
+    def delete_texture(self, texture):
+        glDeleteTextures(1, [texture])
+        self.textures = {key: t for key, t in self.textures.items() if t != texture}
+
+
+# State cache of the current GL context
+STATE = GLState()
+
+
+def draw_elements(count, index_type, offset=None):
+    STATS.draw_calls += 1
+    STATS.triangles += count // 3
+    GL_1_1.glDrawElements(GL_TRIANGLES, count, index_type, offset)
+
+
+def draw_elements_instanced(count, index_type, instance_count):
+    STATS.draw_calls += 1
+    STATS.triangles += count // 3 * instance_count
+    GL_3_1.glDrawElementsInstanced(GL_TRIANGLES, count, index_type, None, instance_count)
+
+
+def buffer_data(target, size, data, usage=GL_STATIC_DRAW):
+    STATS.buffer_uploads += 1
+    STATS.buffer_bytes += size
+    glBufferData(target, size, data, usage)
+
+
+def buffer_sub_data(target, offset, size, data):
+    STATS.buffer_uploads += 1
+    STATS.buffer_bytes += size
+    glBufferSubData(target, offset, size, data)
+
+
+def count_texture_upload(nbytes):
+    STATS.texture_uploads += 1
+    STATS.texture_bytes += nbytes
+
+
+# Render queue layers, drawn in this order
+LAYER_WORLD = 0
+LAYER_HUD = 1
+
+
+class DrawItem:
+    """One queued draw call with the state it needs"""
+    __slots__ = ('key', 'shader', 'vertex_array', 'index_buffer', 'textures', 'uniforms', 'depth_test',
+                 'count', 'offset', 'instance_count')
+
+    def set(self, key, shader, vertex_array, index_buffer, textures, uniforms, depth_test,
+            count, offset, instance_count):
+        self.key = key
+        self.shader = shader
+        self.vertex_array = vertex_array
+        self.index_buffer = index_buffer
+        self.textures = textures
+        self.uniforms = uniforms
+        self.depth_test = depth_test
+        self.count = count
+        self.offset = offset
+        self.instance_count = instance_count
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+
+class RenderQueue:
+    """Draw items of a pass, submitted sorted by a packed state key.
+
+    World items sort by program, then first texture, then vertex array, so consecutive draws share
+    state and the binds skipped by STATE add up. HUD items blend over each other, they keep the
+    order they were submitted in. Everything an item draws with travels with it, uniforms set on
+    the shader outside the queue must be the same for all items of a pass.
+
+    Items are pooled across frames. Submitters pass the same uniforms tuple every frame and update
+    the arrays in it in place, consecutive items with the same tuple upload it only once.
+    """
+    KEY_BITS = 16
+    KEY_MASK = (1 << KEY_BITS) - 1
+
+    def __init__(self):
+        self.items = []
+        self.pool = []
+        self.sequence = 0
+
+    def pack_key(self, layer, shader, vertex_array, textures):
+        if layer != LAYER_WORLD:
+            self.sequence += 1
+            return layer << 3 * self.KEY_BITS | self.sequence & (1 << 3 * self.KEY_BITS) - 1
+        texture = textures[0][2] if textures else 0
+        return (layer << 3 * self.KEY_BITS
+                | (shader.m_renderer_id & self.KEY_MASK) << 2 * self.KEY_BITS
+                | (texture & self.KEY_MASK) << self.KEY_BITS
+                | vertex_array.m_renderer_id & self.KEY_MASK)
+
+    def submit(self, shader, vertex_array, index_buffer, textures=(), uniforms=(), depth_test=True,
+               layer=LAYER_WORLD, count=None, offset=None, instance_count=None):
+        """
+        :param textures: (unit, target, texture) bindings
+        :param uniforms: (shader setter name, uniform name, value) set before drawing
+        :param count: indices to draw, the whole index buffer when None
+        :param offset: byte offset into the index buffer
+        :param instance_count: draw instanced when not None
+        """
+        if len(self.items) == len(self.pool):
+            self.pool.append(DrawItem())
+        item = self.pool[len(self.items)]
+        item.set(self.pack_key(layer, shader, vertex_array, textures), shader, vertex_array, index_buffer,
+                 textures, uniforms, depth_test, count, offset, instance_count)
+        self.items.append(item)
+
+    def flush(self):
+        """Draw and forget the queued items"""
+        self.items.sort()
+        shader = uniforms = None
+        for item in self.items:
+            item.shader.bind()
+            if item.shader is not shader or item.uniforms is not uniforms:
+                shader, uniforms = item.shader, item.uniforms
+                for setter, name, value in uniforms:
+                    getattr(shader, setter)(name, value)
+            for unit, target, texture in item.textures:
+                STATE.bind_texture(target, texture, unit)
+            STATE.set_capability(GL_DEPTH_TEST, item.depth_test)
+            item.vertex_array.bind()
+            ib = item.index_buffer
+            ib.bind()
+            count = ib.get_count() if item.count is None else item.count
+            if item.instance_count is None:
+                draw_elements(count, ib.index_type, item.offset)
+            else:
+                draw_elements_instanced(count, ib.index_type, item.instance_count)
+        self.clear()
+
+    def clear(self):
+        for item in self.items:
+            # Pooled items mustn't keep buffers, shaders or offsets alive
+            item.set(0, None, None, None, (), (), True, None, None, None)
+        self.items.clear()
+        self.sequence = 0
+
+
+# Queue the game and HUD submit their draws to
+RENDER_QUEUE = RenderQueue()
 
 
 class Renderer:
@@ -7,16 +289,16 @@ class Renderer:
         shader.bind()
         va.bind()
         ib.bind()
-        glDrawElements(GL_TRIANGLES, ib.get_count(), GL_UNSIGNED_INT, None)
+        draw_elements(ib.get_count(), ib.index_type)
 
     @staticmethod
     def draw_hud(va, ib, shader):
-        glDisable(GL_DEPTH_TEST)
+        STATE.disable(GL_DEPTH_TEST)
         shader.bind()
         va.bind()
         ib.bind()
-        glDrawElements(GL_TRIANGLES, ib.get_count(), GL_UNSIGNED_INT, None)
-        glEnable(GL_DEPTH_TEST)
+        draw_elements(ib.get_count(), ib.index_type)
+        STATE.enable(GL_DEPTH_TEST)
 
     @staticmethod
     def clear():
@@ -1,4 +1,31 @@
 DEBUG = False
+# Static map geometry: "instanced" draws every tile type with one instanced call,
+# "batch" bakes all tiles into a single vertex buffer
+STATIC_RENDER_MODE = "batch"
+# Batch mode: build wall blocks as one mesh without hidden faces instead of a cube per tile
+GREEDY_WALLS = True
+# Batch mode: static geometry is split into CHUNK_SIZE x CHUNK_SIZE cell chunks culled against the camera frustum
+CHUNK_SIZE = 32
+# Map files from this size up are streamed: only chunks within STREAMING_RADIUS chunks of the character are loaded
+STREAMING_MAP_BYTES = 16 * 1024 * 1024
+STREAMING_RADIUS = 2
+# Most chunk geometries built per tick while streaming, spreads the work over several frames
+STREAMING_CHUNKS_PER_TICK = 2
+# Simulation ticks per second, movement speeds are per tick. Rendering runs at RENDER_FPS independently
+TICK_RATE = 140
+RENDER_FPS = 140
+# Only repaint menus when something in them changed
+RENDER_ON_DEMAND = True
+# Longest real time one frame may feed into the simulation, a long stall is dropped instead of replayed
+MAX_FRAME_TIME = 0.25
+# Frame profiler: CPU scopes and GPU timers of the last PROFILER_HISTORY frames. F3 toggles it with an
+# overlay of the averages, F4 writes the frames to PROFILER_TRACE_FILE as a Chrome trace
+PROFILER = False
+PROFILER_HISTORY = 240
+PROFILER_HUD_REFRESH = 30
+PROFILER_TRACE_FILE = "frame_trace.json"
+# Keep linked shader programs in cache/shaders, keyed by source hash and driver, to skip compiling at startup
+SHADER_BINARY_CACHE = True
 # Window Size
 # Folders Path
 # Shades
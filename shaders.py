@@ -1,8 +1,20 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
 from OpenGL.GL import *
+# Entry point without PyOpenGL's argument conversion, see renderer.py
+from OpenGL.raw.GL.VERSION import GL_2_0
 import settings
+from mesh_cache import write_cache_entry
+from renderer import STATE
 
 
 BASE_SHADERS_FOLDER = "./shaders"
+SHADER_CACHE_FOLDER = os.path.join(".", "cache", "shaders")
+SHADER_CACHE_VERSION = 1
 
 
 def load_shader_file(path, shader_type):
@@ -17,23 +29,85 @@ class ShaderSource:
         self.vertex_shader = load_shader_file(path, 'vertex_shader')
         self.fragment_shader = load_shader_file(path, 'fragment_shader')
 
+    def source_hash(self):
+        return hashlib.sha1((self.vertex_shader + "\0" + self.fragment_shader).encode()).hexdigest()
+
+
+def driver_string():
+    """Program binaries are only valid for the driver that produced them"""
+    return " / ".join(glGetString(name).decode() for name in (GL_VENDOR, GL_RENDERER, GL_VERSION))
+
+
+def program_binary_formats():
+    """Binary formats the driver can load, none e.g. when Mesa's shader disk cache is disabled"""
+    count = int(glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS))
+    if not count:
+        return set()
+    formats = np.zeros(count, dtype=np.int32)
+    glGetIntegerv(GL_PROGRAM_BINARY_FORMATS, formats)
+    return set(formats.tolist())
+
+
+def cache_paths(name, folder=SHADER_CACHE_FOLDER):
+    base = os.path.join(folder, name)
+    return base + ".json", base + ".bin"
+
+
+def read_program_binary(name, source_hash, driver, folder=SHADER_CACHE_FOLDER):
+    """:return (binary format, binary) of a cached program, or None if it is missing or stale"""
+    meta_path, binary_path = cache_paths(name, folder)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if (meta['version'] != SHADER_CACHE_VERSION or meta['source_hash'] != source_hash
+                or meta['driver'] != driver):
+            return None
+        binary = np.fromfile(binary_path, dtype=np.uint8)
+        if len(binary) != meta['length']:
+            return None
+        return int(meta['format']), binary
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        if settings.DEBUG:
+            print(f"Shader cache for {name} unreadable: {e}")
+        return None
+
+
+def write_program_binary(name, source_hash, driver, binary_format, binary, folder=SHADER_CACHE_FOLDER):
+    meta_path, binary_path = cache_paths(name, folder)
+    meta = {
+        'version': SHADER_CACHE_VERSION,
+        'source_hash': source_hash,
+        'driver': driver,
+        'format': binary_format,
+        'length': len(binary),
+    }
+    write_cache_entry(meta_path, meta, lambda: binary.tofile(binary_path))
+
 
 class Shader:
     def __init__(self, shader_name):
         self.m_shader_name = shader_name
         self.source = self.parse_shader(BASE_SHADERS_FOLDER)
-        self.m_renderer_id = self.create_shader(self.source.vertex_shader, self.source.fragment_shader)
+        # "binary cache" or "source", and how long getting the linked program took
+        self.loaded_from = None
+        start = time.perf_counter()
+        self.m_renderer_id = self.load_program()
+        self.load_time = time.perf_counter() - start
         self.uniform_locations_cache = {}
+        if settings.DEBUG:
+            print(f"Shader {shader_name} from {self.loaded_from} in {self.load_time * 1000:.1f}ms")
 
     def __del__(self):
-        glDeleteProgram(self.m_renderer_id)
+        STATE.delete_program(self.m_renderer_id)
 
     def bind(self):
-        glUseProgram(self.m_renderer_id)
+        STATE.use_program(self.m_renderer_id)
 
     @staticmethod
     def unbind():
-        glUseProgram(0)
+        STATE.use_program(0)
 
     def set_uniform_1i(self, uniform_name, value):
         loc = self.get_uniform_location(uniform_name)
@@ -52,8 +126,9 @@ class Shader:
         glUniform4f(loc, v0, v1, v2, v3)
 
     def set_uniform_4fv(self, uniform_name, vector):
+        """:param vector: float32 array, set for queued draws every frame"""
         loc = self.get_uniform_location(uniform_name)
-        glUniform4fv(loc, 1, vector)
+        GL_2_0.glUniform4fv(loc, 1, vector)
 
     def set_uniform_matrix_4fv(self, uniform_name, matrix, count=1, transpose=GL_FALSE):
         loc = self.get_uniform_location(uniform_name)
@@ -74,6 +149,47 @@ class Shader:
     def parse_shader(self, filepath):
         return ShaderSource(f"{filepath}/{self.m_shader_name}/")
 
+    def load_program(self):
+        """Link the program from its cached binary, compile it from source when there is none or the
+        driver rejects it, and cache the binary of the new program"""
+        formats = program_binary_formats() if settings.SHADER_BINARY_CACHE else set()
+        if not formats:
+            self.loaded_from = "source"
+            return self.create_shader(self.source.vertex_shader, self.source.fragment_shader)
+
+        source_hash = self.source.source_hash()
+        driver = driver_string()
+        cached = read_program_binary(self.m_shader_name, source_hash, driver)
+        if cached is not None and cached[0] in formats:
+            binary_format, binary = cached
+            program = glCreateProgram()
+            try:
+                glProgramBinary(program, binary_format, binary, len(binary))
+                linked = glGetProgramiv(program, GL_LINK_STATUS) == GL_TRUE
+            except GLError:
+                linked = False
+            if linked:
+                self.loaded_from = "binary cache"
+                return program
+            # Rejected by the driver, e.g. after an update that kept the version string
+            glDeleteProgram(program)
+
+        self.loaded_from = "source"
+        program = self.create_shader(self.source.vertex_shader, self.source.fragment_shader, retrievable=True)
+        length = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+        if glGetProgramiv(program, GL_LINK_STATUS) == GL_TRUE and length:
+            binary = np.empty(length, dtype=np.uint8)
+            written = GLsizei(0)
+            binary_format = GLenum(0)
+            glGetProgramBinary(program, length, written, binary_format, binary)
+            try:
+                write_program_binary(self.m_shader_name, source_hash, driver, binary_format.value,
+                                     binary[:written.value])
+            except OSError as e:
+                if settings.DEBUG:
+                    print(f"Shader cache for {self.m_shader_name} not written: {e}")
+        return program
+
     @staticmethod
     def compile_shader(shader_type, source):
         shader_id = glCreateShader(shader_type)
@@ -89,8 +205,11 @@ class Shader:
             return 0
         return shader_id
 
-    def create_shader(self, vertex_shader, fragment_shader):
+    def create_shader(self, vertex_shader, fragment_shader, retrievable=False):
+        """:param retrievable: keep the linked binary around for glGetProgramBinary"""
         program = glCreateProgram()
+        if retrievable:
+            glProgramParameteri(program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
         # Make shades
         vs = self.compile_shader(GL_VERTEX_SHADER, vertex_shader)
         fs = self.compile_shader(GL_FRAGMENT_SHADER, fragment_shader)
@@ -98,8 +217,23 @@ class Shader:
         glAttachShader(program, vs)
         glAttachShader(program, fs)
         glLinkProgram(program)
-        glValidateProgram(program)
+        if glGetProgramiv(program, GL_LINK_STATUS) == GL_FALSE:
+            print(f"Failed to link shader {self.m_shader_name}: {glGetProgramInfoLog(program)}")
+        if settings.DEBUG:
+            # Validation stalls on the driver and only says something about the state it's done in
+            glValidateProgram(program)
 
         glDeleteShader(vs)
         glDeleteShader(fs)
         return program
+
+
+# Shaders of the current GL context by name
+SHADERS = {}
+
+
+def load_shader(shader_name):
+    """Shader of the current context, every shader name is compiled (or loaded from the cache) once"""
+    if shader_name not in SHADERS:
+        SHADERS[shader_name] = Shader(shader_name)
+    return SHADERS[shader_name]
@@ -3,20 +3,27 @@
 in vec4 v2f_positionW;  // Position in word space
 in vec4 v2f_normalW;  // Surface normal in word space
 in vec2 v2f_texcoord;
-
-uniform vec4 EyePosW;  // Eye position in world space.
-uniform vec4 LightPosW; // Light's position in world space.
-uniform vec4 LightColor; // Light's diffuse and specular contribution.
+flat in float v2f_layer;
+
+// Camera and lighting, shared by all programs through the uniform buffer at binding 0 (camera.py)
+layout(std140, binding = 0) uniform Camera {
+    mat4 ModelViewProjectionMatrix;
+    mat4 ModelMatrix;
+    vec4 EyePosW;  // Eye position in world space.
+    vec4 LightPosW; // Light's position in world space.
+    vec4 LightColor; // Light's diffuse and specular contribution.
+    vec4 Ambient;  // Global ambient contribution.
+};
 
 uniform vec4 MaterialEmissive;
 uniform vec4 MaterialDiffuse;
 uniform vec4 MaterialSpecular;
 uniform float MaterialShininess;
 
-uniform vec4 Ambient;  // Global ambient contribution.
-
 uniform sampler2D u_Textures[8];
 uniform float TextureIndex;
+uniform sampler2DArray u_TextureArray;
+uniform int UseTextureArray;
 
 layout (location=0) out vec4 out_color;
 
@@ -38,7 +45,18 @@ void main() {
     float NdotH = max( dot( N, H ), 0 );
     vec4 Specular = pow( RdotV, MaterialShininess ) * LightColor * MaterialSpecular;
 
-    int index = int(TextureIndex);
-
-    out_color = ( Emissive + Ambient + Diffuse + Specular ) * texture( u_Textures[index], v2f_texcoord );
+    vec4 TextureColor;
+    if (UseTextureArray != 0) {
+        TextureColor = texture( u_TextureArray, vec3(v2f_texcoord, v2f_layer) );
+    } else {
+        int index = int(TextureIndex);
+        // Constant sampler indices, indexing the array with a uniform crashes Mesa's llvmpipe
+        for (int i = 0; i < 8; i++) {
+            if (i == index) {
+                TextureColor = texture( u_Textures[i], v2f_texcoord );
+            }
+        }
+    }
+
+    out_color = ( Emissive + Ambient + Diffuse + Specular ) * TextureColor;
 }
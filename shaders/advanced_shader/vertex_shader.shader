@@ -3,22 +3,33 @@
 layout(location=0) in vec3 in_position;
 layout(location=1) in vec2 in_texcoord;
 layout(location=2) in vec3 in_normal;
+layout(location=3) in vec3 in_offset;  // Per instance tile position, (0, 0, 0) when not instanced
+layout(location=4) in float in_layer;  // Texture array layer of batched static geometry
 
 out vec4 v2f_positionW;  // Position in word space
 out vec4 v2f_normalW;  // Surface normal in word space
 out vec2 v2f_texcoord;
+flat out float v2f_layer;
 
-// Model, View, Projection Matrix
-uniform mat4 ModelViewProjectionMatrix;
-uniform mat4 ModelMatrix;
+// Camera and lighting, shared by all programs through the uniform buffer at binding 0 (camera.py)
+layout(std140, binding = 0) uniform Camera {
+    mat4 ModelViewProjectionMatrix;
+    mat4 ModelMatrix;
+    vec4 EyePosW;  // Eye position in world space.
+    vec4 LightPosW; // Light's position in world space.
+    vec4 LightColor; // Light's diffuse and specular contribution.
+    vec4 Ambient;  // Global ambient contribution.
+};
 
 // Delta Position
 uniform vec4 DeltaPosition;
 
 void main() {
-    gl_Position = ModelViewProjectionMatrix * (vec4(in_position, 1.0) + DeltaPosition);
+    vec4 position = vec4(in_position + in_offset, 1.0);
+    gl_Position = ModelViewProjectionMatrix * (position + DeltaPosition);
 
-    v2f_positionW = ModelMatrix * vec4(in_position, 1.0);
+    v2f_positionW = ModelMatrix * position;
     v2f_normalW = ModelMatrix * vec4(in_normal, 0);
     v2f_texcoord = in_texcoord;
+    v2f_layer = in_layer;
 }
@@ -0,0 +1,275 @@
+import os
+
+import numpy as np
+import settings
+
+from loading_data import load_object, load_prototype, PROTOTYPES
+from models import BatchModels, InstancedModels, MODEL_DYNAMIC
+from collision import CollisionGrid, tile_mask, occupancy_codes, full_cell_mask
+from maps import Map, TILE_PROTOTYPES, build_tiles, collision_boxes
+from mesh_builder import build_wall_mesh
+from level_format import CompiledLevel, is_compiled_level, fresh_compiled_level
+
+NEWLINE = ord("\n")
+CARRIAGE_RETURN = ord("\r")
+# Bytes compared at once while scanning a map file
+SCAN_BLOCK_SIZE = 1 << 24
+
+
+class MapGridFile:
+    """Text map file memory mapped and indexed by row offsets.
+
+    Only the line index is kept in memory, cells are read from the mapping one window at a time.
+    Rows are flipped like in load_map_array, so row y is line rows - 1 - y.
+    """
+    def __init__(self, file):
+        self.file = file
+        self.data = np.memmap(file, dtype=np.uint8, mode='r')
+        newlines = self.scan([NEWLINE])[NEWLINE]
+        size = len(self.data)
+        starts = np.concatenate(([0], newlines + 1))
+        ends = np.append(newlines, size)
+        if starts[-1] == size:
+            # Trailing newline does not start another row
+            starts, ends = starts[:-1], ends[:-1]
+        non_empty = ends > starts
+        crlf = np.zeros(len(ends), dtype=bool)
+        crlf[non_empty] = self.data[ends[non_empty] - 1] == CARRIAGE_RETURN
+        ends[crlf] -= 1
+        self.line_starts = starts
+        self.line_ends = ends
+        self.rows = len(starts)
+        self.cols = int((ends - starts).max()) if self.rows else 0
+
+    def scan(self, values):
+        """Offsets of every byte equal to one of values, block by block to keep temporaries small"""
+        found = {value: [] for value in values}
+        for offset in range(0, len(self.data), SCAN_BLOCK_SIZE):
+            block = np.asarray(self.data[offset:offset + SCAN_BLOCK_SIZE])
+            for value in values:
+                found[value].append(np.flatnonzero(block == value) + offset)
+        return {value: np.concatenate(offsets) if offsets else np.empty(0, dtype=np.int64)
+                for value, offsets in found.items()}
+
+    def find(self, chars):
+        """char -> list of (row, col) cells holding it"""
+        offsets = self.scan([ord(char) for char in chars])
+        cells = {}
+        for char in chars:
+            positions = offsets[ord(char)]
+            lines = np.searchsorted(self.line_starts, positions, side='right') - 1
+            cols = positions - self.line_starts[lines]
+            cells[char] = list(zip((self.rows - 1 - lines).tolist(), cols.tolist()))
+        return cells
+
+    def window(self, first_row, end_row, first_col, end_col):
+        """(rows, cols) uint8 array of map bytes, cells outside the map are 0"""
+        window = np.zeros((end_row - first_row, end_col - first_col), dtype=np.uint8)
+        for row in range(max(first_row, 0), min(end_row, self.rows)):
+            line = self.rows - 1 - row
+            start = self.line_starts[line]
+            a = start + max(first_col, 0)
+            b = min(start + end_col, self.line_ends[line])
+            if b > a:
+                col = a - start - first_col
+                window[row - first_row, col:col + b - a] = self.data[a:b]
+        return window
+
+
+class LevelGrid:
+    """Window reads from the memory mapped grid of a compiled level"""
+    def __init__(self, level):
+        self.level = level
+        self.rows, self.cols = level.rows, level.cols
+
+    def find(self, chars):
+        cells = {"A": self.level.start_cells(), "S": self.level.objective_cells()}
+        return {char: cells[char] for char in chars}
+
+    def window(self, first_row, end_row, first_col, end_col):
+        window = np.zeros((end_row - first_row, end_col - first_col), dtype=np.uint8)
+        r0, r1 = max(first_row, 0), min(end_row, self.rows)
+        c0, c1 = max(first_col, 0), min(end_col, self.cols)
+        if r1 > r0 and c1 > c0:
+            window[r0 - first_row:r1 - first_row, c0 - first_col:c1 - first_col] = self.level.grid[r0:r1, c0:c1]
+        return window
+
+
+class StreamingCollisionGrid(CollisionGrid):
+    """Collision grid reading occupancy from the chunks of a StreamingMap"""
+    def __init__(self, streaming_map, boxes):
+        self.streaming_map = streaming_map
+        self.rows, self.cols = streaming_map.grid.rows, streaming_map.grid.cols
+        self.set_boxes(boxes)
+
+    def window(self, first_row, end_row, first_col, end_col):
+        return self.streaming_map.occupancy_window(first_row, end_row, first_col, end_col)
+
+
+class MapChunk:
+    """Occupancy and, once built, static geometry of one CHUNK_SIZE x CHUNK_SIZE cell chunk"""
+    def __init__(self, key, occupancy, cells):
+        self.key = key
+        self.occupancy = occupancy
+        # Map bytes with a one cell border, kept until the geometry is built
+        self.cells = cells
+        self.batch_models = None
+
+    def build(self):
+        chunk_row, chunk_col = self.key
+        size = settings.CHUNK_SIZE
+        origin = (chunk_row * size, chunk_col * size)
+        inner = self.cells[1:-1, 1:-1]
+        tiles = build_tiles(inner, origin)
+        if settings.STATIC_RENDER_MODE == "instanced":
+            if len(tiles):
+                self.batch_models = InstancedModels(tiles, PROTOTYPES)
+        else:
+            meshes = []
+            if settings.GREEDY_WALLS:
+                wall_prototype = load_prototype(TILE_PROTOTYPES["#"])
+                walls = tile_mask(inner, "#")
+                if walls.any():
+                    mesh = build_wall_mesh(walls, full_cell_mask(self.cells), origin=origin)
+                    meshes.append((mesh, wall_prototype.texture_path))
+                tiles = tiles[tiles['prototype'] != wall_prototype.id]
+            if len(tiles) or meshes:
+                self.batch_models = BatchModels(tiles, PROTOTYPES, meshes, size, static_texture_paths())
+        self.cells = None
+
+    def destroy(self):
+        if self.batch_models:
+            self.batch_models.destroy()
+            self.batch_models = None
+
+
+def static_texture_paths():
+    """Texture of every tile prototype, so all chunks share one texture array"""
+    names = list(dict.fromkeys(TILE_PROTOTYPES.values()))
+    return [load_prototype(name).texture_path for name in names]
+
+
+class StreamingMap:
+    """Map keeping only the chunks around the character in memory.
+
+    The map file is memory mapped, chunks within STREAMING_RADIUS chunks of the character are
+    loaded as it moves and the ones further than STREAMING_RADIUS + 1 are dropped again.
+    """
+    def __init__(self, file):
+        """:param file: text map or compiled level (LEVEL_EXTENSION)"""
+        self.objects = []
+        self.start_pos = [0, 0, 0]
+        self.objective_pos = [0, 0, 0]
+        self.main_controller = None
+        self.main_character = None
+        self.chest = None
+        self.chunks = {}
+        self.chunks_loaded = 0
+        self.chunks_unloaded = 0
+
+        if is_compiled_level(file):
+            self.grid = LevelGrid(CompiledLevel(file))
+        else:
+            self.grid = MapGridFile(file)
+        self.collision_grid = StreamingCollisionGrid(self, collision_boxes())
+
+        cells = self.grid.find("AS")
+        for i, j in cells["A"]:
+            self.start_pos = [j, i, 0]
+            model = load_object('character', MODEL_DYNAMIC)
+            c = model.get_controller()
+            c.move(j, i)
+            self.main_controller = c
+            self.main_character = model
+            if settings.DEBUG:
+                print(self.start_pos)
+
+        for i, j in cells["S"]:
+            self.objective_pos = np.array([j, i, 0.0], dtype=np.float32)
+            model = load_object("chest", MODEL_DYNAMIC)
+            model.collision = False
+            model.transform.x = j
+            model.transform.y = i
+            self.objects.append(model)
+            self.chest = model
+
+        self.update(self.main_controller.get_position(), budget=None)
+
+    def chunk_key(self, x, y):
+        return int(np.floor(y + 0.5)) // settings.CHUNK_SIZE, int(np.floor(x + 0.5)) // settings.CHUNK_SIZE
+
+    def load_chunk(self, key):
+        size = settings.CHUNK_SIZE
+        first_row, first_col = key[0] * size, key[1] * size
+        cells = self.grid.window(first_row - 1, first_row + size + 1, first_col - 1, first_col + size + 1)
+        chunk = MapChunk(key, occupancy_codes(cells[1:-1, 1:-1]), cells)
+        self.chunks[key] = chunk
+        self.chunks_loaded += 1
+        return chunk
+
+    def update(self, position, budget=settings.STREAMING_CHUNKS_PER_TICK):
+        """Load chunks around position and drop far away ones.
+
+        :param budget: most chunk geometries built in one call, None for no limit
+        """
+        chunk_row, chunk_col = self.chunk_key(position.x, position.y)
+        radius = settings.STREAMING_RADIUS
+        for key in list(self.chunks):
+            if max(abs(key[0] - chunk_row), abs(key[1] - chunk_col)) > radius + 1:
+                self.chunks.pop(key).destroy()
+                self.chunks_unloaded += 1
+
+        rows = self.grid.rows // settings.CHUNK_SIZE + 1
+        cols = self.grid.cols // settings.CHUNK_SIZE + 1
+        # Nearest chunks first, so the one the character stands in never waits
+        keys = [(r, c)
+                for r in range(max(chunk_row - radius, 0), min(chunk_row + radius + 1, rows))
+                for c in range(max(chunk_col - radius, 0), min(chunk_col + radius + 1, cols))]
+        keys.sort(key=lambda k: max(abs(k[0] - chunk_row), abs(k[1] - chunk_col)))
+        for key in keys:
+            chunk = self.chunks.get(key) or self.load_chunk(key)
+            if chunk.cells is not None and (budget is None or budget > 0):
+                chunk.build()
+                if budget is not None:
+                    budget -= 1
+
+    def occupancy_window(self, first_row, end_row, first_col, end_col):
+        size = settings.CHUNK_SIZE
+        window = np.zeros((end_row - first_row, end_col - first_col), dtype=np.uint8)
+        for chunk_row in range(first_row // size, (end_row - 1) // size + 1):
+            for chunk_col in range(first_col // size, (end_col - 1) // size + 1):
+                chunk = self.chunks.get((chunk_row, chunk_col)) or self.load_chunk((chunk_row, chunk_col))
+                r0, c0 = chunk_row * size, chunk_col * size
+                r1, c1 = max(first_row, r0), max(first_col, c0)
+                r2, c2 = min(end_row, r0 + size), min(end_col, c0 + size)
+                window[r1 - first_row:r2 - first_row, c1 - first_col:c2 - first_col] = \
+                    chunk.occupancy[r1 - r0:r2 - r0, c1 - c0:c2 - c0]
+        return window
+
+    def check_check_collision(self, dx=0.0, dy=0.0):
+        bb1 = self.main_controller.parent.bounding_box
+        return self.collision_grid.check_collision(bb1, dx, dy)
+
+    def destroy(self):
+        for i in range(len(self.objects)):
+            self.objects[i].destroy()
+        for chunk in self.chunks.values():
+            chunk.destroy()
+        self.chunks = {}
+
+    def render(self, shader, camera=None, alpha=1.0):
+        for chunk in self.chunks.values():
+            if chunk.batch_models:
+                chunk.batch_models.render(shader, camera)
+        self.chest.render(shader, alpha)
+
+
+def open_map(file):
+    """Load the compiled form of a text map when it is up to date.
+
+    Maps from STREAMING_MAP_BYTES up are streamed, smaller maps are loaded whole.
+    """
+    file = fresh_compiled_level(file) or file
+    if os.path.getsize(file) >= settings.STREAMING_MAP_BYTES:
+        return StreamingMap(file)
+    return Map(file)
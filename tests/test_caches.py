@@ -0,0 +1,64 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from mesh_cache import cache_paths as mesh_cache_paths, read_cache, write_cache
+from obj_loader import BASE_OBJECTS_FOLDER, build_mesh
+from shaders import cache_paths as shader_cache_paths, read_program_binary, write_program_binary
+
+SOURCE = os.path.join(BASE_OBJECTS_FOLDER, "block.obj")
+
+
+def rewrite_meta(meta_path, change):
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    change(meta)
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+
+
+def test_mesh_cache_round_trip(tmp_path):
+    mesh = build_mesh(SOURCE)
+    write_cache("block", SOURCE, mesh, str(tmp_path))
+    cached = read_cache("block", SOURCE, str(tmp_path))
+    np.testing.assert_array_equal(cached.vertex_data, mesh.vertex_data)
+    np.testing.assert_array_equal(cached.indices, mesh.indices)
+    np.testing.assert_array_equal(cached.bounds_min, mesh.bounds_min)
+
+
+@pytest.mark.parametrize("key", ["version", "object_name", "bounds_min", "bounds_max"])
+def test_mesh_cache_without_key_is_rebuilt(tmp_path, key):
+    write_cache("block", SOURCE, build_mesh(SOURCE), str(tmp_path))
+    rewrite_meta(mesh_cache_paths("block", str(tmp_path))[0], lambda meta: meta.pop(key))
+    assert read_cache("block", SOURCE, str(tmp_path)) is None
+
+
+def test_mesh_cache_without_metadata_is_rebuilt(tmp_path):
+    write_cache("block", SOURCE, build_mesh(SOURCE), str(tmp_path))
+    os.remove(mesh_cache_paths("block", str(tmp_path))[0])
+    assert read_cache("block", SOURCE, str(tmp_path)) is None
+
+
+def test_program_binary_round_trip(tmp_path):
+    binary = np.arange(64, dtype=np.uint8)
+    write_program_binary("shader", "hash", "driver", 0x1234, binary, str(tmp_path))
+    binary_format, cached = read_program_binary("shader", "hash", "driver", str(tmp_path))
+    assert binary_format == 0x1234
+    np.testing.assert_array_equal(cached, binary)
+    assert read_program_binary("shader", "other hash", "driver", str(tmp_path)) is None
+    assert read_program_binary("shader", "hash", "other driver", str(tmp_path)) is None
+
+
+@pytest.mark.parametrize("key", ["version", "source_hash", "driver", "format", "length"])
+def test_program_binary_without_key_is_recompiled(tmp_path, key):
+    write_program_binary("shader", "hash", "driver", 0x1234, np.arange(64, dtype=np.uint8), str(tmp_path))
+    rewrite_meta(shader_cache_paths("shader", str(tmp_path))[0], lambda meta: meta.pop(key))
+    assert read_program_binary("shader", "hash", "driver", str(tmp_path)) is None
+
+
+def test_truncated_program_binary_is_recompiled(tmp_path):
+    write_program_binary("shader", "hash", "driver", 0x1234, np.arange(64, dtype=np.uint8), str(tmp_path))
+    np.arange(10, dtype=np.uint8).tofile(shader_cache_paths("shader", str(tmp_path))[1])
+    assert read_program_binary("shader", "hash", "driver", str(tmp_path)) is None
@@ -0,0 +1,102 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+import headless
+from collision import CollisionGrid, SimpleBoundingBox, SOLID_TILES
+from maps import collision_boxes, load_map_array
+from models import VertexStore
+
+STAGE_MAPS = sorted(glob.glob(os.path.join("stages", "*", "*.txt")))
+
+# (min_x, min_y, max_x, max_y) of the collision box of each solid tile, as the baseline game computed them
+TILE_BOXES = {
+    "#": (-0.5, -0.5, 0.5, 0.5),
+    "/": (0.0, -0.5, 1.761366, 0.5),
+}
+
+
+def linear_scan(map_array, boxes, bb1, dx, dy):
+    """Map.check_check_collision before the grid: every solid tile tested one by one"""
+    for i, row in enumerate(map_array):
+        for j, char in enumerate(row):
+            if char not in SOLID_TILES:
+                continue
+            local = boxes[SOLID_TILES[char]]
+            bb2 = SimpleBoundingBox(local.min_x + j, local.min_y + i, local.min_z,
+                                    local.max_x + j, local.max_y + i, local.max_z)
+            if bb1.x + dx < bb2.x + bb2.width and bb1.x + dx + bb1.width > bb2.x and \
+                    bb1.y + dy < bb2.y + bb2.height and bb1.y + dy + bb1.height > bb2.y:
+                return True
+    return False
+
+
+def random_map(rng, rows, cols):
+    return rng.choice(np.array(["#", "/", " ", " ", " "]), size=(rows, cols))
+
+
+def random_queries(rng, map_array, count):
+    """Boxes of random size anywhere on and a few cells around the map, so some straddle its edges"""
+    rows, cols = map_array.shape
+    for _ in range(count):
+        x, y = rng.uniform(-3.0, cols + 3.0), rng.uniform(-3.0, rows + 3.0)
+        width, height = rng.uniform(0.05, 2.0, size=2)
+        dx, dy = rng.choice([0.0, 0.5, -0.5]), rng.choice([0.0, 0.5, -0.5])
+        yield SimpleBoundingBox(x, y, 0.0, x + width, y + height, 0.4), dx, dy
+
+
+def edge_queries(map_array):
+    """Character sized boxes centred on every border cell and just outside of it"""
+    rows, cols = map_array.shape
+    cells = [(i, j) for i in range(-1, rows + 1) for j in (-1, 0, cols - 1, cols)]
+    cells += [(i, j) for i in (-1, 0, rows - 1, rows) for j in range(-1, cols + 1)]
+    for i, j in cells:
+        for dx, dy in ((0.0, 0.0), (0.5, 0.0), (-0.5, 0.0), (0.0, 0.5), (0.0, -0.5)):
+            yield SimpleBoundingBox(j - 0.2, i - 0.2, -0.2, j + 0.2, i + 0.2, 0.2), dx, dy
+
+
+def assert_same_as_linear_scan(map_array, queries):
+    boxes = collision_boxes()
+    grid = CollisionGrid(map_array, boxes)
+    for bb, dx, dy in queries:
+        expected = linear_scan(map_array, boxes, bb, dx, dy)
+        assert grid.check_collision(bb, dx, dy) == expected, (bb.min_x, bb.min_y, bb.width, bb.height, dx, dy)
+
+
+@pytest.mark.parametrize("path", STAGE_MAPS)
+def test_stage_matches_linear_scan(path):
+    map_array = load_map_array(path)
+    rng = np.random.default_rng(1)
+    assert_same_as_linear_scan(map_array, random_queries(rng, map_array, 1000))
+    assert_same_as_linear_scan(map_array, edge_queries(map_array))
+
+
+def test_random_map_matches_linear_scan():
+    rng = np.random.default_rng(2)
+    map_array = random_map(rng, 23, 31)
+    assert_same_as_linear_scan(map_array, random_queries(rng, map_array, 3000))
+    assert_same_as_linear_scan(map_array, edge_queries(map_array))
+
+
+def test_empty_map_never_collides():
+    map_array = np.full((5, 5), " ")
+    rng = np.random.default_rng(3)
+    grid = CollisionGrid(map_array, collision_boxes())
+    assert not any(grid.check_collision(bb, dx, dy) for bb, dx, dy in random_queries(rng, map_array, 100))
+
+
+@pytest.mark.parametrize("boxes", [collision_boxes, headless.collision_boxes], ids=["maps", "headless"])
+def test_tile_collision_boxes(boxes):
+    boxes = boxes()
+    for char, expected in TILE_BOXES.items():
+        bb = boxes[SOLID_TILES[char]]
+        assert (bb.min_x, bb.min_y, bb.max_x, bb.max_y) == pytest.approx(expected, abs=1e-6), char
+
+
+def test_vertex_store_box_contains_origin():
+    vertices = np.zeros((2, VertexStore.STRIDE), dtype=np.float32)
+    vertices[:, :3] = (0.75, -0.5, -0.5), (1.75, 0.5, -0.25)
+    bb = VertexStore(vertices).bounding_box()
+    assert (bb.min_x, bb.min_y, bb.min_z, bb.max_x, bb.max_y, bb.max_z) == (0.0, -0.5, -0.5, 1.75, 0.5, 0.0)
@@ -0,0 +1,64 @@
+import glob
+import os
+import random
+
+import numpy as np
+import pytest
+
+from batch_runner import shortest_path_actions
+from collision import CollisionGrid
+from headless import HeadlessGame, ACTIONS, MOVE_ACTIONS
+from maps import collision_boxes, load_map_array
+
+STAGE_MAPS = sorted(glob.glob(os.path.join("stages", "*", "*.txt")))
+
+MIXED_MAP = """\
+##########
+#A   /   #
+# ## / # #
+#    /   #
+#//#   # #
+#  #  /# #
+#    #  S#
+##########
+"""
+
+
+@pytest.mark.parametrize("path", STAGE_MAPS)
+def test_bot_reaches_objective(path):
+    game = HeadlessGame(path)
+    game.run(shortest_path_actions(game), max_steps=10000)
+    assert game.won
+    assert 0 < game.steps < 10000
+
+
+def test_reset_restarts_at_start():
+    game = HeadlessGame(STAGE_MAPS[0])
+    game.run(shortest_path_actions(game))
+    game.reset()
+    assert (game.x, game.y) == tuple(game.start_pos[:2])
+    assert not game.won and game.steps == 0
+
+
+def test_blocked_moves_match_collision_grid(tmp_path):
+    path = tmp_path / "mixed.txt"
+    path.write_text(MIXED_MAP)
+    map_array = load_map_array(str(path))
+    # Boxes of the GL loader, so the headless core agrees with Map
+    grid = CollisionGrid(map_array, collision_boxes())
+    clocks_only = CollisionGrid(np.where(map_array == "/", "/", " "), collision_boxes())
+    game = HeadlessGame(str(path))
+    rng = random.Random(0)
+    blocked = {"#": 0, "/": 0}
+    for _ in range(3000):
+        action = rng.choice(MOVE_ACTIONS)
+        dx, dy = ACTIONS[action]
+        expected = grid.check_collision(game.bounding_box, dx, dy)
+        if expected:
+            blocked["/" if clocks_only.check_collision(game.bounding_box, dx, dy) else "#"] += 1
+        position = game.x, game.y
+        game.step(action)
+        assert ((game.x, game.y) == position) == expected, (action, position)
+        if game.won:
+            game.reset()
+    assert blocked["#"] and blocked["/"]
@@ -0,0 +1,99 @@
+import os
+import random
+
+import numpy as np
+import pytest
+
+from collision import full_cell_mask, tile_mask
+from level_format import (CompiledLevel, LEVEL_EXTENSION, LEVEL_HEADER_DTYPE, LEVEL_VERSION, compile_level,
+                          fresh_compiled_level, load_grid, read_text_grid)
+from maps import load_map_array
+from maze_generator import generate_maze
+from mesh_builder import build_chunked_wall_meshes
+from streaming import LevelGrid
+
+CHUNK_SIZE = 4
+
+
+def maze_lines(seed):
+    """Generated maze with a start, an objective and some '/' tiles"""
+    rows = [list(row) for row in generate_maze(9, 7, seed=seed)]
+    rng = random.Random(seed)
+    open_cells = [(i, j) for i, row in enumerate(rows) for j, char in enumerate(row) if char == " "]
+    for (i, j), char in zip(rng.sample(open_cells, 12), "AS" + "/" * 10):
+        rows[i][j] = char
+    return ["".join(row) for row in rows]
+
+
+@pytest.fixture(params=[("\n", False), ("\n", True), ("\r\n", True)], ids=["lf", "lf_trailing", "crlf_trailing"])
+def text_map(request, tmp_path):
+    newline, trailing_newline = request.param
+    lines = maze_lines(3)
+    (tmp_path / "lf.txt").write_text("\n".join(lines))
+    path = tmp_path / "map.txt"
+    path.write_bytes((newline.join(lines) + (newline if trailing_newline else "")).encode())
+    return str(path), load_map_array(str(tmp_path / "lf.txt"))
+
+
+def test_round_trip(text_map):
+    path, map_array = text_map
+    compiled = compile_level(path, chunk_size=CHUNK_SIZE)
+    assert compiled.endswith(LEVEL_EXTENSION)
+    grid, start, objective = load_grid(compiled)
+    text_grid, text_start, text_objective = load_grid(path)
+    np.testing.assert_array_equal(grid, np.vectorize(ord)(map_array))
+    np.testing.assert_array_equal(grid, text_grid)
+    assert start == text_start == tuple(np.argwhere(map_array == "A")[-1])
+    assert objective == text_objective == tuple(np.argwhere(map_array == "S")[-1])
+
+
+def test_wall_mesh_matches_builder(text_map):
+    path, _ = text_map
+    level = CompiledLevel(compile_level(path, chunk_size=CHUNK_SIZE))
+    grid = read_text_grid(path)
+    meshes = [mesh for _, mesh in build_chunked_wall_meshes(tile_mask(grid, "#"), full_cell_mask(grid), CHUNK_SIZE)]
+    vertex_data = np.concatenate([mesh.vertex_data for mesh in meshes])
+    np.testing.assert_array_equal(level.wall_mesh.vertex_data, vertex_data)
+    np.testing.assert_array_equal(level.wall_mesh.vertex_data[np.asarray(level.wall_mesh.indices)],
+                                  np.concatenate([mesh.vertex_data[mesh.indices] for mesh in meshes]))
+    assert level.wall_mesh_for(CHUNK_SIZE) is level.wall_mesh
+    assert level.wall_mesh_for(CHUNK_SIZE * 2) is None
+
+
+def test_level_grid_window(text_map):
+    path, map_array = text_map
+    grid = LevelGrid(CompiledLevel(compile_level(path, geometry=False)))
+    margin = 3
+    expected = np.pad(np.vectorize(ord)(map_array).astype(np.uint8), margin)
+    rng = random.Random(0)
+    for _ in range(200):
+        r0, c0 = rng.randrange(-margin, grid.rows + margin), rng.randrange(-margin, grid.cols + margin)
+        r1, c1 = rng.randrange(r0 + 1, grid.rows + margin + 1), rng.randrange(c0 + 1, grid.cols + margin + 1)
+        np.testing.assert_array_equal(grid.window(r0, r1, c0, c1),
+                                      expected[r0 + margin:r1 + margin, c0 + margin:c1 + margin])
+    cells = grid.find("AS")
+    assert cells["A"] == [tuple(np.argwhere(map_array == "A")[-1])]
+    assert cells["S"] == [tuple(np.argwhere(map_array == "S")[-1])]
+
+
+def test_fresh_compiled_level(tmp_path):
+    path = tmp_path / "map.txt"
+    path.write_text("\n".join(maze_lines(0)))
+    assert fresh_compiled_level(str(path)) is None
+    compiled = compile_level(str(path), geometry=False)
+    assert fresh_compiled_level(str(path)) == compiled
+    os.utime(compiled, (0, 0))
+    assert fresh_compiled_level(str(path)) is None
+
+
+def test_outdated_level_version_is_not_fresh(tmp_path):
+    path = tmp_path / "map.txt"
+    path.write_text("\n".join(maze_lines(0)))
+    compiled = compile_level(str(path), geometry=False)
+    header = np.fromfile(compiled, dtype=LEVEL_HEADER_DTYPE, count=1)
+    header['version'] = LEVEL_VERSION - 1
+    with open(compiled, 'r+b') as f:
+        f.write(header.tobytes())
+    assert fresh_compiled_level(str(path)) is None
+    with pytest.raises(ValueError):
+        CompiledLevel(compiled)
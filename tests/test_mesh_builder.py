@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+import settings
+from collision import full_cell_mask, tile_mask
+from level_format import CompiledLevel, compile_level
+from maps import build_static_geometry, build_tiles
+from mesh_builder import build_chunked_wall_meshes, build_wall_mesh
+
+# Unit face direction -> (row, col) offset of the neighbour it faces, None for the top
+DIRECTIONS = {
+    (0, 0, 1): None,
+    (1, 0, 0): (0, 1),
+    (-1, 0, 0): (0, -1),
+    (0, 1, 0): (1, 0),
+    (0, -1, 0): (-1, 0),
+}
+
+
+def grid(lines):
+    """Map array like load_map_array, first line is the top row"""
+    return np.array([list(line) for line in lines])[::-1]
+
+
+def exposed_faces(map_array):
+    """Faces of the per-tile wall cubes not covered by a cube in the neighbouring cell"""
+    walls = tile_mask(map_array, "#")
+    covering = np.pad(full_cell_mask(map_array), 1)
+    rows, cols = walls.shape
+    faces = {}
+    for direction, offset in DIRECTIONS.items():
+        if offset is None:
+            faces[direction] = walls.copy()
+        else:
+            dr, dc = offset
+            faces[direction] = walls & ~covering[1 + dr:rows + 1 + dr, 1 + dc:cols + 1 + dc]
+    return faces
+
+
+def cells(low, high):
+    """Cells spanned by a quad along one axis, cell i reaches from i - 0.5 to i + 0.5"""
+    if low == high:
+        return slice(int(round(low)), int(round(low)) + 1)
+    return slice(int(round(low + 0.5)), int(round(high + 0.5)))
+
+
+def covered_faces(meshes, shape):
+    """How often each unit cube face is covered by the quads of the meshes"""
+    counts = {direction: np.zeros(shape, dtype=np.int64) for direction in DIRECTIONS}
+    for mesh in meshes:
+        vertex_data = np.asarray(mesh.vertex_data, dtype=np.float64)
+        indices = np.asarray(mesh.indices)
+        for triangle in indices.reshape(-1, 3):
+            corners = vertex_data[triangle, :3]
+            normal = vertex_data[triangle[0], 5:]
+            # Counter-clockwise seen from outside
+            assert np.dot(np.cross(corners[1] - corners[0], corners[2] - corners[0]), normal) > 0
+        for quad in vertex_data.reshape(-1, 4, 8):
+            direction = tuple(int(v) for v in quad[0, 5:])
+            low, high = quad[:, :3].min(axis=0), quad[:, :3].max(axis=0)
+            if DIRECTIONS[direction] is None:
+                assert low[2] == high[2] == 0.5
+            else:
+                assert (low[2], high[2]) == (-0.5, 0.5)
+                axis = 0 if direction[0] else 1
+                # Side faces lie half a cell from the centre of the cell they belong to
+                low[axis] = high[axis] = low[axis] - 0.5 * sum(direction)
+            counts[direction][cells(low[1], high[1]), cells(low[0], high[0])] += 1
+    return counts
+
+
+def assert_exact_cover(meshes, map_array):
+    expected = exposed_faces(map_array)
+    counts = covered_faces(meshes, map_array.shape)
+    for direction in DIRECTIONS:
+        np.testing.assert_array_equal(counts[direction], expected[direction].astype(np.int64), err_msg=str(direction))
+
+
+def random_map(rng, rows, cols):
+    return rng.choice(np.array(["#", "#", "/", " ", " "]), size=(rows, cols))
+
+
+def triangle_count(meshes):
+    return sum(len(mesh.indices) for mesh in meshes) // 3
+
+
+@pytest.mark.parametrize("neighbour", [" ", "/"])
+def test_single_wall_keeps_faces_next_to_open_cells(neighbour):
+    map_array = grid(["#" + neighbour])
+    mesh = build_wall_mesh(tile_mask(map_array, "#"), full_cell_mask(map_array))
+    assert triangle_count([mesh]) == 10
+    assert_exact_cover([mesh], map_array)
+
+
+def test_walls_hide_each_other():
+    map_array = grid(["##"])
+    mesh = build_wall_mesh(tile_mask(map_array, "#"), full_cell_mask(map_array))
+    # One merged top and one merged quad per side, the faces between the blocks are gone
+    assert triangle_count([mesh]) == 10
+    assert_exact_cover([mesh], map_array)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_map(seed):
+    map_array = random_map(np.random.default_rng(seed), 19, 23)
+    walls, solid = tile_mask(map_array, "#"), full_cell_mask(map_array)
+    assert_exact_cover([build_wall_mesh(walls, solid)], map_array)
+    chunks = build_chunked_wall_meshes(walls, solid, chunk_size=4)
+    assert len(chunks) > 1
+    assert_exact_cover([mesh for _, mesh in chunks], map_array)
+
+
+def test_static_geometry_next_to_wall_clock(monkeypatch):
+    monkeypatch.setattr(settings, "GREEDY_WALLS", True)
+    map_array = grid(["#####",
+                      "#/  #",
+                      "#/# #",
+                      "#####"])
+    _, meshes = build_static_geometry(map_array, build_tiles(map_array))
+    assert_exact_cover([mesh for mesh, _ in meshes], map_array)
+
+
+def test_compiled_walls_next_to_wall_clock(tmp_path):
+    source = tmp_path / "map.txt"
+    source.write_text("#####\n#/  #\n#/#/#\n#####\n")
+    level = CompiledLevel(compile_level(str(source), chunk_size=2))
+    assert_exact_cover([level.wall_mesh], level.grid)
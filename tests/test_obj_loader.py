@@ -0,0 +1,72 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from obj_loader import BASE_OBJECTS_FOLDER, load_obj_file, interleave_faces
+
+OBJ_FILES = sorted(glob.glob(os.path.join(BASE_OBJECTS_FOLDER, "*.obj")))
+
+
+def load_obj_file_per_line(filename):
+    """load_obj_file before the bulk parser: one np.array per attribute line"""
+    objects = {}
+    current_obj = ''
+    with open(filename, 'r') as f:
+        for line in f:
+            if line.startswith('o '):
+                current_obj = line[2:].strip()
+                objects[current_obj] = {'vertices': [], 'tex_coords': [], 'normals': [], 'faces': []}
+            elif line.startswith('v '):
+                x, y, z, *w = line[2:].split()
+                objects[current_obj]['vertices'].append(np.array([float(x), float(y), float(z)], dtype=np.float32))
+            elif line.startswith('vt '):
+                u, v = line[3:].split()
+                objects[current_obj]['tex_coords'].append(np.array([float(u), float(v)], dtype=np.float32))
+            elif line.startswith('vn '):
+                x, y, z = line[3:].split()
+                objects[current_obj]['normals'].append(np.array([float(x), float(y), float(z)], dtype=np.float32))
+            elif line.startswith('f '):
+                face = []
+                for v in line[2:].split():
+                    vi, vt, vn = v.split('/')
+                    face.append([int(vi) - 1, int(vt) - 1, int(vn) - 1])
+                objects[current_obj]['faces'].append(np.array(face, dtype=np.uint32))
+    return len(objects), objects
+
+
+def test_all_assets_found():
+    assert len(OBJ_FILES) == 7
+
+
+@pytest.mark.parametrize("path", OBJ_FILES, ids=os.path.basename)
+def test_matches_per_line_parser(path):
+    count, objects = load_obj_file(path)
+    expected_count, expected = load_obj_file_per_line(path)
+    assert count == expected_count
+    assert list(objects) == list(expected)
+    for name, obj in objects.items():
+        for key in ('vertices', 'tex_coords', 'normals'):
+            reference = np.array(expected[name][key], dtype=np.float32).reshape(-1, obj[key].shape[1])
+            assert obj[key].dtype == np.float32
+            np.testing.assert_array_equal(obj[key], reference)
+        assert len(obj['faces']) == len(expected[name]['faces'])
+        for face, reference in zip(obj['faces'], expected[name]['faces']):
+            assert face.dtype == np.uint32
+            np.testing.assert_array_equal(face, reference)
+
+
+@pytest.mark.parametrize("path", OBJ_FILES, ids=os.path.basename)
+def test_interleaved_vertices_match_face_corners(path):
+    """One vertex per face corner in face order, as ModelData3D built them from the parsed lists"""
+    _, objects = load_obj_file_per_line(path)
+    obj = objects[list(objects)[0]]
+    expected = [np.concatenate([obj['vertices'][vi], obj['tex_coords'][vt], obj['normals'][vn]])
+                for face in obj['faces'] for vi, vt, vn in face]
+
+    _, objects = load_obj_file(path)
+    obj = objects[list(objects)[0]]
+    vertex_data, indices = interleave_faces(obj['vertices'], obj['tex_coords'], obj['normals'], obj['faces'])
+    np.testing.assert_array_equal(vertex_data, np.array(expected, dtype=np.float32))
+    np.testing.assert_array_equal(indices, np.arange(len(expected)))
@@ -0,0 +1,130 @@
+import ctypes
+import gc
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import renderer
+from benchmark import FRAME_GARBAGE_BUDGET
+from renderer import GLState, RenderQueue, LAYER_HUD
+
+FRAMES = 200
+WARMUP = 5
+
+
+def no_gl(*args):
+    pass
+
+
+@pytest.fixture
+def state(monkeypatch):
+    """Fresh state cache whose GL calls go nowhere, the queue and cache code still run as in the game"""
+    for name in ("glUseProgram", "glBindVertexArray", "glBindBuffer", "glActiveTexture", "glBindTexture",
+                 "glEnable", "glDisable"):
+        monkeypatch.setattr(renderer, name, no_gl)
+    monkeypatch.setattr(renderer, "GL_1_1", SimpleNamespace(glDrawElements=no_gl))
+    monkeypatch.setattr(renderer, "GL_3_1", SimpleNamespace(glDrawElementsInstanced=no_gl))
+    state = GLState()
+    monkeypatch.setattr(renderer, "STATE", state)
+    return state
+
+
+class StubShader:
+    def __init__(self, renderer_id):
+        self.m_renderer_id = renderer_id
+        self.uniform_sets = 0
+
+    def bind(self):
+        renderer.STATE.use_program(self.m_renderer_id)
+
+    def set_uniform_1i(self, name, value):
+        self.uniform_sets += 1
+
+    def set_uniform_4fv(self, name, value):
+        self.uniform_sets += 1
+
+
+class StubVertexArray:
+    def __init__(self, renderer_id):
+        self.m_renderer_id = renderer_id
+
+    def bind(self):
+        renderer.STATE.bind_vertex_array(self.m_renderer_id)
+
+
+class StubIndexBuffer:
+    index_type = renderer.GL_UNSIGNED_SHORT
+
+    def __init__(self, renderer_id, count):
+        self.m_renderer_id = renderer_id
+        self.count = count
+
+    def bind(self):
+        renderer.STATE.bind_buffer(renderer.GL_ELEMENT_ARRAY_BUFFER, self.m_renderer_id)
+
+    def get_count(self):
+        return self.count
+
+
+class Scene:
+    """Draws shaped like a game frame: world models of a few programs and textures, instanced tiles and text"""
+    def __init__(self):
+        self.shaders = [StubShader(1), StubShader(2)]
+        self.vertex_arrays = [StubVertexArray(i) for i in range(1, 6)]
+        self.index_buffers = [StubIndexBuffer(i, 36 * i) for i in range(1, 6)]
+        self.delta_positions = [np.zeros(4, dtype=np.float32) for _ in range(5)]
+        self.uniforms = [(("set_uniform_4fv", "DeltaPosition", delta), ("set_uniform_1i", "UseTextureArray", 0))
+                         for delta in self.delta_positions]
+        self.textures = [((0, renderer.GL_TEXTURE_2D, texture),) for texture in (7, 8, 9)]
+        self.character_draws = [(((1, renderer.GL_TEXTURE_2D, 20 + i),), ctypes.c_void_p(i * 12)) for i in range(8)]
+
+    def submit(self, queue, frame):
+        for i, (va, ib) in enumerate(zip(self.vertex_arrays, self.index_buffers)):
+            self.delta_positions[i][0] = frame
+            queue.submit(self.shaders[i % 2], va, ib, self.textures[i % 3], self.uniforms[i])
+        queue.submit(self.shaders[0], self.vertex_arrays[0], self.index_buffers[0], self.textures[0],
+                     self.uniforms[0], instance_count=64)
+        for textures, offset in self.character_draws:
+            queue.submit(self.shaders[1], self.vertex_arrays[4], self.index_buffers[4], textures, depth_test=False,
+                         layer=LAYER_HUD, count=6, offset=offset)
+
+
+def test_steady_state_frames_allocate_nothing(state):
+    queue = RenderQueue()
+    scene = Scene()
+    for frame in range(WARMUP):
+        scene.submit(queue, frame)
+        queue.flush()
+    pool_size = len(queue.pool)
+
+    garbage = np.zeros(FRAMES, dtype=np.int64)
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    try:
+        for frame in range(FRAMES):
+            start = tracemalloc.get_traced_memory()[0]
+            scene.submit(queue, frame)
+            queue.flush()
+            garbage[frame] = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+        gc.enable()
+
+    assert len(queue.pool) == pool_size
+    assert not queue.items
+    assert garbage.mean() <= FRAME_GARBAGE_BUDGET
+
+
+def test_flush_skips_repeated_state(state):
+    queue = RenderQueue()
+    scene = Scene()
+    scene.submit(queue, 0)
+    queue.flush()
+    switches = renderer.STATS.program_switches
+    scene.submit(queue, 1)
+    queue.flush()
+    # Items sorted by program, one switch per program and the HUD program stays bound from the world pass
+    assert renderer.STATS.program_switches - switches <= len(scene.shaders)
@@ -0,0 +1,106 @@
+import random
+
+import numpy as np
+import pytest
+
+import settings
+from collision import CollisionGrid, SimpleBoundingBox
+from maps import collision_boxes, load_map_array
+from maze_generator import generate_maze
+from streaming import MapGridFile, StreamingCollisionGrid, StreamingMap
+
+CHUNK_SIZE = 4
+
+
+def maze_lines(seed, wall_clocks=20):
+    """Generated maze with some open cells turned into '/' tiles"""
+    rows = [list(row) for row in generate_maze(9, 7, seed=seed)]
+    rng = random.Random(seed)
+    open_cells = [(i, j) for i, row in enumerate(rows) for j, char in enumerate(row) if char == " "]
+    for i, j in rng.sample(open_cells, wall_clocks):
+        rows[i][j] = "/"
+    return ["".join(row) for row in rows]
+
+
+def write_map(path, lines, newline="\n", trailing_newline=False):
+    path.write_bytes((newline.join(lines) + (newline if trailing_newline else "")).encode())
+    return str(path)
+
+
+def padded_bytes(map_array, margin):
+    """Map characters as bytes with margin cells of 0 around them"""
+    cells = np.vectorize(ord)(map_array).astype(np.uint8)
+    return np.pad(cells, margin)
+
+
+def windows(rows, cols, margin, count=200, seed=0):
+    """Random (first_row, end_row, first_col, end_col), some reaching past the map"""
+    rng = random.Random(seed)
+    yield -margin, rows + margin, -margin, cols + margin
+    for _ in range(count):
+        r0, c0 = rng.randrange(-margin, rows + margin), rng.randrange(-margin, cols + margin)
+        yield r0, rng.randrange(r0 + 1, rows + margin + 1), c0, rng.randrange(c0 + 1, cols + margin + 1)
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"], ids=["lf", "crlf"])
+@pytest.mark.parametrize("trailing_newline", [False, True], ids=["no_trailing", "trailing"])
+def test_map_grid_file_window(tmp_path, newline, trailing_newline):
+    lines = maze_lines(1)
+    expected_array = load_map_array(write_map(tmp_path / "lf.txt", lines))
+    grid = MapGridFile(write_map(tmp_path / "map.txt", lines, newline, trailing_newline))
+    assert (grid.rows, grid.cols) == expected_array.shape
+    margin = 3
+    expected = padded_bytes(expected_array, margin)
+    for r0, r1, c0, c1 in windows(grid.rows, grid.cols, margin):
+        np.testing.assert_array_equal(grid.window(r0, r1, c0, c1),
+                                      expected[r0 + margin:r1 + margin, c0 + margin:c1 + margin])
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"], ids=["lf", "crlf"])
+def test_map_grid_file_find(tmp_path, newline):
+    lines = maze_lines(2)
+    lines[1] = "#A" + lines[1][2:]
+    lines[-2] = lines[-2][:-2] + "S#"
+    map_array = load_map_array(write_map(tmp_path / "lf.txt", lines))
+    grid = MapGridFile(write_map(tmp_path / "map.txt", lines, newline, True))
+    cells = grid.find("AS")
+    for char in "AS":
+        assert cells[char] == [tuple(cell) for cell in np.argwhere(map_array == char).tolist()]
+
+
+def streaming_map(path):
+    """StreamingMap reduced to its grid and chunk occupancy, loading no models or GL geometry"""
+    streaming = StreamingMap.__new__(StreamingMap)
+    streaming.grid = MapGridFile(path)
+    streaming.chunks = {}
+    streaming.chunks_loaded = 0
+    return streaming
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_streaming_collision_matches_collision_grid(tmp_path, monkeypatch, seed):
+    monkeypatch.setattr(settings, "CHUNK_SIZE", CHUNK_SIZE)
+    path = write_map(tmp_path / "maze.txt", maze_lines(seed))
+    map_array = load_map_array(path)
+    boxes = collision_boxes()
+    grid = CollisionGrid(map_array, boxes)
+    streaming = streaming_map(path)
+    streaming_grid = StreamingCollisionGrid(streaming, boxes)
+
+    rng = np.random.default_rng(seed)
+    rows, cols = map_array.shape
+    hits = 0
+    for query in range(2000):
+        x, y = rng.uniform(-2.0, cols + 2.0), rng.uniform(-2.0, rows + 2.0)
+        width, height = rng.uniform(0.1, 1.5, size=2)
+        bb = SimpleBoundingBox(x, y, 0.0, x + width, y + height, 0.4)
+        dx, dy = rng.choice([0.0, 0.5, -0.5]), rng.choice([0.0, 0.5, -0.5])
+        expected = grid.check_collision(bb, dx, dy)
+        assert streaming_grid.check_collision(bb, dx, dy) == expected, (x, y, width, height, dx, dy)
+        hits += expected
+        if query % 100 == 99:
+            # Chunks dropped while the character walks away are loaded again on demand
+            for key in rng.permutation(list(streaming.chunks))[:len(streaming.chunks) // 2]:
+                streaming.chunks.pop(tuple(key))
+    assert 0 < hits < 2000
+    assert streaming.chunks_loaded > len(streaming.chunks)
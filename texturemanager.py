@@ -3,6 +3,8 @@ import cv2 as cv
 import numpy as np
 import os
 
+from renderer import STATE, count_texture_upload
+
 
 DEFAULT_TEXTURE_SLOT = 0
 
@@ -17,9 +19,10 @@ def load_texture(filepath):
         width, height = 256, 256
         img = cv.resize(img, (width, height))
         texture = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, texture)
+        STATE.bind_texture(GL_TEXTURE_2D, texture)
         glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, width, height,
                      0, GL_RGBA, GL_UNSIGNED_BYTE, img.tostring())
+        count_texture_upload(img.nbytes)
 
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
@@ -33,6 +36,32 @@ def load_texture(filepath):
         return DEFAULT_TEXTURE_SLOT
 
 
+def load_texture_array(filepaths, width=256, height=256):
+    """Load images into the layers of one GL_TEXTURE_2D_ARRAY, layer index = position in filepaths"""
+    key = tuple(filepaths)
+    if key in LOADED_TEXTURES:
+        return LOADED_TEXTURES[key]
+    layers = np.full((len(filepaths), height, width, 4), 255, dtype=np.uint8)
+    for layer, filepath in enumerate(filepaths):
+        img = load_image_rgba(filepath, flip=True)
+        if img is not None:
+            layers[layer] = cv.resize(img, (width, height))
+    texture = glGenTextures(1)
+    STATE.bind_texture(GL_TEXTURE_2D_ARRAY, texture)
+    glTexImage3D(GL_TEXTURE_2D_ARRAY, 0, GL_RGBA8, width, height, len(filepaths),
+                 0, GL_RGBA, GL_UNSIGNED_BYTE, layers.tostring())
+    count_texture_upload(layers.nbytes)
+
+    # Merged wall quads repeat the texture once per cell
+    glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_S, GL_REPEAT)
+    glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_T, GL_REPEAT)
+    glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+    glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+    del layers
+    LOADED_TEXTURES[key] = texture
+    return texture
+
+
 class TextureManager:
     def __init__(self):
         self.textures = {}
@@ -48,19 +77,17 @@ class TextureManager:
         m_local_buffer = img.tostring()
         m_width, m_height, m_BPP = img.shape[0], img.shape[1], 0
 
-        glActiveTexture(GL_TEXTURE0 + self.n)
-        glBindTexture(GL_TEXTURE_2D, m_render_id)
+        STATE.bind_texture(GL_TEXTURE_2D, m_render_id, self.n)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
 
         glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, m_width, m_height, 0, GL_RGBA, GL_UNSIGNED_BYTE, m_local_buffer)
-        glBindTexture(GL_TEXTURE_2D, 0)
+        STATE.bind_texture(GL_TEXTURE_2D, 0)
         del img
 
-        glActiveTexture(GL_TEXTURE0 + self.n)
-        glBindTexture(GL_TEXTURE_2D, m_render_id)
+        STATE.bind_texture(GL_TEXTURE_2D, m_render_id, self.n)
 
         self.textures[filepath] = self.n
         self.n += 1
@@ -68,12 +95,12 @@ class TextureManager:
 
     def update_texture(self, texture_id, width, height, img):
 
-        glBindTexture(GL_TEXTURE_2D, texture_id+1)
+        STATE.bind_texture(GL_TEXTURE_2D, texture_id+1)
         # glClearTexImage(texture_id, 0, GL_RGBA, GL_UNSIGNED_BYTE, img)
         glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, width, height,
                      0, GL_RGBA, GL_UNSIGNED_BYTE, img)
-        glBindTexture(GL_TEXTURE_2D, 0)
-        glActiveTexture(GL_TEXTURE0 + texture_id)
+        STATE.bind_texture(GL_TEXTURE_2D, 0)
+        STATE.active_texture(texture_id)
 
 
 class Texture:
@@ -81,7 +108,7 @@ class Texture:
         self.m_render_id = glGenTextures(1)
         self.m_local_buffer = img.tostring()
         self.m_width, self.m_height, self.m_BPP = img.shape[0], img.shape[1], 0
-        glBindTexture(GL_TEXTURE_2D, self.m_render_id)
+        STATE.bind_texture(GL_TEXTURE_2D, self.m_render_id)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
@@ -89,10 +116,10 @@ class Texture:
 
         glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, self.m_width, self.m_height,
                      0, GL_RGBA, GL_UNSIGNED_BYTE, self.m_local_buffer)
-        glBindTexture(GL_TEXTURE_2D, 0)
+        STATE.bind_texture(GL_TEXTURE_2D, 0)
 
     def __del__(self):
-        glDeleteTextures(1, self.m_render_id)
+        STATE.delete_texture(self.m_render_id)
 
     def update(self, new_width=None, new_height=None, img=None):
         if img:
@@ -100,19 +127,18 @@ class Texture:
             self.m_width = new_width or img.shape[0] or self.m_width
             self.m_height = new_height or img.shape[1] or self.m_height
 
-            glBindTexture(GL_TEXTURE_2D, self.m_render_id)
+            STATE.bind_texture(GL_TEXTURE_2D, self.m_render_id)
             glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, self.m_width, self.m_height,
                          0, GL_RGBA, GL_UNSIGNED_BYTE, None)
-            glBindTexture(GL_TEXTURE_2D, 0)
+            STATE.bind_texture(GL_TEXTURE_2D, 0)
         else:
             print("None textue")
 
     def bind(self, slot=0):
-        glActiveTexture(GL_TEXTURE0 + slot)
-        glBindTexture(GL_TEXTURE_2D, self.m_render_id)
+        STATE.bind_texture(GL_TEXTURE_2D, self.m_render_id, slot)
 
     def unbind(self):
-        glBindTexture(GL_TEXTURE_2D, 0)
+        STATE.bind_texture(GL_TEXTURE_2D, 0)
 
     def get_width(self):
         return self.m_width